@@ -5,7 +5,28 @@ import plotly.graph_objects as go
 import re
 import datetime
 import io
+import os
+import json
+import hashlib
+import uuid
+import time
+import html
 import numpy as np
+from collections import defaultdict
+from functools import reduce
+
+# [V81] 共用核心 (不依賴 Streamlit，批次報表 geckos_report.py 亦使用)
+from geckos_core import (
+    DEFAULT_WEEKMASK, MILESTONE_STAGES, ROADMAP_GRANULARITIES, STAGE_CONFIG, FigureCache, alert_cards, alerts_html, business_days_from, countdown_figure,
+    diff_tables, get_week_str, html_report, lane_labels, milestone_calendar, milestone_columns,
+    order_countdown_table, order_revenue_table, parse_milestone_series, parse_quarter_date_end, pm_cards,
+    read_project_table, resolve_schema, roadmap_figure, roadmap_order,
+)
+
+try:
+    import duckdb  # [V68] 選用：大型總表改用 DuckDB 查詢引擎
+except ImportError:
+    duckdb = None
 
 # 設定網頁標題與佈局 (Wide Mode)
 st.set_page_config(page_title="Geckos Dashboard Pro", layout="wide")
@@ -55,24 +76,650 @@ st.sidebar.header("資料上傳區")
 uploaded_file = st.sidebar.file_uploader("請上傳專案總表 (Excel/CSV)", type=["xlsx", "csv"])
 
 # --- 輔助函式 ---
-def parse_quarter_date_end(date_str):
-    """將 '2026Q2' 轉為該季的【最後一天】 (例如 2026-06-30)"""
-    if pd.isna(date_str): return None
-    date_str = str(date_str).strip().upper()
-    match = re.search(r'(\d{4}).*Q(\d)', date_str)
-    if match:
-        year = int(match.group(1))
-        quarter = int(match.group(2))
-        quarter_ends = {1: (3, 31), 2: (6, 30), 3: (9, 30), 4: (12, 31)}
-        if quarter in quarter_ends:
-            month, day = quarter_ends[quarter]
-            return pd.Timestamp(year=year, month=month, day=day)
-    return None
-
-def get_week_str(dt):
-    if pd.isnull(dt): return None
-    iso_cal = dt.isocalendar()
-    return f"{iso_cal.year}-W{iso_cal.week:02d}"
+def bump_data_version():
+    """[V66] 資料內容異動 (編輯/刪除/新增) 後更新版本號，讓依版本快取的結果失效"""
+    base = st.session_state.get('data_hash', '')
+    st.session_state['data_version'] = f"{base}#{uuid.uuid4().hex[:8]}"
+
+def make_filter_signature(**filters):
+    """[V66] 將側邊欄篩選條件轉成可雜湊的簽章，供快取鍵使用"""
+    return tuple((name, tuple(sorted(str(v) for v in values))) for name, values in sorted(filters.items()))
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def build_order_revenue_table(_df, data_version, order_col, col_twd, col_rmb):
+    """[V66] 每列的預計訂單日期與 TWD/RMB 營收 (每個資料版本只解析一次)"""
+    return order_revenue_table(_df, order_col, col_twd, col_rmb)
+
+# [V78] 季度匯率表 (本機 CSV，欄位 quarter, rate)：每季起日起生效，以 merge_asof 對應訂單日期
+RATE_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rmb_rate_table.csv')
+
+def load_rate_table():
+    """[V78] 讀取季度匯率表 (僅保留格式正確的 'YYYYQn' 列，依季度排序)"""
+    if not os.path.exists(RATE_TABLE_PATH):
+        return pd.DataFrame({'quarter': pd.Series(dtype=str), 'rate': pd.Series(dtype=float)})
+    table = pd.read_csv(RATE_TABLE_PATH, dtype={'quarter': str})
+    return clean_rate_table(table)
+
+def clean_rate_table(table):
+    """[V78] 正規化匯率表：季度大寫去空白、去除無效列與重複季度"""
+    table = table[['quarter', 'rate']].copy()
+    table['quarter'] = table['quarter'].astype(str).str.strip().str.upper()
+    table['rate'] = pd.to_numeric(table['rate'], errors='coerce')
+    table = table[table['quarter'].str.fullmatch(r'\d{4}Q[1-4]') & table['rate'].notna()]
+    return table.drop_duplicates('quarter', keep='last').sort_values('quarter').reset_index(drop=True)
+
+def save_rate_table(table):
+    clean_rate_table(table).to_csv(RATE_TABLE_PATH, index=False)
+
+def rates_for_dates(dates, rate_table, fallback_rate):
+    """[V78] merge_asof：每個日期取「季度起日 <= 日期」的最新匯率；無日期或早於表首者使用 fallback_rate"""
+    dates = pd.Series(pd.to_datetime(pd.Series(dates).to_numpy()))
+    out = np.full(len(dates), float(fallback_rate))
+    if rate_table.empty:
+        return out
+    table = rate_table.assign(start=pd.PeriodIndex(rate_table['quarter'], freq='Q').start_time).sort_values('start')
+    left = pd.DataFrame({'date': dates, 'pos': np.arange(len(dates))}).dropna(subset=['date']).sort_values('date')
+    merged = pd.merge_asof(left, table[['start', 'rate']], left_on='date', right_on='start', direction='backward')
+    out[merged['pos'].to_numpy()] = merged['rate'].fillna(fallback_rate).to_numpy()
+    return out
+
+def rate_sweep(project_twd, project_rmb, rates):
+    """[V78] 匯率敏感度 (一次算完整個匯率向量)：營收矩陣 = TWD + RMB ⊗ rates (專案 × 匯率)。
+    回傳各匯率的總營收與排名矩陣 (1 = 營收貢獻王)。"""
+    revenue = project_twd.to_numpy()[:, None] + project_rmb.to_numpy()[:, None] * np.asarray(rates)[None, :]
+    ranks = (-revenue).argsort(axis=0, kind='stable').argsort(axis=0, kind='stable') + 1
+    return revenue.sum(axis=0), pd.DataFrame(ranks, index=project_twd.index, columns=rates)
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def aggregate_revenue_by_period(_order_table, data_version, filter_signature, freq):
+    """[V66] 依 PeriodIndex (季/月) 加總 TWD 與 RMB，匯率於繪圖時才套用"""
+    rows = _order_table.dropna(subset=['OrderDate'])
+    if rows.empty:
+        return pd.DataFrame(columns=['TWD', 'RMB'])
+    periods = pd.PeriodIndex(rows['OrderDate'], freq=freq)
+    agg = rows[['TWD', 'RMB']].groupby(periods).sum().sort_index()
+    full_range = pd.period_range(agg.index.min(), agg.index.max(), freq=freq)
+    return agg.reindex(full_range, fill_value=0)
+
+def filter_rows(df, filters, dim_cols, customer_bridge):
+    """依多選篩選條件過濾 (pandas 引擎)；filters 以維度名稱為鍵，dim_cols 為 (維度, 欄位) 對照"""
+    mask = np.ones(len(df), dtype=bool)
+    for name, col in dim_cols:
+        values = filters.get(name)
+        if values and col and col in df.columns:
+            mask &= df[col].isin(values).to_numpy()
+    if filters.get('customer'):
+        customer_row_ids = customer_bridge.loc[customer_bridge['客戶'].isin(filters['customer']), 'row_id'].unique()
+        mask &= df.index.isin(customer_row_ids)
+    return df[mask]
+
+# [V72] Saved views：篩選條件 + 匯率存於本機 JSON，可用 ?view=名稱 開啟
+SAVED_VIEWS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'saved_views.json')
+VIEW_FILTER_KEYS = {'pm': 'flt_pm', 'project': 'flt_project', 'open_type': 'flt_open_type', 'cat': 'flt_cat',
+                    'scene': 'flt_scene', 'market': 'flt_market', 'order_start': 'flt_order_start', 'customer': 'flt_customer'}
+
+def load_saved_views():
+    try:
+        with open(SAVED_VIEWS_PATH, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_saved_views(views):
+    with open(SAVED_VIEWS_PATH, 'w', encoding='utf-8') as f:
+        json.dump(views, f, ensure_ascii=False, indent=2)
+
+def view_signature(view):
+    """saved view 對應的篩選簽章 (不含全文搜尋與里程碑區間)"""
+    return make_filter_signature(**view['filters'], milestone_range=[], search=[])
+
+def restore_view_selection(filter_name, options):
+    """載入 saved view 時，將該維度的選取寫回 widget 狀態 (只保留目前資料中仍存在的選項)"""
+    pending = st.session_state.get('pending_view_filters')
+    if pending is not None:
+        wanted = set(pending.get(filter_name, []))
+        st.session_state[VIEW_FILTER_KEYS[filter_name]] = [o for o in options if str(o) in wanted]
+
+@st.cache_data(show_spinner=False, max_entries=128)
+def compute_view_result(_df, _customer_bridge, data_version, filter_signature, rmb_rate, view_filters, col_info):
+    """[V72] saved view 的篩選結果 (列位置) 與 KPI / 市場 / Top 10 聚合，依 (資料版本, 簽章, 匯率) 快取"""
+    dim_cols, col_twd, col_rmb = col_info
+    resolved = {}
+    for name, col in dim_cols:
+        if view_filters.get(name) and col and col in _df.columns:
+            values = _df[col].astype(str) if name == 'order_start' else _df[col]
+            lookup = {str(v): v for v in values.dropna().unique()}
+            resolved[name] = [lookup[v] for v in view_filters[name] if v in lookup]
+    resolved['customer'] = view_filters.get('customer', [])
+    df_view = filter_rows(_df, resolved, dim_cols, _customer_bridge)
+
+    revenue = df_view[col_twd].fillna(0) + (df_view[col_rmb].fillna(0) * rmb_rate if col_rmb else 0)
+    result = revenue_rollups(df_view, revenue, dict(dim_cols).get('cat'))
+    result['positions'] = _df.index.get_indexer(df_view.index)
+    return result
+
+def revenue_rollups(df_view, revenue, cat_col=None):
+    """[V87] 營收預聚合：KPI、營收貢獻王、Top 10、產品類別、市場 x 應用場景 (圖表只需畫這幾列，與總表大小無關)"""
+    df_rev = pd.DataFrame({'專案': df_view['專案'], 'Calculated_Total_TWD': revenue})
+    by_project = df_rev.groupby('專案')['Calculated_Total_TWD'].sum()
+    result = {
+        'total_revenue': float(revenue.sum()),
+        'n_projects': int(df_view['專案'].nunique()),
+        'top_project': by_project.idxmax() if not by_project.empty else None,
+        'top_rev': float(by_project.max()) if not by_project.empty else 0.0,
+        'top10': by_project.reset_index().nlargest(10, 'Calculated_Total_TWD').sort_values('Calculated_Total_TWD', ascending=True),
+        'category': None,
+        'market': None,
+    }
+    if cat_col and cat_col in df_view.columns:
+        # sort=False：維持類別首次出現順序 (與逐列餵給 px.pie 時的配色一致)
+        result['category'] = revenue.groupby(df_view[cat_col], sort=False).sum().rename('Calculated_Total_TWD').reset_index()
+    if '市場' in df_view.columns and '產業應用場景' in df_view.columns:
+        df_rev[['市場', '產業應用場景']] = df_view[['市場', '產業應用場景']]
+        result['market'] = df_rev.groupby(['市場', '產業應用場景'])['Calculated_Total_TWD'].sum().reset_index()
+    return result
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def build_revenue_rollups(_df, data_version, filter_signature, rmb_rate, cat_col):
+    """[V87] pandas 引擎的營收預聚合 (_df 已含 Calculated_Total_TWD)，依 (資料版本, 篩選, 匯率) 快取"""
+    return revenue_rollups(_df, _df['Calculated_Total_TWD'], cat_col)
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def build_facet_codes(_df, _customer_bridge, data_version, dim_cols):
+    """[V71] 各篩選維度 factorize 後的代碼 (缺值為 -1)、專案代碼，以及客戶 bridge 對應的列位置"""
+    codes = {}
+    for name, col in dim_cols:
+        if col and col in _df.columns:
+            values = _df[col].astype(str) if name == 'order_start' else _df[col]
+            col_codes, labels = pd.factorize(values)
+            codes[name] = (col_codes, pd.Index(labels))
+    proj_codes = pd.factorize(_df['專案'])[0] if '專案' in _df.columns else np.zeros(len(_df), dtype=np.intp)
+    bridge_pos = _df.index.get_indexer(_customer_bridge['row_id'])
+    return codes, proj_codes, bridge_pos
+
+def facet_table(codes, labels, proj_codes, revenue):
+    """[V71] 以 bincount 一次算出每個選項的專案數 (distinct 專案) 與營收"""
+    n_labels = len(labels)
+    valid = codes >= 0
+    codes, proj_codes, revenue = codes[valid].astype(np.int64), proj_codes[valid], revenue[valid]
+    rev = np.bincount(codes, weights=revenue, minlength=n_labels)
+    has_proj = proj_codes >= 0
+    stride = int(proj_codes.max()) + 1 if has_proj.any() else 1
+    pairs = np.unique(codes[has_proj] * stride + proj_codes[has_proj])
+    n_projects = np.bincount(pairs // stride, minlength=n_labels)
+    df_facet = pd.DataFrame({'選項': labels.astype(str), '專案數': n_projects, '營收 (百萬TWD)': rev / 1e6})
+    df_facet = df_facet[~df_facet['選項'].isin(['', 'nan', 'None'])]
+    return df_facet.sort_values(['專案數', '營收 (百萬TWD)'], ascending=False)
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def build_milestone_index(_df, data_version):
+    """[V69] 每個里程碑一組 (已排序日期, 對應 row_id)，供 searchsorted 區間查詢"""
+    index = {}
+    for stage, col in milestone_columns(_df.columns).items():
+        dates = parse_milestone_series(_df[col])
+        valid = dates.notna().to_numpy()
+        values = dates.to_numpy(dtype='datetime64[ns]')[valid]
+        row_ids = _df.index.to_numpy()[valid]
+        order = np.argsort(values, kind='stable')
+        index[stage] = (values[order], row_ids[order])
+    return index
+
+def milestone_range_row_ids(stage_index, start, end):
+    """[V69] 以二分搜尋取出日期落在 [start, end) 的 row_id"""
+    sorted_dates, row_ids = stage_index
+    lo = np.searchsorted(sorted_dates, np.datetime64(start, 'ns'), side='left')
+    hi = np.searchsorted(sorted_dates, np.datetime64(end, 'ns'), side='left')
+    return row_ids[lo:hi]
+
+def get_today(override=None):
+    """[V73] 系統的「今天」：依序採用 override (側邊欄模擬日期)、網址 ?today=、環境變數 GECKOS_TODAY，否則為實際日期"""
+    for candidate in (override, st.query_params.get('today'), os.environ.get('GECKOS_TODAY')):
+        if candidate:
+            ts = pd.to_datetime(candidate, errors='coerce')
+            if pd.notnull(ts):
+                return ts.normalize()
+    return pd.Timestamp.now().normalize()
+
+# [V74] 工作天模式：本機假日檔 (欄位 date, region[, name]) + np.busday_count
+HOLIDAY_CALENDAR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'holidays.csv')
+
+@st.cache_data(show_spinner=False)
+def load_holiday_calendar(path, mtime):
+    """[V74] 讀取假日檔 (mtime 作為快取鍵，檔案更新後自動重讀)"""
+    df_hol = pd.read_csv(path, dtype=str)
+    df_hol.columns = df_hol.columns.str.strip().str.lower()
+    df_hol['date'] = pd.to_datetime(df_hol['date'], errors='coerce')
+    if 'region' not in df_hol.columns:
+        df_hol['region'] = 'ALL'
+    return df_hol.dropna(subset=['date'])
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def build_milestone_calendar(_df, data_version, today, busday_config=None):
+    """[V73] 依 (資料版本, 日期) 快取的里程碑日曆 (內容見 geckos_core.milestone_calendar)；日期換日後快取鍵自然失效"""
+    return milestone_calendar(_df, today, busday_config)
+
+# [V75] 快照歷史：每次上傳存一份 Parquet (檔名含內容雜湊，重複上傳不另存)，供跨版本時程滑移分析
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'snapshots')
+SNAPSHOT_MANIFEST_PATH = os.path.join(SNAPSHOT_DIR, 'manifest.json')
+
+def load_snapshot_manifest():
+    """[V75] 讀取快照清單 (依上傳時間排序)"""
+    if not os.path.exists(SNAPSHOT_MANIFEST_PATH):
+        return []
+    with open(SNAPSHOT_MANIFEST_PATH, encoding='utf-8') as f:
+        return sorted(json.load(f), key=lambda item: item['uploaded_at'])
+
+def save_snapshot(df, data_hash, file_name, uploaded_at):
+    """[V75] 同內容雜湊尚未存過時，寫入 Parquet 並登錄至 manifest；回傳是否新增"""
+    manifest = load_snapshot_manifest()
+    if any(item['hash'] == data_hash for item in manifest):
+        return False
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    snapshot_file = f"{uploaded_at.strftime('%Y%m%d_%H%M%S')}_{data_hash}.parquet"
+    # object 欄位可能混雜字串/日期 (例如 '2026Q2' 與 Excel 日期)，統一存成字串
+    df_store = df.astype({c: 'string' for c in df.columns if df[c].dtype == 'object'})
+    df_store.to_parquet(os.path.join(SNAPSHOT_DIR, snapshot_file), compression='zstd', index=False)
+    manifest.append({'hash': data_hash, 'file': snapshot_file, 'name': file_name, 'rows': len(df),
+                     'uploaded_at': uploaded_at.isoformat(timespec='seconds'), 'columns': [str(c) for c in df.columns]})
+    with open(SNAPSHOT_MANIFEST_PATH, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return True
+
+@st.cache_data(show_spinner=False, max_entries=512)
+def load_snapshot_milestones(snapshot_file, columns):
+    """[V75] 讀取單一快照的 專案/PM/里程碑 欄位 (只讀需要的欄位)，轉為 (專案, stage) 長表並取各專案最早日期。
+    快照內容不會變動，以檔名為快取鍵，新增快照時只需讀取新檔。"""
+    stage_cols = milestone_columns(columns)
+    read_cols = ['專案'] + [c for c in ['專案負責人'] if c in columns] + list(stage_cols.values())
+    df_snap = pd.read_parquet(os.path.join(SNAPSHOT_DIR, snapshot_file), columns=read_cols)
+    pm = df_snap['專案負責人'].fillna('') if '專案負責人' in df_snap.columns else ''
+    frames = [pd.DataFrame({'專案': df_snap['專案'].astype(str), 'PM': pm, 'stage': stage,
+                            'date': parse_milestone_series(df_snap[col])}) for stage, col in stage_cols.items()]
+    if not frames:
+        return pd.DataFrame(columns=['專案', 'PM', 'stage', 'date'])
+    long = pd.concat(frames, ignore_index=True).dropna(subset=['date'])
+    return long.sort_values('date').drop_duplicates(subset=['專案', 'stage']).reset_index(drop=True)
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def build_slippage_history(snapshots):
+    """[V75] 依 專案 對齊所有快照，計算各里程碑相對首次出現日期的累計滑移天數 (slip_days) 與相對前一版的變動 (step_days)。
+    snapshots 為 ((file, columns), ...)，依上傳時間排序。"""
+    frames = [load_snapshot_milestones(snapshot_file, columns).assign(snapshot=i) for i, (snapshot_file, columns) in enumerate(snapshots)]
+    if not frames:
+        return pd.DataFrame(columns=['專案', 'PM', 'stage', 'date', 'snapshot', 'slip_days', 'step_days'])
+    hist = pd.concat(frames, ignore_index=True).sort_values(['專案', 'stage', 'snapshot'], kind='stable')
+    grp = hist.groupby(['專案', 'stage'], sort=False)['date']
+    hist['slip_days'] = (hist['date'] - grp.transform('first')).dt.days
+    hist['step_days'] = grp.diff().dt.days.fillna(0).astype(int)
+    return hist.reset_index(drop=True)
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def load_snapshot_table(snapshot_file):
+    """[V76] 讀取完整快照 (字串欄位還原為 object，缺值為 NaN)"""
+    df_snap = pd.read_parquet(os.path.join(SNAPSHOT_DIR, snapshot_file))
+    string_cols = [c for c in df_snap.columns if isinstance(df_snap[c].dtype, pd.StringDtype)]
+    return df_snap.astype({c: object for c in string_cols}).replace({pd.NA: np.nan})
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def load_baseline_file(_file, file_hash):
+    """[V76] 上傳的比較基準檔 (以檔案內容雜湊為快取鍵，rerun 時不重新解析)"""
+    return read_project_table(_file)
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def diff_project_tables(_df_old, _df_new, old_version, new_version):
+    """[V76] 依 (基準版本, 目前版本) 快取的兩版總表比對 (內容見 geckos_core.diff_tables)"""
+    return diff_tables(_df_old, _df_new)
+
+# [V77] 營收風險模擬：各階段滑移天數 ~ max(0, Normal(平均, 標準差))，依 開案類別 × 階段 設定
+# [V89] 各階段預設值取自里程碑階段設定 (slip)
+DEFAULT_SLIP_PARAMS = {stage['key']: tuple(stage['slip']) for stage in MILESTONE_STAGES if stage['slip']}
+SLIP_PARAM_COLUMNS = ['開案類別', '階段', '平均滑移 (天)', '標準差 (天)']
+MIN_FIT_SAMPLES = 3
+
+def default_slip_param_table(open_types, stages):
+    """[V77] 預設滑移參數表 (開案類別 × 階段)"""
+    return pd.DataFrame([(ot, stage) + DEFAULT_SLIP_PARAMS.get(stage, (14.0, 21.0)) for ot in open_types for stage in stages],
+                        columns=SLIP_PARAM_COLUMNS)
+
+def fit_slip_param_table(slip_history, project_open_type, open_types, stages):
+    """[V77] 由快照歷史估計參數：各專案最新一版相對首版的滑移，換算成「該階段新增的滑移」(扣除前一階段)，
+    依 (開案類別, 階段) 取平均與標準差；樣本數不足時改用該階段全體，仍不足則用預設值。"""
+    latest = slip_history.drop_duplicates(subset=['專案', 'stage'], keep='last')
+    cum = latest.pivot(index='專案', columns='stage', values='slip_days').reindex(columns=stages)
+    filled = cum.ffill(axis=1).fillna(0)
+    increments = filled.diff(axis=1)
+    increments[stages[0]] = filled[stages[0]]
+    increments = increments.where(cum.notna())
+    long = increments.stack().rename('inc').reset_index()
+    long['開案類別'] = long['專案'].map(project_open_type)
+    by_type = long.groupby(['開案類別', 'stage'])['inc'].agg(['mean', 'std', 'count'])
+    by_stage = long.groupby('stage')['inc'].agg(['mean', 'std', 'count'])
+
+    table = default_slip_param_table(open_types, stages)
+    for i, (ot, stage) in enumerate(zip(table['開案類別'], table['階段'])):
+        for stats in (by_type.loc[(ot, stage)] if (ot, stage) in by_type.index else None,
+                      by_stage.loc[stage] if stage in by_stage.index else None):
+            if stats is not None and stats['count'] >= MIN_FIT_SAMPLES:
+                table.loc[i, ['平均滑移 (天)', '標準差 (天)']] = [round(max(stats['mean'], 0), 1), round(np.nan_to_num(stats['std']), 1)]
+                break
+    return table
+
+SIM_CHUNK_CELLS = 2_000_000  # 每批抽樣的 (專案/訂單組 × 試驗) 格數上限，控制記憶體用量
+
+def quarter_ordinals(days):
+    """datetime64[D] 陣列 → 季序號 (年 × 4 + 季 - 1，以 1970Q1 為 0)"""
+    return days.astype('datetime64[M]').astype(np.int64) // 3
+
+def quarter_start_days(quarters):
+    """季序號 → 該季第一天 (datetime64[D])"""
+    return (np.asarray(quarters) * 3).astype('datetime64[M]').astype('datetime64[D]')
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def simulate_revenue_at_risk(_cal, _rows, data_version, filter_signature, rmb_rate, today, slip_params, n_trials, seed):
+    """[V77] Monte Carlo：專案 × 試驗次數 矩陣一次抽樣各階段滑移，沿階段設定順序累加至 Order (已過的階段不再滑移)，
+    推得每次試驗的訂單季度並以 bincount 加總營收。
+    同一專案的多列共用同一組滑移 (各階段取該專案最早日期判斷是否已過)；營收先依 (專案, 訂單日) 彙總，
+    試驗分批抽樣以限制記憶體。
+    _rows：index 為 row_id，欄位 專案 / 開案類別 / Revenue。回傳各季 P10/P50/P90 與無滑移基準。"""
+    stage_dates = _cal.pivot(index='row_id', columns='stage', values='date').reindex(_rows.index)
+    if 'Order' not in stage_dates.columns:
+        return pd.DataFrame(columns=['基準', 'P10', 'P50', 'P90'])
+    has_order = stage_dates['Order'].notna().to_numpy()
+    stage_dates, rows = stage_dates[has_order], _rows[has_order]
+    n_trials = int(n_trials)
+    if len(rows) == 0:
+        return pd.DataFrame(columns=['基準', 'P10', 'P50', 'P90'])
+
+    proj_codes, proj_labels = pd.factorize(rows['專案'].astype(str))
+    n_proj = len(proj_labels)
+    proj_stage_dates = stage_dates.groupby(proj_codes).min()
+    proj_open_types = rows['開案類別'].astype(str).groupby(proj_codes).first().to_numpy()
+    order_groups = (pd.DataFrame({'proj': proj_codes, 'day': stage_dates['Order'].to_numpy(dtype='datetime64[D]'),
+                                  'rev': rows['Revenue'].to_numpy(dtype=float)})
+                    .groupby(['proj', 'day'], sort=False)['rev'].sum().reset_index())
+    group_proj = order_groups['proj'].to_numpy()
+    group_days = order_groups['day'].to_numpy(dtype='datetime64[D]')
+    revenue = order_groups['rev'].to_numpy()
+
+    # 各階段：尚未到期的專案及其 (平均, 標準差)
+    params = {(ot, stage): (mean, sd) for ot, stage, mean, sd in slip_params}
+    today_day = np.datetime64(today.date(), 'D')
+    stage_keys = list(STAGE_CONFIG)
+    stage_draws = []
+    for stage in [s for s in stage_keys[:stage_keys.index('Order') + 1] if s in proj_stage_dates.columns]:
+        days = proj_stage_dates[stage].to_numpy(dtype='datetime64[D]')
+        future = np.flatnonzero(~np.isnat(days) & (days >= today_day))
+        if len(future):
+            mean, sd = np.array([params.get((ot, stage), DEFAULT_SLIP_PARAMS.get(stage, (0.0, 0.0))) for ot in proj_open_types[future]],
+                                dtype=np.float32).reshape(-1, 2).T
+            stage_draws.append((future, mean[:, None], sd[:, None]))
+
+    base_quarters = quarter_ordinals(group_days)
+    q_min = base_quarters.min()
+    rng = np.random.default_rng(seed)
+    chunk = max(1, min(n_trials, SIM_CHUNK_CELLS // max(n_proj, len(order_groups))))
+    per_trial_chunks = []
+    for start in range(0, n_trials, chunk):
+        n_chunk = min(chunk, n_trials - start)
+        delay = np.zeros((n_proj, n_chunk), dtype=np.float32)
+        for future, mean, sd in stage_draws:
+            samples = rng.standard_normal((len(future), n_chunk), dtype=np.float32)
+            delay[future] += np.maximum(samples * sd + mean, 0)
+        # 滑移後的季度 = 原季度 + 延遲跨過的季初數 (只做整數比較，不逐格轉換日期)
+        delay_days = delay[group_proj].astype(np.int32)
+        n_ahead = int(delay_days.max()) // 89 + 1
+        next_starts = (quarter_start_days(base_quarters[:, None] + np.arange(1, n_ahead + 1)) - group_days[:, None]).astype(np.int32)
+        sim_quarters = np.broadcast_to((base_quarters - q_min)[:, None], delay_days.shape).astype(np.int32)
+        for k in range(n_ahead):
+            sim_quarters += delay_days >= next_starts[:, k:k + 1]
+        n_q = int(sim_quarters.max() + 1)
+        flat = sim_quarters * n_chunk + np.arange(n_chunk)
+        per_trial_chunks.append(np.bincount(flat.ravel(), weights=np.repeat(revenue, n_chunk),
+                                            minlength=n_q * n_chunk).reshape(n_q, n_chunk))
+    n_quarters = max(c.shape[0] for c in per_trial_chunks)
+    per_trial = np.hstack([np.pad(c, ((0, n_quarters - c.shape[0]), (0, 0))) for c in per_trial_chunks])
+
+    p10, p50, p90 = np.percentile(per_trial, [10, 50, 90], axis=1)
+    baseline = np.bincount(base_quarters - q_min, weights=revenue, minlength=n_quarters)
+    q_index = np.arange(q_min, q_min + n_quarters)
+    labels = [f"{1970 + q // 4}Q{q % 4 + 1}" for q in q_index]
+    return pd.DataFrame({'基準': baseline, 'P10': p10, 'P50': p50, 'P90': p90}, index=pd.Index(labels, name='季度'))
+
+def _s_curve_weights(n_quarters, steepness=1.5):
+    """[V79] S 曲線各季比例 (logistic 累積曲線的差分，總和為 1)"""
+    x = np.arange(n_quarters + 1) - n_quarters / 2
+    cdf = 1 / (1 + np.exp(-steepness * x))
+    weights = np.diff(cdf)
+    return (weights / weights.sum()).round(4).tolist()
+
+# [V79] 營收認列分期：自預計訂單季度起，依比例分攤至後續各季 (比例總和為 1)
+RAMP_PROFILES = {
+    '一次認列 (Lump)': [1.0],
+    '線性 4 季 (Linear)': [0.25, 0.25, 0.25, 0.25],
+    '前重 4 季 (Front-loaded)': [0.4, 0.3, 0.2, 0.1],
+    'S 曲線 6 季 (S-curve)': _s_curve_weights(6),
+}
+DEFAULT_RAMP_PROFILE = '一次認列 (Lump)'
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def phase_revenue(_rows, data_version, filter_signature, rmb_rate, profile_by_category):
+    """[V79] 營收分期：每列營收 × 其類別的分期比例列 (列數 × 最長分期季數 的矩陣)，再以 bincount 累加到 類別 × 季度 網格。
+    _rows：欄位 專案/類別/OrderDate/Revenue。回傳 (網格 DataFrame [季度 × 類別], 明細長表 [專案/類別/季度/營收])。"""
+    rows = _rows.dropna(subset=['OrderDate'])
+    if rows.empty:
+        return pd.DataFrame(), pd.DataFrame(columns=['專案', '類別', '季度', '營收'])
+    profile_names = list(RAMP_PROFILES)
+    max_len = max(len(w) for w in RAMP_PROFILES.values())
+    weight_matrix = np.zeros((len(profile_names), max_len))
+    for i, name in enumerate(profile_names):
+        weight_matrix[i, :len(RAMP_PROFILES[name])] = RAMP_PROFILES[name]
+
+    category_profile = {cat: profile_names.index(name) for cat, name in profile_by_category if name in RAMP_PROFILES}
+    profile_idx = rows['類別'].map(category_profile).fillna(profile_names.index(DEFAULT_RAMP_PROFILE)).astype(int).to_numpy()
+    amounts = rows['Revenue'].to_numpy(dtype=float)[:, None] * weight_matrix[profile_idx]
+    start_q = rows['OrderDate'].to_numpy(dtype='datetime64[M]').astype(np.int64) // 3
+    quarters = start_q[:, None] + np.arange(max_len)
+
+    nonzero = weight_matrix[profile_idx] > 0
+    q_min, q_max = start_q.min(), quarters[nonzero].max()
+    n_quarters = int(q_max - q_min + 1)
+    cat_codes, cat_labels = pd.factorize(rows['類別'])
+    flat = cat_codes[:, None] * n_quarters + (quarters - q_min)
+    grid = np.bincount(flat[nonzero], weights=amounts[nonzero], minlength=len(cat_labels) * n_quarters)
+    labels = [f"{1970 + q // 4}Q{q % 4 + 1}" for q in range(q_min, q_max + 1)]
+    df_grid = pd.DataFrame(grid.reshape(len(cat_labels), n_quarters).T, index=pd.Index(labels, name='季度'), columns=cat_labels)
+
+    r, c = np.nonzero(nonzero)
+    df_detail = pd.DataFrame({'專案': rows['專案'].to_numpy()[r], '類別': rows['類別'].to_numpy()[r],
+                              '季度': np.asarray(labels, dtype=object)[quarters[r, c] - q_min], '營收': amounts[r, c]})
+    return df_grid, df_detail
+
+def week_ordinals(dates):
+    """[V80] ISO 週序號 (自 1969-12-29 週一起算的週數)，同一 ISO 週的日期序號相同"""
+    days = pd.Series(dates).to_numpy(dtype='datetime64[D]').astype(np.int64)
+    return (days + 3) // 7
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def build_pm_week_load(_cal, _pm_rows, data_version, filter_signature, first_week, n_weeks):
+    """[V80] PM × ISO 週 工作負荷矩陣 (一次向量化累加)：
+    milestones = 該週落點的里程碑數 (np.add.at)；phases = 進行中的階段區間數 (依階段設定順序的相鄰階段，差分陣列 + cumsum)。
+    _pm_rows：index 為 row_id，欄位 PM。回傳 (PM 清單, milestones, phases)。"""
+    pm_codes, pm_labels = pd.factorize(_pm_rows['PM'], sort=True)
+    pm_of_row = pd.Series(pm_codes, index=_pm_rows.index)
+    n_pm = len(pm_labels)
+    milestones = np.zeros((n_pm, n_weeks), dtype=np.int32)
+    phase_diff = np.zeros((n_pm, n_weeks + 1), dtype=np.int32)
+
+    cal = _cal[_cal['row_id'].isin(_pm_rows.index)]
+    if not cal.empty:
+        week_col = week_ordinals(cal['date']) - first_week
+        in_window = (week_col >= 0) & (week_col < n_weeks)
+        np.add.at(milestones, (pm_of_row.loc[cal['row_id']].to_numpy()[in_window], week_col[in_window]), 1)
+
+        stage_dates = cal.pivot(index='row_id', columns='stage', values='date')
+        chain = [stage for stage in STAGE_CONFIG if stage in stage_dates.columns]
+        pm_idx = pm_of_row.loc[stage_dates.index].to_numpy()
+        for start_stage, end_stage in zip(chain, chain[1:]):
+            start_w = week_ordinals(stage_dates[start_stage]) - first_week
+            end_w = week_ordinals(stage_dates[end_stage]) - first_week
+            valid = stage_dates[start_stage].notna().to_numpy() & stage_dates[end_stage].notna().to_numpy()
+            valid &= (end_w >= start_w) & (end_w >= 0) & (start_w < n_weeks)
+            np.add.at(phase_diff, (pm_idx[valid], np.clip(start_w[valid], 0, n_weeks)), 1)
+            np.add.at(phase_diff, (pm_idx[valid], np.clip(end_w[valid] + 1, 0, n_weeks)), -1)
+    phases = phase_diff.cumsum(axis=1)[:, :n_weeks]
+    return list(pm_labels), milestones, phases
+
+# [V85] 路徑圖分頁：專案順序每個 (資料版本, 篩選, 日期, 粒度) 只排一次；每頁圖表存入 [V86] 圖表快取
+# (Figure 物件不經 pickle，翻回看過的頁面不必重建/重新驗證)
+ROADMAP_PAGE_SIZE = 50
+ROADMAP_PAGING_THRESHOLD = 300  # 專案數超過此值時預設開啟分頁
+
+# [V86] 圖表快取上限 (筆數)
+FIGURE_CACHE_ENTRIES = 128
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def build_roadmap_order(_df, data_version, filter_signature, today, granularity):
+    """[V85] 路徑圖專案順序 (列位置陣列，與 roadmap_figure 排序一致)"""
+    return roadmap_order(_df, today, granularity)
+
+def build_roadmap_page(df, data_version, filter_signature, today, granularity, page, page_size):
+    """[V85] 單頁路徑圖：只建立該頁專案的 trace (page 從 1 起算)"""
+    order = build_roadmap_order(df, data_version, filter_signature, today, granularity)
+    return roadmap_figure(df.iloc[order[(page - 1) * page_size : page * page_size]], today, granularity=granularity)
+
+@st.cache_resource(show_spinner=False)
+def get_figure_cache():
+    """[V86] 跨 rerun/工作階段共用的圖表 LRU 快取 (鍵含資料版本，不同檔案不會互相命中)"""
+    return FigureCache(max_entries=FIGURE_CACHE_ENTRIES)
+
+def jump_to_roadmap_project(projects, page_size):
+    """[V85] 跳至專案：將頁碼設為該專案所在頁"""
+    target = st.session_state.get('roadmap_jump')
+    if target in projects:
+        st.session_state['roadmap_page'] = projects.index(target) // page_size + 1
+
+CUSTOMER_COLS = ['目標客戶1', '目標客戶2', '目標客戶3', '目標客戶4', '目標客戶5']
+
+# [V70] 全文搜尋：字元 bigram/trigram 倒排索引 (上傳時建立，編輯時增量更新)
+SEARCH_COLS = ['專案', '目標規格', '信賴性測試要求', '對標競爭產品'] + CUSTOMER_COLS
+
+def _char_ngrams(text):
+    """以空白切段後，取每段的字元 bigram 與 trigram"""
+    grams = set()
+    for token in text.split():
+        for n in (2, 3):
+            grams.update(token[i:i + n] for i in range(len(token) - n + 1))
+    return grams
+
+def update_search_index(index, df, row_ids):
+    """重新索引指定的列 (已不在 df 中的列則自索引移除)"""
+    postings, row_grams, row_text = index['postings'], index['row_grams'], index['row_text']
+    for rid in row_ids:
+        for gram in row_grams.pop(rid, ()):
+            postings[gram].discard(rid)
+        row_text.pop(rid, None)
+
+    present = df.index[df.index.isin(list(row_ids))]
+    cols = [c for c in SEARCH_COLS if c in df.columns]
+    if present.empty or not cols:
+        return
+    parts = [df.loc[present, c].astype(str).where(df.loc[present, c].notna(), '') for c in cols]
+    texts = reduce(lambda a, b: a + ' ' + b, parts).str.lower()
+    for rid, text in zip(present.tolist(), texts.tolist()):
+        grams = _char_ngrams(text)
+        row_grams[rid] = grams
+        row_text[rid] = text
+        for gram in grams:
+            postings[gram].add(rid)
+
+def build_search_index(df):
+    index = {'postings': defaultdict(set), 'row_grams': {}, 'row_text': {}}
+    update_search_index(index, df, df.index.tolist())
+    return index
+
+def search_row_ids(index, query):
+    """多關鍵字 (空白分隔) 需全部命中，依出現次數排序回傳 row_id"""
+    postings, row_text = index['postings'], index['row_text']
+    scores = None
+    for term in query.lower().split():
+        if len(term) == 1:
+            candidates = {rid for rid, text in row_text.items() if term in text}
+        else:
+            grams = [term[i:i + 3] for i in range(len(term) - 2)] if len(term) >= 3 else [term]
+            lists = sorted((postings.get(g, set()) for g in set(grams)), key=len)
+            candidates = set.intersection(*lists) if lists[0] else set()
+            if len(term) > 3:
+                candidates = {rid for rid in candidates if term in row_text[rid]}
+        term_scores = {rid: row_text[rid].count(term) for rid in candidates}
+        if scores is None:
+            scores = term_scores
+        else:
+            scores = {rid: scores[rid] + sc for rid, sc in term_scores.items() if rid in scores}
+    if scores is None:
+        return []
+    return sorted(scores, key=lambda rid: -scores[rid])
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def build_customer_bridge(_df, data_version):
+    """[V67] 將 目標客戶1~5 攤平成 (row_id, 專案, 客戶) 對照表，每個資料版本只建一次"""
+    cols = [c for c in CUSTOMER_COLS if c in _df.columns]
+    if not cols or '專案' not in _df.columns:
+        return pd.DataFrame(columns=['row_id', '專案', '客戶', 'n_customers'])
+    bridge = _df[['專案'] + cols].rename_axis('row_id').reset_index().melt(
+        id_vars=['row_id', '專案'], value_vars=cols, value_name='客戶'
+    )
+    bridge = bridge.dropna(subset=['客戶'])
+    bridge['客戶'] = bridge['客戶'].astype(str).str.strip()
+    bridge = bridge[~bridge['客戶'].isin(['', 'nan', 'None'])]
+    bridge = bridge.drop_duplicates(subset=['row_id', '客戶'])[['row_id', '專案', '客戶']]
+    bridge['n_customers'] = bridge.groupby('row_id')['客戶'].transform('size')
+    bridge['客戶'] = bridge['客戶'].astype('category')
+    return bridge.reset_index(drop=True)
+
+DUCKDB_AUTO_ROWS = 100_000  # [V68] 自動模式下，超過此列數改用 DuckDB
+
+def _sql_text_column(series):
+    """轉成字串欄 (缺值保留為 NULL)，避免 object 欄混型別造成 DuckDB 型別推斷失敗"""
+    return series.astype('string').where(series.notna(), None)
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def get_duckdb_portfolio(_df, _order_table, _customer_bridge, data_version, col_map):
+    """[V68] 將精簡後的總表與客戶 bridge 註冊到 in-process DuckDB (每個資料版本建一次)"""
+    slim = pd.DataFrame({'row_id': _df.index.to_numpy()})
+    for key, col in col_map:
+        slim[key] = _sql_text_column(_df[col]).to_numpy() if col and col in _df.columns else None
+    slim['order_date'] = _order_table['OrderDate'].reindex(_df.index).to_numpy()
+    slim['twd'] = _order_table['TWD'].reindex(_df.index).to_numpy()
+    slim['rmb'] = _order_table['RMB'].reindex(_df.index).to_numpy()
+    bridge = pd.DataFrame({'row_id': _customer_bridge['row_id'].to_numpy(), 'customer': _customer_bridge['客戶'].astype(str).to_numpy()})
+
+    con = duckdb.connect(database=':memory:')
+    con.register('portfolio_df', slim)
+    con.register('bridge_df', bridge)
+    con.execute("CREATE TABLE portfolio AS SELECT * FROM portfolio_df")
+    con.execute("CREATE TABLE customer_bridge AS SELECT * FROM bridge_df")
+    con.unregister('portfolio_df')
+    con.unregister('bridge_df')
+    return con
+
+def build_sql_filter(filters, customer_filter, row_id_filter=None):
+    """[V68] 將側邊欄篩選條件轉為 DuckDB WHERE 子句與參數 (row_id_filter: 預先算好的 row_id 集合)"""
+    clauses, params = ["TRUE"], []
+    for key, values in filters.items():
+        if values:
+            clauses.append(f"{key} IN ({', '.join(['?'] * len(values))})")
+            params.extend(str(v) for v in values)
+    if customer_filter:
+        clauses.append(f"row_id IN (SELECT row_id FROM customer_bridge WHERE customer IN ({', '.join(['?'] * len(customer_filter))}))")
+        params.extend(str(v) for v in customer_filter)
+    if row_id_filter is not None:
+        clauses.append("row_id IN (SELECT UNNEST(?))")
+        params.append(np.asarray(row_id_filter).tolist())
+    return " AND ".join(clauses), params
+
+def duckdb_query(con, sql, params=()):
+    """[V68] 每次查詢開新 cursor (Streamlit 多執行緒下共用連線須如此)，結果回傳小型 DataFrame"""
+    return con.cursor().execute(sql, list(params)).df()
 
 if uploaded_file is not None:
     # 2. 讀取與初始化資料
@@ -80,56 +727,104 @@ if uploaded_file is not None:
         file_id = uploaded_file.file_id if hasattr(uploaded_file, 'file_id') else uploaded_file.name
         
         if 'full_df' not in st.session_state or st.session_state.get('current_file_id') != file_id:
-            if uploaded_file.name.endswith('.csv'):
-                df_raw = pd.read_csv(uploaded_file)
-            else:
-                df_raw = pd.read_excel(uploaded_file)
-            
-            df_raw.columns = df_raw.columns.str.strip()
-            
-            # [V47] 欄位格式優化
-            if '專案負責人' in df_raw.columns:
-                df_raw['專案負責人'] = df_raw['專案負責人'].astype(str).replace('nan', '')
-
-            # 數值前處理
-            for col in df_raw.columns:
-                if '營收' in col: 
-                     if df_raw[col].dtype == 'object':
-                        df_raw[col] = pd.to_numeric(df_raw[col].astype(str).str.replace(',', ''), errors='coerce').fillna(0)
-                     else:
-                        df_raw[col] = df_raw[col].fillna(0)
+            df_raw = read_project_table(uploaded_file)
 
             st.session_state['full_df'] = df_raw
             st.session_state['current_file_id'] = file_id
+            # [V66] 資料版本：以檔案內容雜湊為基底，編輯後由 bump_data_version() 更新
+            st.session_state['data_hash'] = hashlib.md5(uploaded_file.getvalue()).hexdigest()[:12]
+            st.session_state['data_version'] = st.session_state['data_hash']
+            st.session_state['search_index'] = build_search_index(df_raw)
+            # [V90] 欄位對照 (營收/類別/里程碑欄位 + 型別檢查) 每次上傳只解析一次，隨資料集保存
+            st.session_state['column_schema'] = resolve_schema(df_raw)
+            # [V75] 存入快照歷史 (需 pyarrow；失敗不影響主流程)
+            try:
+                save_snapshot(df_raw, st.session_state['data_hash'], uploaded_file.name, pd.Timestamp.now())
+            except (ImportError, OSError, ValueError) as e:
+                st.sidebar.caption(f"⚠️ 快照未儲存：{e}")
 
     except Exception as e:
         st.error(f"檔案讀取失敗: {e}")
         st.stop()
 
     df_full = st.session_state['full_df']
-
-    # --- 欄位識別 ---
-    col_twd = None
-    col_rmb = None
-    
-    candidates_twd = [c for c in df_full.columns if '營收' in c and 'TWD' in c]
-    if candidates_twd: col_twd = candidates_twd[0]
-    
-    candidates_rmb = [c for c in df_full.columns if '營收' in c and 'RMB' in c]
-    if candidates_rmb: col_rmb = candidates_rmb[0]
-    
-    if not col_twd:
-        candidates_gen = [c for c in df_full.columns if '營收' in c and c != col_rmb]
-        if candidates_gen: col_twd = candidates_gen[0]
+    data_version = st.session_state['data_version']
+    column_schema = st.session_state['column_schema']
+
+    # [V73] 統一的「今天」(可注入)；里程碑衍生值依 (資料版本, 日期) 快取，同一天內的 rerun 直接重用
+    today = get_today(st.session_state.get('what_if_date') if st.session_state.get('what_if_on') else None)
+
+    # [V74] 工作天模式 (設定 widget 於側邊欄「參數設定」，此處先讀取其狀態)
+    holiday_df = None
+    if os.path.exists(HOLIDAY_CALENDAR_PATH):
+        holiday_df = load_holiday_calendar(HOLIDAY_CALENDAR_PATH, os.path.getmtime(HOLIDAY_CALENDAR_PATH))
+    region_options = sorted(holiday_df['region'].dropna().unique()) if holiday_df is not None else []
+    busday_config = None
+    if st.session_state.get('busday_on'):
+        # 剛切換為工作天模式時地區 widget 尚未建立：先補上預設 (全部地區)，第一次 rerun 即套用假日
+        busday_regions = st.session_state.setdefault('busday_regions', region_options)
+        holiday_dates = holiday_df.loc[holiday_df['region'].isin(busday_regions), 'date'] if holiday_df is not None else pd.Series(dtype='datetime64[ns]')
+        busday_weekmask = st.session_state.get('busday_weekmask', DEFAULT_WEEKMASK)
+        if not re.fullmatch(r'[01]{7}', busday_weekmask) or '1' not in busday_weekmask:
+            busday_weekmask = DEFAULT_WEEKMASK
+        busday_config = (busday_weekmask, tuple(sorted(holiday_dates.dt.strftime('%Y-%m-%d').unique())))
+    day_unit = "工作天" if busday_config else "天"
+    milestone_cal, milestone_next = build_milestone_calendar(df_full, data_version, today, busday_config)
+    # [V89] 目前資料的階段鏈 (依階段設定順序，只含有日期的階段)，供負荷/模擬說明文字使用
+    cal_stages = set(milestone_cal['stage'].unique())
+    stage_chain = [key for key in column_schema['stages'] if key in cal_stages]
+
+    # --- 欄位識別 (V90: 取自上傳時解析的欄位對照) ---
+    col_twd, col_rmb = column_schema['col_twd'], column_schema['col_rmb']
 
     if not col_twd:
         st.error("❌ 找不到「預估營收(TWD)」相關欄位，請檢查 Excel 表頭。")
         st.stop()
+    if column_schema['issues']:
+        with st.sidebar.expander(f"⚠️ 欄位檢查 ({len(column_schema['issues'])})", expanded=False):
+            for issue in column_schema['issues']:
+                st.caption(issue)
 
     # =========================================================================
     # [區塊 1] 篩選條件 (V65.1: 修正縮排 Bug)
     # =========================================================================
     st.sidebar.header("🔍 專案篩選器")
+
+    # --- [V72] Saved Views ---
+    saved_views = load_saved_views()
+    view_param = st.query_params.get('view')
+    if view_param in saved_views and st.session_state.get('loaded_view_param') != view_param:
+        st.session_state['pending_view_filters'] = saved_views[view_param]['filters']
+        st.session_state['pending_view_rate'] = saved_views[view_param].get('rmb_rate', 4.4)
+        st.session_state['loaded_view_param'] = view_param
+
+    with st.sidebar.expander("💾 儲存的檢視 (Saved Views)", expanded=False):
+        if saved_views:
+            chosen_view = st.selectbox("選擇檢視", list(saved_views), key="saved_view_choice")
+            c_load, c_del = st.columns(2)
+            if c_load.button("📂 載入", use_container_width=True):
+                st.session_state['pending_view_filters'] = saved_views[chosen_view]['filters']
+                st.session_state['pending_view_rate'] = saved_views[chosen_view].get('rmb_rate', 4.4)
+                st.session_state['loaded_view_param'] = chosen_view
+                st.query_params['view'] = chosen_view
+            if c_del.button("🗑️ 刪除", use_container_width=True):
+                del saved_views[chosen_view]
+                save_saved_views(saved_views)
+                st.rerun()
+            st.caption(f"🔗 分享：於網址加上 `?view={chosen_view}` 即可直接開啟")
+        new_view_name = st.text_input("檢視名稱", placeholder="例如：BU1 週報").strip()
+        if st.button("💾 儲存目前篩選", disabled=not new_view_name):
+            saved_views[new_view_name] = {
+                'filters': {name: [str(v) for v in st.session_state.get(key, [])] for name, key in VIEW_FILTER_KEYS.items()},
+                'rmb_rate': float(st.session_state.get('rmb_rate', 4.4)),
+            }
+            save_saved_views(saved_views)
+            st.session_state.pop('views_warmed_for', None)
+            st.toast(f"✅ 已儲存檢視「{new_view_name}」", icon="💾")
+        st.caption("ℹ️ 檢視記錄多選篩選條件與匯率 (不含全文搜尋與里程碑區間)")
+    # [V71] 各選項的專案數/營收 (依其他維度目前的篩選條件計算)
+    show_facets = st.sidebar.toggle("🔢 顯示選項統計 (專案數/營收)", value=False)
+    facet_slots = {}
     
     # --- 1. 核心篩選 ---
     st.sidebar.markdown("### 🎯 核心鎖定")
@@ -138,64 +833,215 @@ if uploaded_file is not None:
     pm_col = '專案負責人'
     pm_options = sorted(df_full[pm_col].unique().astype(str)) if pm_col in df_full.columns else []
     pm_options = [x for x in pm_options if x.lower() != 'nan' and x.strip() != '']
-    pm_filter = st.sidebar.multiselect("👤 專案負責人 (PM)", options=pm_options)
+    restore_view_selection('pm', pm_options)
+    pm_filter = st.sidebar.multiselect("👤 專案負責人 (PM)", options=pm_options, key=VIEW_FILTER_KEYS['pm'])
+    facet_slots['pm'] = st.sidebar.empty()
 
     # 專案名稱
     project_options = df_full['專案'].unique() if '專案' in df_full.columns else []
-    project_filter = st.sidebar.multiselect("🏷️ 專案名稱", options=project_options)
+    restore_view_selection('project', project_options)
+    project_filter = st.sidebar.multiselect("🏷️ 專案名稱", options=project_options, key=VIEW_FILTER_KEYS['project'])
+    facet_slots['project'] = st.sidebar.empty()
+
+    # [V70] 全文搜尋 (專案/規格/信賴性/競品/客戶)
+    search_query = st.sidebar.text_input("🔎 全文搜尋", placeholder="例如：競品型號、規格關鍵字 (空白分隔多關鍵字)").strip()
+    search_ranked_ids = search_row_ids(st.session_state['search_index'], search_query) if search_query else None
+    if search_ranked_ids is not None:
+        top_hits = df_full['專案'].reindex(search_ranked_ids[:20]).dropna().unique()[:5] if '專案' in df_full.columns else []
+        st.sidebar.caption(f"找到 {len(search_ranked_ids)} 筆符合「{search_query}」的資料" + (f"｜最相關：{', '.join(map(str, top_hits))}" if len(top_hits) else ""))
 
     # --- 2. 類別與屬性 ---
     open_type_filter = []
     cat_filter = []
     scene_filter = []
-    cat_col_name = None
+    cat_col_name = column_schema['category']
 
     with st.sidebar.expander("📂 產品與類別屬性", expanded=False):
         open_type_col = '開案類別'
-        open_type_filter = st.multiselect("開案類別", options=df_full[open_type_col].unique()) if open_type_col in df_full.columns else []
+        if open_type_col in df_full.columns:
+            open_type_options = df_full[open_type_col].unique()
+            restore_view_selection('open_type', open_type_options)
+            open_type_filter = st.multiselect("開案類別", options=open_type_options, key=VIEW_FILTER_KEYS['open_type'])
+        facet_slots['open_type'] = st.empty()
 
-        if '產品類別' in df_full.columns:
-            cat_col_name = '產品類別'
-        elif '專案類別' in df_full.columns:
-            cat_col_name = '專案類別'
-        
         if cat_col_name:
-            cat_filter = st.multiselect("產品類別", options=df_full[cat_col_name].unique())
+            cat_options = df_full[cat_col_name].unique()
+            restore_view_selection('cat', cat_options)
+            cat_filter = st.multiselect("產品類別", options=cat_options, key=VIEW_FILTER_KEYS['cat'])
+            facet_slots['cat'] = st.empty()
 
         scene_col = '產業應用場景'
-        scene_filter = st.multiselect("產業應用場景", options=df_full[scene_col].unique()) if scene_col in df_full.columns else []
+        if scene_col in df_full.columns:
+            scene_options = df_full[scene_col].unique()
+            restore_view_selection('scene', scene_options)
+            scene_filter = st.multiselect("產業應用場景", options=scene_options, key=VIEW_FILTER_KEYS['scene'])
+        facet_slots['scene'] = st.empty()
 
     # --- 3. 市場與時程 ---
     market_filter = []
     order_start_filter = []
-    order_col = '預計訂單起始點'
+    customer_filter = []
+    customer_bridge = build_customer_bridge(df_full, data_version)
+    order_col = column_schema['stages'].get('Order', '預計訂單起始點')
 
     with st.sidebar.expander("🌍 市場與時程", expanded=False):
-        market_filter = st.multiselect("目標市場", options=df_full['市場'].unique()) if '市場' in df_full.columns else []
-        order_start_filter = st.multiselect("預計訂單時間 (Quarter)", options=sorted(df_full[order_col].astype(str).unique())) if order_col in df_full.columns else []
+        if '市場' in df_full.columns:
+            market_options = df_full['市場'].unique()
+            restore_view_selection('market', market_options)
+            market_filter = st.multiselect("目標市場", options=market_options, key=VIEW_FILTER_KEYS['market'])
+        facet_slots['market'] = st.empty()
+        if order_col in df_full.columns:
+            order_start_options = sorted(df_full[order_col].astype(str).unique())
+            restore_view_selection('order_start', order_start_options)
+            order_start_filter = st.multiselect("預計訂單時間 (Quarter)", options=order_start_options, key=VIEW_FILTER_KEYS['order_start'])
+        facet_slots['order_start'] = st.empty()
+        # [V67] 目標客戶：選項直接取自 bridge 的 category，不再每次重建 set
+        if not customer_bridge.empty:
+            customer_options = sorted(customer_bridge['客戶'].cat.categories)
+            restore_view_selection('customer', customer_options)
+            customer_filter = st.multiselect("目標客戶", options=customer_options, key=VIEW_FILTER_KEYS['customer'])
+            facet_slots['customer'] = st.empty()
     
+    # --- [V69] 里程碑日期區間 ---
+    milestone_index = build_milestone_index(df_full, data_version)
+    milestone_ranges = {}
+    if milestone_index:
+        with st.sidebar.expander("📆 里程碑時程區間", expanded=False):
+            for stage in milestone_index:
+                range_mode = st.selectbox(f"{stage} 時程條件", ["不限", "日期區間", "未來 N 天內"], key=f"range_mode_{stage}")
+                if range_mode == "日期區間":
+                    picked = st.date_input(f"{stage} 日期區間", value=(today.date(), (today + pd.Timedelta(days=90)).date()), key=f"range_dates_{stage}")
+                    if isinstance(picked, (tuple, list)) and len(picked) == 2:
+                        milestone_ranges[stage] = (pd.Timestamp(picked[0]), pd.Timestamp(picked[1]) + pd.Timedelta(days=1))
+                elif range_mode == "未來 N 天內":
+                    within_days = st.number_input(f"{stage} 天數", min_value=0, value=90, step=7, key=f"range_days_{stage}")
+                    milestone_ranges[stage] = (today, today + pd.Timedelta(days=int(within_days) + 1))
+
+    index_row_ids = None
+    for stage, (range_start, range_end) in milestone_ranges.items():
+        stage_ids = milestone_range_row_ids(milestone_index[stage], range_start, range_end)
+        index_row_ids = stage_ids if index_row_ids is None else np.intersect1d(index_row_ids, stage_ids)
+    if search_ranked_ids is not None:
+        search_ids = np.asarray(search_ranked_ids, dtype=df_full.index.dtype)
+        index_row_ids = search_ids if index_row_ids is None else np.intersect1d(index_row_ids, search_ids)
+
     # --- 4. 全域設定 ---
     st.sidebar.divider()
     st.sidebar.markdown("### ⚙️ 參數設定")
-    rmb_rate = st.sidebar.number_input("💱 RMB 換 TWD 匯率", value=4.4, step=0.01, format="%.2f")
+    st.session_state.pop('pending_view_filters', None)
+    if 'pending_view_rate' in st.session_state:
+        st.session_state['rmb_rate'] = float(st.session_state.pop('pending_view_rate'))
+    st.session_state.setdefault('rmb_rate', 4.4)
+    rmb_rate = st.sidebar.number_input("💱 RMB 換 TWD 匯率", step=0.01, format="%.2f", key="rmb_rate")
+
+    # [V73] 模擬日期 (What-if)：所有倒數與提醒改以指定日期為「今天」
+    if st.sidebar.toggle("🕒 模擬日期 (What-if)", key="what_if_on"):
+        st.sidebar.date_input("模擬今天為", value=today.date(), key="what_if_date")
+
+    # [V74] 工作天模式：倒數與緊急度門檻 (≤30 / 31~90 / >90，🔥 <7) 改以工作天計
+    if st.sidebar.toggle("📅 工作天模式 (Business Days)", key="busday_on"):
+        st.sidebar.multiselect("假日地區", options=region_options, key="busday_regions",
+                               help="假日檔 holidays.csv (欄位：date, region, name) 放在程式同目錄")
+        st.sidebar.text_input("工作日 weekmask (週一~週日)", value=DEFAULT_WEEKMASK, key="busday_weekmask", max_chars=7)
+        if holiday_df is None:
+            st.sidebar.caption("ℹ️ 找不到 holidays.csv，僅排除週末")
+
+    # [V68] 查詢引擎：小檔預設 pandas，大型總表自動切換 DuckDB
+    query_engine = st.sidebar.selectbox("🦆 查詢引擎", ["自動 (Auto)", "pandas", "DuckDB"],
+                                        help=f"自動：超過 {DUCKDB_AUTO_ROWS:,} 列時改用 DuckDB")
+    if query_engine == "DuckDB" and duckdb is None:
+        st.sidebar.warning("⚠️ 未安裝 duckdb，改用 pandas 引擎")
+    use_duckdb = duckdb is not None and (query_engine == "DuckDB" or (query_engine.startswith("自動") and len(df_full) >= DUCKDB_AUTO_ROWS))
 
     # --- 執行篩選邏輯 ---
-    df_filtered = df_full.copy()
-    
-    if pm_filter and pm_col in df_filtered.columns:
-        df_filtered = df_filtered[df_filtered[pm_col].isin(pm_filter)]
-    if open_type_filter and open_type_col in df_filtered.columns:
-        df_filtered = df_filtered[df_filtered[open_type_col].isin(open_type_filter)]
-    if cat_filter and cat_col_name: 
-        df_filtered = df_filtered[df_filtered[cat_col_name].isin(cat_filter)]
-    if scene_filter and scene_col in df_filtered.columns:
-        df_filtered = df_filtered[df_filtered[scene_col].isin(scene_filter)]
-    if project_filter and '專案' in df_filtered.columns: 
-        df_filtered = df_filtered[df_filtered['專案'].isin(project_filter)]
-    if market_filter and '市場' in df_filtered.columns:
-        df_filtered = df_filtered[df_filtered['市場'].isin(market_filter)]
-    if order_start_filter and order_col in df_filtered.columns:
-        df_filtered = df_filtered[df_filtered[order_col].isin(order_start_filter)]
+    filter_dim_cols = (('pm', pm_col), ('project', '專案'), ('open_type', open_type_col), ('cat', cat_col_name),
+                       ('scene', scene_col), ('market', '市場'), ('order_start', order_col))
+    current_filters = {'pm': pm_filter, 'project': project_filter, 'open_type': open_type_filter, 'cat': cat_filter,
+                       'scene': scene_filter, 'market': market_filter, 'order_start': order_start_filter, 'customer': customer_filter}
+
+    # [V72] 新資料版本載入時，預先計算所有 saved view 的結果 (st.cache_data 跨 session 共用)
+    view_col_info = (filter_dim_cols, col_twd, col_rmb)
+    if st.session_state.get('views_warmed_for') != data_version:
+        for view in saved_views.values():
+            compute_view_result(df_full, customer_bridge, data_version, view_signature(view),
+                                float(view.get('rmb_rate', 4.4)), view['filters'], view_col_info)
+        st.session_state['views_warmed_for'] = data_version
+
+    # [V66] 篩選簽章 (與 data_version 一起作為快取鍵)
+    filter_signature = make_filter_signature(
+        **current_filters,
+        milestone_range=[f"{k}:{v[0]:%Y%m%d}-{v[1]:%Y%m%d}" for k, v in milestone_ranges.items()],
+        search=[search_query] if search_query else []
+    )
+
+    # [V72] 目前條件與某個 saved view 相同時，直接取用預先算好的結果 (跳過篩選與聚合)
+    active_view_name = None
+    active_view_result = None
+    for view_name, view in saved_views.items():
+        if view_signature(view) == filter_signature and float(view.get('rmb_rate', 4.4)) == float(rmb_rate):
+            active_view_name = view_name
+            active_view_result = compute_view_result(df_full, customer_bridge, data_version, filter_signature,
+                                                     float(rmb_rate), view['filters'], view_col_info)
+            break
+    if active_view_name:
+        st.sidebar.caption(f"⚡ 已套用檢視「{active_view_name}」(使用預先計算結果)")
+
+    # DuckDB 連線與 WHERE 子句不論是否套用 saved view 都要建立 (倒數/圓餅/市場圖的 SQL 查詢會用到)
+    if use_duckdb:
+        duck_col_map = (('project', '專案'), ('pm', pm_col), ('open_type', open_type_col), ('category', cat_col_name),
+                        ('scene', scene_col), ('market', '市場'), ('order_raw', order_col))
+        duck_con = get_duckdb_portfolio(df_full, build_order_revenue_table(df_full, data_version, order_col, col_twd, col_rmb),
+                                        customer_bridge, data_version, duck_col_map)
+        duck_where, duck_params = build_sql_filter({
+            'pm': pm_filter, 'open_type': open_type_filter, 'category': cat_filter, 'scene': scene_filter,
+            'project': project_filter, 'market': market_filter, 'order_raw': order_start_filter
+        }, customer_filter, index_row_ids)
+
+    if active_view_result is not None:
+        df_filtered = df_full.iloc[active_view_result['positions']]
+    elif use_duckdb:
+        duck_ids = duckdb_query(duck_con, f"SELECT row_id FROM portfolio WHERE {duck_where}", duck_params)['row_id']
+        df_filtered = df_full[df_full.index.isin(duck_ids)]
+    else:
+        df_filtered = filter_rows(df_full, current_filters, filter_dim_cols, customer_bridge)
+        if index_row_ids is not None:
+            df_filtered = df_filtered[df_filtered.index.isin(index_row_ids)]
+
+    # [V71] Facet counts：每個維度一次 bincount，不另外對每個選項重跑篩選
+    if show_facets:
+        facet_codes, facet_proj_codes, facet_bridge_pos = build_facet_codes(df_full, customer_bridge, data_version, filter_dim_cols)
+        facet_order_table = build_order_revenue_table(df_full, data_version, order_col, col_twd, col_rmb)
+        facet_revenue = (facet_order_table['TWD'] + facet_order_table['RMB'] * rmb_rate).to_numpy()
+
+        facet_masks = {}
+        for name, selected in current_filters.items():
+            if selected and name in facet_codes:
+                codes, labels = facet_codes[name]
+                selected_codes = labels.get_indexer([str(v) for v in selected] if name == 'order_start' else selected)
+                facet_masks[name] = np.isin(codes, selected_codes[selected_codes >= 0])
+        if customer_filter:
+            facet_masks['customer'] = np.zeros(len(df_full), dtype=bool)
+            hit_pos = facet_bridge_pos[customer_bridge['客戶'].isin(customer_filter).to_numpy()]
+            facet_masks['customer'][hit_pos[hit_pos >= 0]] = True
+        if index_row_ids is not None:
+            facet_masks['_index'] = df_full.index.isin(index_row_ids)
+
+        for name, slot in facet_slots.items():
+            other_mask = np.ones(len(df_full), dtype=bool)
+            for mask_name, mask in facet_masks.items():
+                if mask_name != name:
+                    other_mask &= mask
+            if name == 'customer':
+                in_view = other_mask[facet_bridge_pos]
+                df_facet = facet_table(customer_bridge['客戶'].cat.codes.to_numpy()[in_view], customer_bridge['客戶'].cat.categories,
+                                       facet_proj_codes[facet_bridge_pos][in_view], facet_revenue[facet_bridge_pos][in_view])
+            elif name in facet_codes:
+                codes, labels = facet_codes[name]
+                df_facet = facet_table(codes[other_mask], labels, facet_proj_codes[other_mask], facet_revenue[other_mask])
+            else:
+                continue
+            slot.dataframe(df_facet, hide_index=True, use_container_width=True, height=min(38 + 35 * len(df_facet), 180),
+                           column_config={"營收 (百萬TWD)": st.column_config.NumberColumn(format="%.1f")})
 
     # --- Session State ---
     if 'last_filtered_shape' not in st.session_state:
@@ -215,20 +1061,40 @@ if uploaded_file is not None:
     val_twd = df_chart_source[col_twd].fillna(0)
     val_rmb = df_chart_source[col_rmb].fillna(0) if col_rmb else 0
     df_chart_source['Calculated_Total_TWD'] = val_twd + (val_rmb * rmb_rate)
+
+    # [V87] KPI、Top 10、產品類別與市場圖共用同一份預聚合 (saved view 的預先計算結果，或 pandas 引擎的快取聚合)
+    if active_view_result is not None:
+        revenue_rollup = active_view_result
+    elif not use_duckdb:
+        revenue_rollup = build_revenue_rollups(df_chart_source, data_version, filter_signature, float(rmb_rate), cat_col_name)
+    else:
+        revenue_rollup = None
     
-    total_revenue_twd = df_chart_source['Calculated_Total_TWD'].sum()
-    project_count_unique = df_chart_source['專案'].nunique()
+    if revenue_rollup is not None:
+        total_revenue_twd = revenue_rollup['total_revenue']
+        project_count_unique = revenue_rollup['n_projects']
+    else:
+        # [V68] KPI 由 DuckDB 聚合，只回傳一列
+        duck_kpi = duckdb_query(duck_con, f"""
+            SELECT COALESCE(SUM(twd + rmb * ?), 0) AS total_rev, COUNT(DISTINCT project) AS n_projects
+            FROM portfolio WHERE {duck_where}""", [rmb_rate] + duck_params)
+        total_revenue_twd = float(duck_kpi.at[0, 'total_rev'])
+        project_count_unique = int(duck_kpi.at[0, 'n_projects'])
 
     # =========================================================================
     # [區塊 2] KPI Metrics
     # =========================================================================
     st.divider()
     
-    if not df_chart_source.empty and total_revenue_twd > 0:
-        df_grouped = df_chart_source.groupby('專案')['Calculated_Total_TWD'].sum()
-        top_project_name = df_grouped.idxmax()
-        top_project_rev = df_grouped.max()
-        top_contributor_text = top_project_name
+    if not df_chart_source.empty and total_revenue_twd > 0 and revenue_rollup is not None:
+        top_contributor_text = revenue_rollup['top_project']
+        top_project_rev = revenue_rollup['top_rev']
+    elif not df_chart_source.empty and total_revenue_twd > 0:
+        duck_top = duckdb_query(duck_con, f"""
+            SELECT project, SUM(twd + rmb * ?) AS rev FROM portfolio WHERE {duck_where}
+            GROUP BY project ORDER BY rev DESC, project LIMIT 1""", [rmb_rate] + duck_params)
+        top_contributor_text = duck_top.at[0, 'project']
+        top_project_rev = float(duck_top.at[0, 'rev'])
     else:
         top_contributor_text = "無資料"
         top_project_rev = 0
@@ -240,100 +1106,23 @@ if uploaded_file is not None:
 
     st.divider()
 
+    # [V82] 主管報告匯出用：各區塊畫出的圖表與提醒卡片 (於 [區塊 18] 組成離線 HTML)
+    report_figures = {}
+    report_alerts = ([], [])
+
+    # [V86] 圖表快取：條件 (資料版本、篩選、匯率、日期、檢視選項) 未變時直接沿用上次建好的 Figure，
+    # 例如在詳細資料表打字時不必重建路徑圖、倒數圖、圓餅圖、市場圖與 Top 10
+    figure_cache = get_figure_cache()
+
     # =========================================================================
     # [區塊 8] 本週/本月重點提醒 (Milestone Alerts)
     # =========================================================================
     if not df_chart_source.empty:
-        now = pd.Timestamp.now().normalize()
-        start_week = now - pd.Timedelta(days=now.dayofweek)
-        end_week = start_week + pd.Timedelta(days=6)
-        current_month = now.month
-        current_year = now.year
-
         df_alerts = df_chart_source.drop_duplicates(subset=['專案'])
-        
-        start_col = None
-        possible_start_cols = ['開案時間', '开案时间', 'NPDR開案時間', 'NPDR开案时间', 'NPDR']
-        for col in possible_start_cols:
-            if col in df_alerts.columns:
-                start_col = col
-                break
-        if not start_col: start_col = '開案時間'
-
-        icon_map = {'NPDR': '🔵', 'DV': '🔶', 'EV': '🟥', 'Order': '🟢'}
-        col_map_alerts = {'NPDR': start_col, 'DV': '設計驗證時間', 'EV': '工程驗證時間', 'Order': '預計訂單起始點'}
-        stage_name_display = {'NPDR': 'NPDR開案', 'DV': '設計驗證(DV)', 'EV': '工程驗證(EV)', 'Order': '預計訂單(Order)'}
-        
-        type_style_map = {
-            'NPDR': {'bg': '#EBF5FB', 'border': '#2E86C1'},
-            'MDR':  {'bg': '#E8F8F5', 'border': '#17A589'},
-            'TDR':  {'bg': '#FEF9E7', 'border': '#F1C40F'},
-            'default': {'bg': '#F2F3F4', 'border': '#95A5A6'}
-        }
-        urgent_style = {'bg': '#FDEDEC', 'border': '#E74C3C', 'text': '#C0392B'}
-
-        week_items = []
-        month_items = []
-
-        for idx, row in df_alerts.iterrows():
-            p_type = row.get('開案類別', 'default')
-            if pd.isna(p_type) or p_type not in type_style_map:
-                month_style = type_style_map['default']
-                p_type_display = p_type if pd.notnull(p_type) else "Unknown"
-            else:
-                month_style = type_style_map[p_type]
-                p_type_display = p_type
-            
-            pm_name = row.get('專案負責人', '')
-            pm_str = f"(👤 PM: {pm_name})" if pd.notnull(pm_name) and str(pm_name).strip() != '' else ""
-
-            for key, col_name in col_map_alerts.items():
-                if col_name in df_alerts.columns:
-                    raw_val = row[col_name]
-                    # V56 Fix
-                    dt = parse_quarter_date_end(raw_val)
-                    if pd.isnull(dt):
-                        dt = pd.to_datetime(raw_val, errors='coerce')
-                    
-                    if pd.notnull(dt):
-                        icon = icon_map.get(key, '⚪')
-                        display_name = stage_name_display.get(key, key)
-                        days_diff = (dt - now).days
-                        
-                        if start_week <= dt <= end_week:
-                            if days_diff < 0:
-                                count_down_str = "(已完成)"
-                                content_style = "color: #999999;" 
-                            else:
-                                count_down_str = "(今天)" if days_diff == 0 else f"(剩餘 {days_diff} 天)"
-                                content_style = f"color: {urgent_style['text']};"
-
-                            card_html = f"""
-                            <div style="background-color: {urgent_style['bg']}; border-left: 5px solid {urgent_style['border']}; padding: 10px; margin-bottom: 8px; border-radius: 4px; box-shadow: 1px 1px 3px rgba(0,0,0,0.1);">
-                                <div style="font-size: 0.85em; font-weight: bold; color: {urgent_style['text']}; margin-bottom: 4px;">{p_type_display} (Urgent)</div>
-                                <div style="{content_style}">{icon} <b>{row['專案']}</b> <span style="font-size:0.9em; opacity:0.8;">{pm_str}</span> - {display_name} | {dt.strftime('%Y-%m-%d')} {count_down_str}</div>
-                            </div>
-                            """
-                            week_items.append({'dt': dt, 'html': card_html})
-                        
-                        if dt.year == current_year and dt.month == current_month:
-                            if days_diff < 0:
-                                count_down_str = "(已完成)"
-                                content_style = "color: #999999;" 
-                            else:
-                                count_down_str = "(今天)" if days_diff == 0 else f"(剩餘 {days_diff} 天)"
-                                content_style = "color: #333333;"
 
-                            card_html = f"""
-                            <div style="background-color: {month_style['bg']}; border-left: 5px solid {month_style['border']}; padding: 10px; margin-bottom: 8px; border-radius: 4px; box-shadow: 1px 1px 3px rgba(0,0,0,0.1);">
-                                <div style="font-size: 0.85em; font-weight: bold; color: {month_style['border']}; margin-bottom: 4px;">{p_type_display}</div>
-                                <div style="{content_style}">{icon} <b>{row['專案']}</b> <span style="font-size:0.9em; opacity:0.8;">{pm_str}</span> - {display_name} | {dt.strftime('%Y-%m-%d')} {count_down_str}</div>
-                            </div>
-                            """
-                            month_items.append({'dt': dt, 'html': card_html})
-
-        week_items.sort(key=lambda x: x['dt'])
-        month_items.sort(key=lambda x: x['dt'])
+        # [V73] 日期解析、距今天數與本週/本月判斷皆取自依 (資料版本, 日期) 快取的里程碑日曆，只走訪有提醒的節點
+        week_items, month_items = alert_cards(df_alerts, milestone_cal, day_unit)
+        report_alerts = (week_items, month_items)
 
         if week_items or month_items:
             with st.expander("🔔 本週/本月重點提醒 (Milestone Alerts)", expanded=True):
@@ -342,14 +1131,14 @@ if uploaded_file is not None:
                     with st.container(border=True):
                         st.markdown(f"<h3 style='color:#E74C3C;'>🔥 本週重點 (Urgent)</h3>", unsafe_allow_html=True)
                         if week_items:
-                            for item in week_items: st.markdown(item['html'], unsafe_allow_html=True)
+                            for item in week_items: st.markdown(item, unsafe_allow_html=True)
                         else:
                             st.success("✅ 本週無重點事項")
                 with c2:
                     with st.container(border=True):
                         st.markdown(f"<h3 style='color:#2E86C1;'>🗓️ 本月重點 (Upcoming)</h3>", unsafe_allow_html=True)
                         if month_items:
-                            for item in month_items: st.markdown(item['html'], unsafe_allow_html=True)
+                            for item in month_items: st.markdown(item, unsafe_allow_html=True)
                         else:
                             st.info("ℹ️ 本月無重點事項")
 
@@ -363,60 +1152,45 @@ if uploaded_file is not None:
             df_chart_source['專案負責人_display'] = df_chart_source['專案負責人'].apply(lambda x: x if pd.notnull(x) and str(x).strip() != '' else "未指派 (Unassigned)")
             unique_pms = sorted(df_chart_source['專案負責人_display'].unique())
             
-            type_style_map_pm = {
-                'NPDR': {'bg': '#EBF5FB', 'border': '#2E86C1'},
-                'MDR':  {'bg': '#E8F8F5', 'border': '#17A589'},
-                'TDR':  {'bg': '#FEF9E7', 'border': '#F1C40F'},
-                'default': {'bg': '#F2F3F4', 'border': '#95A5A6'}
-            }
-            
-            pm_col_map = {'NPDR': start_col, 'DV': '設計驗證時間', 'EV': '工程驗證時間', 'Order': '預計訂單起始點'}
-            pm_stage_name = {'NPDR': 'NPDR開案', 'DV': 'DV', 'EV': 'EV', 'Order': 'Order'}
-
-            now = pd.Timestamp.now().normalize()
-
             for pm in unique_pms:
                 pm_projects = df_chart_source[df_chart_source['專案負責人_display'] == pm].drop_duplicates(subset=['專案'])
                 proj_count = len(pm_projects)
                 
                 with st.expander(f"👤 {pm} (手上專案數：{proj_count})", expanded=False):
                     if not pm_projects.empty:
-                        pm_cards = []
-                        for idx, row in pm_projects.iterrows():
-                            p_type = row.get('開案類別', 'default')
-                            if pd.isna(p_type) or p_type not in type_style_map_pm:
-                                style = type_style_map_pm['default']
-                                p_type_display = p_type if pd.notnull(p_type) else "?"
-                            else:
-                                style = type_style_map_pm[p_type]
-                                p_type_display = p_type
-                            
-                            next_stage = None
-                            min_days = float('inf')
-                            for stage_code, col_name in pm_col_map.items():
-                                if col_name in pm_projects.columns:
-                                    raw_val = row[col_name]
-                                    dt = parse_quarter_date_end(raw_val)
-                                    if pd.isnull(dt): dt = pd.to_datetime(raw_val, errors='coerce')
-                                    if pd.notnull(dt):
-                                        diff = (dt - now).days
-                                        if diff >= 0 and diff < min_days:
-                                            min_days = diff
-                                            next_stage = {'name': pm_stage_name[stage_code], 'date': dt.strftime('%Y-%m-%d'), 'days': diff}
-                            
-                            status_text = f"🔜 下一階段: {next_stage['name']}<br>📅 {next_stage['date']} (剩 {next_stage['days']} 天)" if next_stage else "✅ 所有階段已完成 (或未設定)"
-                            if next_stage and next_stage['days'] < 7: status_text = "🔥 " + status_text
-                            
-                            border_color = '#E74C3C' if next_stage and next_stage['days'] < 7 else style['border']
-                            pm_cards.append({'days': min_days if next_stage else 9999, 'html': f"<div style='background:{style['bg']};border-top:5px solid {border_color};padding:10px;margin:5px;box-shadow:0 2px 4px rgba(0,0,0,0.1);height:100%'><b>{p_type_display}</b><br><b>{row['專案']}</b><br><small>{status_text}</small></div>"})
-                        
-                        pm_cards.sort(key=lambda x: x['days'])
+                        # [V73] 下一階段直接查表 (依 (資料版本, 日期) 快取)
+                        pm_card_html = pm_cards(pm_projects, milestone_next, day_unit)
                         cols = st.columns(3)
-                        for i, card in enumerate(pm_cards):
-                            with cols[i % 3]: st.markdown(card['html'], unsafe_allow_html=True)
+                        for i, card in enumerate(pm_card_html):
+                            with cols[i % 3]: st.markdown(card, unsafe_allow_html=True)
                     else:
                         st.info("此 PM 目前無專案")
 
+            # [V80] PM × ISO 週 工作負荷熱圖 (單一 Heatmap trace)
+            pm_load_expander = st.expander("🗓️ PM 週負荷熱圖 (Workload Heatmap by ISO Week)", expanded=False, key="pm_load_expander", on_change="rerun")
+            with pm_load_expander:
+                if pm_load_expander.open:
+                    c_mode, c_weeks = st.columns([2, 1])
+                    load_mode = c_mode.radio("計算內容", ["里程碑 + 進行中階段", "僅里程碑", "僅進行中階段"], horizontal=True, key="pm_load_mode")
+                    load_weeks = c_weeks.slider("顯示週數", min_value=12, max_value=156, value=52, step=4, key="pm_load_weeks")
+                    first_week = int(week_ordinals([today])[0]) - 4
+                    pm_rows = pd.DataFrame({'PM': df_chart_source['專案負責人_display']}, index=df_chart_source.index)
+                    pm_rows = pm_rows[~df_chart_source.duplicated(subset=['專案負責人_display', '專案']).to_numpy()]
+                    load_pms, load_milestones, load_phases = build_pm_week_load(milestone_cal, pm_rows, data_version, filter_signature, first_week, load_weeks)
+                    load_matrix = {"僅里程碑": load_milestones, "僅進行中階段": load_phases}.get(load_mode, load_milestones + load_phases)
+
+                    week_mondays = pd.to_datetime((np.arange(first_week, first_week + load_weeks) * 7 - 3).astype('datetime64[D]'))
+                    week_labels = [get_week_str(d) for d in week_mondays]
+                    fig_load = go.Figure(go.Heatmap(
+                        z=load_matrix, x=week_labels, y=load_pms, colorscale='YlOrRd', zmin=0,
+                        customdata=np.broadcast_to(week_mondays.strftime('%Y-%m-%d').to_numpy(), load_matrix.shape),
+                        hovertemplate="%{y}<br>%{x} (週一 %{customdata})<br>負荷: %{z}<extra></extra>", colorbar=dict(title="數量")
+                    ))
+                    fig_load.update_layout(xaxis=dict(type='category', tickangle=-45, nticks=26), yaxis=dict(autorange='reversed'),
+                                           height=max(300, 120 + len(load_pms) * 22), margin=dict(t=30))
+                    st.plotly_chart(fig_load, use_container_width=True)
+                    st.caption(f"第 5 欄為本週 ({get_week_str(today)})；進行中階段 = {'、'.join(f'{a}→{b}' for a, b in zip(stage_chain, stage_chain[1:])) or '無'} 區間涵蓋的週")
+
     st.divider()
 
     # =========================================================================
@@ -425,204 +1199,61 @@ if uploaded_file is not None:
     current_types = open_type_filter if open_type_filter else ["全部"]
     type_label = ", ".join(current_types)
     st.subheader(f"🚀 專案研發全週期路徑圖 (Roadmap) - 類別: [{type_label}]")
-    
-    show_schedules = st.checkbox("👁️ 顯示所有節點時程 (Show All Node Schedules)", value=False)
+
+
+    # [V84] 時間粒度 (週/月/季) 與泳道分組：收合的泳道只畫彙總區間，展開的泳道才畫到專案層級
+    lane_options = ["不分組"] + [c for c in ['專案負責人', '開案類別', cat_col_name] if c and c in df_chart_source.columns]
+    rm_col1, rm_col2, rm_col3 = st.columns([1, 1, 2])
+    with rm_col1:
+        roadmap_granularity = st.radio("時間粒度", list(ROADMAP_GRANULARITIES), format_func=ROADMAP_GRANULARITIES.get,
+                                       horizontal=True, key="roadmap_granularity")
+    with rm_col2:
+        roadmap_lane = st.selectbox("泳道分組", lane_options, key="roadmap_lane")
+    roadmap_lane_col = None if roadmap_lane == "不分組" else roadmap_lane
+    roadmap_expanded = []
+    if roadmap_lane_col:
+        with rm_col3:
+            lane_values = sorted(lane_labels(df_chart_source[roadmap_lane_col]).unique())
+            roadmap_expanded = st.multiselect("展開泳道 (其餘僅顯示彙總)", lane_values, key=f"roadmap_expand_{roadmap_lane_col}")
+    roadmap_page, page_size = None, None
     
     if not df_chart_source.empty:
         try:
-            plot_data = []
-            
             df_roadmap_unique = df_chart_source.drop_duplicates(subset=['專案'])
-            
-            start_col = None
-            possible_start_cols = ['開案時間', '开案时间', 'NPDR開案時間', 'NPDR开案时间', 'NPDR']
-            for col in possible_start_cols:
-                if col in df_roadmap_unique.columns:
-                    start_col = col
-                    break
-            if not start_col: start_col = '開案時間'
-
-            col_map = {'NPDR': start_col, 'DV': '設計驗證時間', 'EV': '工程驗證時間', 'Order': '預計訂單起始點'}
-            available_cols = {k: v for k, v in col_map.items() if v in df_roadmap_unique.columns}
-            
-            all_active_weeks = set() 
-            current_date = pd.Timestamp.now().normalize()
-            current_week_str = get_week_str(current_date)
-            all_active_weeks.add(current_week_str) 
-
-            if available_cols:
-                for idx, row in df_roadmap_unique.iterrows():
-                    dates = {}
-                    for key in ['NPDR', 'DV', 'EV']:
-                        if key in available_cols:
-                            dt = pd.to_datetime(row[available_cols[key]], errors='coerce')
-                            if pd.notnull(dt): 
-                                dates[key] = dt
-                                all_active_weeks.add(get_week_str(dt))
-                    
-                    if 'Order' in available_cols:
-                        raw_order = row[available_cols['Order']]
-                        dt_order = parse_quarter_date_end(raw_order)
-                        if pd.isnull(dt_order): dt_order = pd.to_datetime(raw_order, errors='coerce')
-                        if pd.notnull(dt_order): 
-                            dates['Order'] = dt_order
-                            all_active_weeks.add(get_week_str(dt_order))
-
-                    if dates:
-                        sorted_points = sorted(dates.items(), key=lambda x: x[1])
-                        plot_data.append({
-                            '專案': row['專案'], 
-                            'dates': dates, 
-                            'sorted_points': sorted_points,
-                            'min_week': get_week_str(sorted_points[0][1]),
-                            'has_data': True
-                        })
+
+            # [V85] 分頁模式 (不分組時)：依路徑圖排序每頁 N 個專案，只建立並傳送目前頁面的 trace
+            if roadmap_lane_col is None and column_schema['stages']:
+                n_roadmap = len(df_roadmap_unique)
+                if st.checkbox(f"📄 分頁顯示 (共 {n_roadmap} 個專案)", value=n_roadmap > ROADMAP_PAGING_THRESHOLD, key="roadmap_paging"):
+                    roadmap_order_pos = build_roadmap_order(df_roadmap_unique, data_version, filter_signature, today, roadmap_granularity)
+                    ordered_projects = df_roadmap_unique['專案'].iloc[roadmap_order_pos].astype(str).tolist()
+                    pg_col1, pg_col2, pg_col3 = st.columns([1, 1, 2])
+                    page_size = pg_col1.number_input("每頁專案數", min_value=10, max_value=200, value=ROADMAP_PAGE_SIZE, step=10, key="roadmap_page_size")
+                    n_pages = max(1, -(-n_roadmap // page_size))
+                    if st.session_state.get('roadmap_page', 1) > n_pages:
+                        st.session_state['roadmap_page'] = n_pages
+                    roadmap_page = pg_col2.number_input(f"頁碼 (共 {n_pages} 頁)", min_value=1, max_value=n_pages, step=1, key="roadmap_page")
+                    pg_col3.selectbox("🔎 跳至專案", [""] + ordered_projects, key="roadmap_jump",
+                                      on_change=jump_to_roadmap_project, args=(ordered_projects, page_size))
+                    first_pos = (roadmap_page - 1) * page_size
+                    st.caption(f"第 {roadmap_page}/{n_pages} 頁：專案 {first_pos + 1}–{min(first_pos + page_size, n_roadmap)} / {n_roadmap} (依最早節點排序)")
+
+            if column_schema['stages']:
+                roadmap_key = ('roadmap', data_version, filter_signature, today, roadmap_granularity,
+                               roadmap_lane_col, tuple(roadmap_expanded), roadmap_page, page_size)
+                fig = figure_cache.get(roadmap_key)
+                if fig is None:
+                    if roadmap_page is not None:
+                        fig = build_roadmap_page(df_roadmap_unique, data_version, filter_signature, today, roadmap_granularity,
+                                                 roadmap_page, page_size)
                     else:
-                        plot_data.append({
-                            '專案': row['專案'], 
-                            'dates': {}, 
-                            'sorted_points': [],
-                            'min_week': current_week_str,
-                            'has_data': False
-                        })
-
-                if plot_data:
-                    sorted_weeks = sorted(list(all_active_weeks))
-                    plot_data.sort(key=lambda x: x['min_week'])
-
-                    fig = go.Figure()
-                    
-                    def get_line_color(start_node, end_node):
-                        if end_node == 'DV': return '#F39C12'
-                        if end_node == 'EV': return '#9B59B6'
-                        if end_node == 'Order': return '#2ECC71'
-                        if start_node == 'NPDR' and end_node == 'DV': return '#F39C12'
-                        if start_node == 'DV' and end_node == 'EV':   return '#9B59B6'
-                        return '#7F8C8D'
-
-                    # [V60] 1. 繪製連線
-                    for p in plot_data:
-                        if not p['has_data']: continue 
-                        
-                        points = p['sorted_points']
-                        if len(points) < 2: continue
-                            
-                        for i in range(len(points) - 1):
-                            start_node, start_date = points[i]
-                            end_node, end_date = points[i+1]
-                            start_week = get_week_str(start_date)
-                            end_week = get_week_str(end_date)
-                            days_remaining = (end_date - current_date).days
-                            weeks_remaining = days_remaining / 7.0
-                            days_elapsed = (current_date - start_date).days
-                            weeks_elapsed = days_elapsed / 7.0
-
-                            hover_lines = [f"<b>{p['專案']} ({start_node} ➔ {end_node})</b>"]
-                            if days_remaining > 0:
-                                hover_lines.append(f"⏳ 距 {end_node} 剩下: <b>{weeks_remaining:.1f} 週 ({days_remaining} 天)</b>")
-                            else:
-                                hover_lines.append(f"✅ {end_node} 已完成/過期 ({abs(weeks_remaining):.1f} 週前)")
-                            
-                            if start_node == 'NPDR' and days_elapsed > 0:
-                                hover_lines.append(f"🚩 距 NPDR 開案已過: <b>{weeks_elapsed:.1f} 週 ({days_elapsed} 天)</b>")
-
-                            hover_lines.append(f"<span style='font-size:12px; color:gray'>({start_date.strftime('%Y.%m.%d')} - {end_date.strftime('%Y.%m.%d')})</span>")
-                            hover_txt = "<br>".join(hover_lines)
-                            
-                            x_trace = [start_week]
-                            try:
-                                start_idx = sorted_weeks.index(start_week)
-                                end_idx = sorted_weeks.index(end_week)
-                                if end_idx > start_idx + 1:
-                                    x_trace.extend(sorted_weeks[start_idx+1 : end_idx])
-                            except: pass
-                            x_trace.append(end_week)
-                            y_trace = [p['專案']] * len(x_trace)
-                            text_trace = [hover_txt] * len(x_trace)
-                            line_color = get_line_color(start_node, end_node)
-
-                            fig.add_trace(go.Scatter(
-                                x=x_trace, y=y_trace, mode='lines+markers',
-                                marker=dict(opacity=0, size=10),
-                                line=dict(color=line_color, width=6), 
-                                text=text_trace, hovertemplate="%{text}<extra></extra>", showlegend=False
-                            ))
-                    
-                    # [V60] 2. 繪製標準節點
-                    markers_config = {
-                        'NPDR':  {'color': '#2E86C1', 'symbol': 'circle', 'name': 'NPDR 開案'},
-                        'DV':    {'color': '#F39C12', 'symbol': 'diamond', 'name': '設計驗證 (DV)'},
-                        'EV':    {'color': '#9B59B6', 'symbol': 'square', 'name': '工程驗證 (EV)'},
-                        'Order': {'color': '#27AE60', 'symbol': 'star', 'name': '預計訂單 (Order)', 'size': 14}
-                    }
-
-                    for key, config in markers_config.items():
-                        x_vals, y_vals, texts, hover_texts = [], [], [], []
-                        for p in plot_data:
-                            if not p['has_data']: continue
-                            
-                            if key in p['dates']:
-                                dt = p['dates'][key]
-                                x_vals.append(get_week_str(dt))
-                                y_vals.append(p['專案'])
-                                date_display = dt.strftime("%Y.%m.%d")
-                                diff_days = (dt - current_date).days
-                                diff_weeks = diff_days / 7.0
-                                
-                                if diff_days > 0:
-                                    time_status = f"(再 {diff_weeks:.1f} 週 / {diff_days} 天)"
-                                else:
-                                    time_status = f"(已過 {abs(diff_weeks):.1f} 週 / {abs(diff_days)} 天)"
-                                
-                                hover_content = f"<b>{p['專案']} - {config['name']}</b><br>日期: {date_display} {time_status}"
-                                hover_texts.append(hover_content)
-                                texts.append(f"{date_display}" if show_schedules else "")
-
-                        if x_vals:
-                            mode_setting = 'markers+text' if show_schedules else 'markers'
-                            fig.add_trace(go.Scatter(
-                                x=x_vals, y=y_vals, mode=mode_setting,
-                                marker=dict(color=config['color'], symbol=config['symbol'], size=config.get('size', 10), line=dict(width=2, color='white')),
-                                name=config['name'], text=texts, hovertext=hover_texts, hoverinfo="text", textposition="bottom center"
-                            ))
-                    
-                    # [V60] 3. 繪製 "規劃中" 沙漏
-                    planning_x, planning_y, planning_hover = [], [], []
-                    for p in plot_data:
-                        if 'NPDR' not in p['dates']:
-                            planning_x.append(current_week_str) 
-                            planning_y.append(p['專案'])
-                            planning_hover.append(f"<b>{p['專案']}</b><br>⏳ 時程規劃中 (待提供)<br><span style='color:gray; font-size:0.8em'>請 PM 盡快補齊時程</span>")
-                    
-                    if planning_x:
-                        fig.add_trace(go.Scatter(
-                            x=planning_x, 
-                            y=planning_y, 
-                            mode='markers', 
-                            marker=dict(color='#95A5A6', symbol='hourglass', size=12, line=dict(width=1, color='#7F8C8D')), 
-                            name='⏳ 規劃中 (待提供)', 
-                            hovertext=planning_hover, 
-                            hoverinfo="text"
-                        ))
-
-                    legend_items = [("🟦 NPDR開案", '#2E86C1'), ("🟧 標準設計 (往DV)", '#F39C12'), ("🟪 標準工程 (往EV)", '#9B59B6'), ("🟩 標準導入 (往Order)", '#2ECC71'), ("⬜ 其他路徑", '#7F8C8D'), ("⏳ 規劃中", '#95A5A6')]
-                    for name, color in legend_items:
-                         fig.add_trace(go.Scatter(x=[None], y=[None], mode='lines', line=dict(color=color, width=6), name=name))
-                    
-                    fig.add_vline(x=current_week_str, line_width=2, line_dash="dash", line_color="#E74C3C", opacity=0.8)
-                    fig.add_annotation(x=current_week_str, y=1.02, yref='paper', text=f"📍 本週 ({current_week_str})", showarrow=False, font=dict(color="#E74C3C", size=12, weight="bold"), bgcolor="rgba(255, 255, 255, 0.8)", bordercolor="#E74C3C")
-
-                    try:
-                        current_week_idx = sorted_weeks.index(current_week_str)
-                        start_idx_view = max(0, current_week_idx - 1) 
-                        end_idx_view = len(sorted_weeks) - 1
-                    except:
-                        start_idx_view = 0
-                        end_idx_view = len(sorted_weeks) - 1
-
-                    chart_height = max(400, 150 + (len(plot_data) * 45))
-                    fig.update_layout(xaxis=dict(title="時間軸 (週次)", type='category', categoryorder='array', categoryarray=sorted_weeks, tickangle=-45, range=[start_idx_view - 0.5, end_idx_view + 0.5]), yaxis=dict(title="專案", autorange="reversed"), legend=dict(orientation="h", yanchor="bottom", y=1.05, xanchor="center", x=0.5), margin=dict(l=0, r=0, t=80, b=20), height=chart_height, hoverlabel=dict(bgcolor="white", font_size=14, font_family="Arial"))
+                        fig = roadmap_figure(df_roadmap_unique, today, granularity=roadmap_granularity,
+                                             lane_col=roadmap_lane_col, expanded_lanes=roadmap_expanded)
+                    if fig is not None:
+                        figure_cache.put(roadmap_key, fig)
+                if fig is not None:
                     st.plotly_chart(fig, use_container_width=True)
+                    report_figures['🚀 專案研發全週期路徑圖 (Roadmap)'] = fig
                 else:
                     st.info("篩選後無有效時間資料，無法繪製路徑圖。")
             else:
@@ -639,203 +1270,453 @@ if uploaded_file is not None:
     # =========================================================================
     st.divider()
     with st.expander("⏳ 預計訂單即將到期 Top 10 (Countdown to Order) - By Project Deadline", expanded=True):
-        st.markdown("""
-        <span style='background-color:#E74C3C; padding:2px 6px; border-radius:4px; color:white; font-size:0.8em'>🔴 緊急 (≤30天/已過期)</span>
-        <span style='background-color:#F1C40F; padding:2px 6px; border-radius:4px; color:black; font-size:0.8em; margin-left:5px'>🟡 注意 (31~90天)</span>
-        <span style='background-color:#2ECC71; padding:2px 6px; border-radius:4px; color:white; font-size:0.8em; margin-left:5px'>🟢 充裕 (>90天)</span>
+        st.markdown(f"""
+        <span style='background-color:#E74C3C; padding:2px 6px; border-radius:4px; color:white; font-size:0.8em'>🔴 緊急 (≤30{day_unit}/已過期)</span>
+        <span style='background-color:#F1C40F; padding:2px 6px; border-radius:4px; color:black; font-size:0.8em; margin-left:5px'>🟡 注意 (31~90{day_unit})</span>
+        <span style='background-color:#2ECC71; padding:2px 6px; border-radius:4px; color:white; font-size:0.8em; margin-left:5px'>🟢 充裕 (>90{day_unit})</span>
         """, unsafe_allow_html=True)
         
-        if '預計訂單起始點' in df_chart_source.columns:
-            cols_to_keep = ['專案', '預計訂單起始點', col_twd]
-            if col_rmb: cols_to_keep.append(col_rmb)
-            if '專案負責人' in df_chart_source.columns: cols_to_keep.append('專案負責人')
-            
-            df_time = df_chart_source[cols_to_keep].copy()
-            
-            def convert_date_for_chart(x):
-                d = parse_quarter_date_end(x)
-                if pd.isnull(d): d = pd.to_datetime(x, errors='coerce')
-                return d
-            
-            df_time['OrderDate'] = df_time['預計訂單起始點'].apply(convert_date_for_chart)
-            df_time = df_time.dropna(subset=['OrderDate'])
-            
-            # Group by Revenue first
-            grp_cols = ['專案']
-            df_rev_agg = df_chart_source.groupby(grp_cols)[[col_twd, col_rmb] if col_rmb else [col_twd]].sum().reset_index()
-            
-            # Deduplicate by earliest date
-            df_time_dedup = df_time.sort_values('OrderDate').drop_duplicates(subset=['專案'], keep='first')
-            
-            # Merge
-            df_final = pd.merge(df_time_dedup, df_rev_agg, on='專案', how='left', suffixes=('', '_sum'))
-            
-            twd_col_sum = f"{col_twd}_sum" if f"{col_twd}_sum" in df_final.columns else col_twd
-            rmb_col_sum = f"{col_rmb}_sum" if col_rmb and f"{col_rmb}_sum" in df_final.columns else col_rmb
-            
-            if not df_final.empty:
-                now = pd.Timestamp.now().normalize()
-                df_final['DaysDiff'] = (df_final['OrderDate'] - now).dt.days
-                
-                # [V65.4 Logic] Calulate Total Rev for Sorting
-                df_final['Total_Revenue_Sort'] = df_final[twd_col_sum].fillna(0) + (df_final[rmb_col_sum].fillna(0) * rmb_rate if rmb_col_sum else 0)
+        if order_col in df_chart_source.columns:
+            countdown_key = ('countdown', data_version, filter_signature, float(rmb_rate), today, busday_config)
+            fig_time = figure_cache.get(countdown_key)
+            if fig_time is None:
+                if use_duckdb:
+                    # [V68] 每專案取最早訂單日 + 營收加總，未到期篩選、排序與 Top 10 於 DuckDB 完成
+                    duck_now = today
+                    busday_cte, busday_join, rank_col, busday_params = "", "", "days_diff", []
+                    if busday_config:
+                        # [V74] 工作天模式依工作天數排序 (週末與下週一同為一天，改比營收)：
+                        # 先取未到期的訂單日期，以 numpy 算出工作天數後以 list 參數帶回 SQL
+                        order_days = duckdb_query(duck_con, f"SELECT DISTINCT CAST(order_date AS DATE) AS day FROM portfolio "
+                                                            f"WHERE {duck_where} AND order_date >= CAST(? AS TIMESTAMP)", duck_params + [duck_now])['day']
+                        busday_cte = ", bd AS (SELECT UNNEST(?::DATE[]) AS day, UNNEST(?::BIGINT[]) AS busdays)"
+                        busday_join = " JOIN bd ON bd.day = CAST(o.order_date AS DATE)"
+                        rank_col = "bd.busdays"
+                        busday_params = [pd.to_datetime(order_days).dt.strftime('%Y-%m-%d').tolist(),
+                                         business_days_from(today, order_days, busday_config).tolist()]
+                    df_final = duckdb_query(duck_con, f"""
+                        WITH f AS (SELECT * FROM portfolio WHERE {duck_where}),
+                        rev AS (SELECT project, SUM(twd) AS twd_sum, SUM(rmb) AS rmb_sum FROM f GROUP BY project),
+                        first_order AS (
+                            SELECT project, order_raw, pm, order_date, twd, rmb,
+                                   ROW_NUMBER() OVER (PARTITION BY project ORDER BY order_date, row_id) AS rn
+                            FROM f WHERE order_date IS NOT NULL
+                        ){busday_cte}
+                        SELECT o.project, o.order_raw, o.twd, o.rmb, o.pm, o.order_date, r.twd_sum, r.rmb_sum,
+                               date_diff('day', CAST(? AS TIMESTAMP), o.order_date) AS days_diff,
+                               r.twd_sum + r.rmb_sum * ? AS total_rev
+                        FROM first_order o JOIN rev r USING (project){busday_join}
+                        WHERE o.rn = 1 AND o.order_date >= CAST(? AS TIMESTAMP)
+                        ORDER BY {rank_col}, total_rev DESC, o.project LIMIT 10""",
+                        duck_params + busday_params + [duck_now, rmb_rate, duck_now])
+                    df_final.columns = ['專案', order_col, col_twd, col_rmb or '_rmb', '專案負責人', 'OrderDate',
+                                        f"{col_twd}_sum", f"{col_rmb}_sum" if col_rmb else '_rmb_sum', 'DaysDiff', 'Total_Revenue_Sort']
+                    twd_col_sum = f"{col_twd}_sum"
+                    rmb_col_sum = f"{col_rmb}_sum" if col_rmb else None
+                    df_final['CalDays'] = df_final['DaysDiff']
+                    if busday_config and not df_final.empty:
+                        df_final['DaysDiff'] = business_days_from(today, df_final['OrderDate'], busday_config)
+                else:
+                    # [V73] 訂單日期與 DaysDiff 取自里程碑日曆快取 (同一天內不重算)
+                    df_final, twd_col_sum, rmb_col_sum = order_countdown_table(df_chart_source, milestone_cal, col_twd, col_rmb, order_col)
 
-                # [V65.2] Logic: Filter out past due
-                df_final = df_final[df_final['DaysDiff'] >= 0]
-                
-                if df_final.empty:
-                    st.success("🎉 目前沒有即將到期的緊急訂單！ (所有專案皆已過期或無資料)")
+                # DuckDB 只回傳未到期訂單：空結果交由 countdown_figure 顯示「沒有即將到期」
+                if df_final.empty and not use_duckdb:
+                    st.info("目前篩選範圍內無有效的預計訂單日期資料。")
                 else:
-                    # [V65.4] Dual Sort: Days (Asc) -> Revenue (Desc)
-                    df_final = df_final.sort_values(by=['DaysDiff', 'Total_Revenue_Sort'], ascending=[True, False])
-                    
-                    # Take Strict Top 10
-                    df_plot = df_final.head(10).copy()
-                    
-                    # Reverse for Plotly (Bottom-Up)
-                    df_plot = df_plot.sort_values(by=['DaysDiff', 'Total_Revenue_Sort'], ascending=[False, True])
-                    
-                    # [V65.3] Visual Buffer for 0 days
-                    max_val = df_plot['DaysDiff'].max()
-                    visual_buffer = max(1, max_val * 0.02) if max_val > 0 else 1
-                    df_plot['Plot_Value'] = df_plot['DaysDiff'].replace(0, visual_buffer)
-
-                    def get_status_color(days):
-                        if days <= 30: return '#E74C3C'
-                        elif days <= 90: return '#F1C40F'
-                        else: return '#2ECC71'
-                    
-                    df_plot['Color'] = df_plot['DaysDiff'].apply(get_status_color)
-                    
-                    def get_label(row):
-                        pm = row.get('專案負責人', '')
-                        pm_txt = f" ({pm})" if pd.notnull(pm) and str(pm) else ""
-                        return f"{row['專案']}{pm_txt}"
-                    
-                    df_plot['Y_Label'] = df_plot.apply(get_label, axis=1)
-                    
-                    def get_bar_text(row):
-                        if row['DaysDiff'] == 0:
-                            return f"{row['OrderDate'].strftime('%Y-%m-%d')} (🔥 本日到期！)"
-                        else:
-                            return f"{row['OrderDate'].strftime('%Y-%m-%d')} (剩 {abs(row['DaysDiff'])} 天)"
-                    
-                    df_plot['Bar_Text'] = df_plot.apply(get_bar_text, axis=1)
-                    
-                    def get_rev_text(row):
-                        parts = []
-                        twd = row.get(twd_col_sum, 0)
-                        rmb = row.get(rmb_col_sum, 0) if rmb_col_sum else 0
-                        if twd > 0: parts.append(f"TWD {twd:,.0f}")
-                        if rmb > 0: parts.append(f"RMB {rmb:,.0f}")
-                        return f"<b>💰 {' | '.join(parts)}</b>" if parts else ""
-                    
-                    df_plot['Text_Rev'] = df_plot.apply(get_rev_text, axis=1)
-                    
-                    # Hybrid Positioning
-                    threshold = max_val * 0.15 if max_val > 0 else 0
-                    
-                    final_bar_text = []
-                    final_bar_pos = []
-                    final_scatter_text = []
-                    
-                    for idx, row in df_plot.iterrows():
-                        if row['Plot_Value'] > threshold:
-                            final_bar_text.append(row['Bar_Text'])
-                            final_bar_pos.append('inside')
-                            final_scatter_text.append(row['Text_Rev'])
-                        else:
-                            final_bar_text.append("") 
-                            final_bar_pos.append('none')
-                            combined = f"{row['Bar_Text']}   {row['Text_Rev']}"
-                            final_scatter_text.append(combined)
-                            
-                    fig_time = go.Figure()
-
-                    fig_time.add_trace(go.Bar(
-                        x=df_plot['Plot_Value'],
-                        y=df_plot['Y_Label'],
-                        orientation='h',
-                        marker_color=df_plot['Color'],
-                        text=final_bar_text,
-                        textposition=final_bar_pos, 
-                        name='Days',
-                        hoverinfo='y+text'
-                    ))
+                    fig_time = countdown_figure(df_final, twd_col_sum, rmb_col_sum, rmb_rate, today, day_unit)
+                    if fig_time is None:
+                        st.success("🎉 目前沒有即將到期的緊急訂單！ (所有專案皆已過期或無資料)")
+                    else:
+                        figure_cache.put(countdown_key, fig_time)
+            if fig_time is not None:
+                st.plotly_chart(fig_time, use_container_width=True)
+                report_figures['⏳ 預計訂單即將到期 Top 10 (Countdown to Order)'] = fig_time
+        else:
+            st.warning(f"缺少 '{order_col}' 欄位")
 
-                    fig_time.add_trace(go.Scatter(
-                        x=df_plot['Plot_Value'],
-                        y=df_plot['Y_Label'],
-                        mode='text',
-                        text=final_scatter_text,
-                        textposition='middle right',
-                        textfont=dict(color='#333333', size=13),
-                        showlegend=False,
-                        cliponaxis=False
-                    ))
+    # =========================================================================
+    # [區塊 4] & [區塊 5]
+    # =========================================================================
+    if not df_chart_source.empty:
+        # [V87] 展開時才聚合與建圖 (on_change="rerun" 讓 expander 回報開合狀態)；產生主管報告的那次 rerun 也會建圖以納入報告
+        charts_expander = st.expander("📊 圖表分析 (產品類別 & 市場應用) - 點擊展開", expanded=False, key="charts_expander", on_change="rerun")
+        with charts_expander:
+            if charts_expander.open or st.session_state.get('exec_report_build'):
+                row2_col1, row2_col2 = st.columns(2)
+
+                with row2_col1:
+                    st.subheader("📌 各產品類別營收分佈")
+                    if total_revenue_twd > 0 and cat_col_name:
+                        pie_key = ('pie', data_version, filter_signature, float(rmb_rate), cat_col_name)
+                        fig_pie = figure_cache.get(pie_key)
+                        if fig_pie is None:
+                            if revenue_rollup is not None and revenue_rollup['category'] is not None:
+                                df_category = revenue_rollup['category']
+                            else:
+                                df_category = duckdb_query(duck_con, f"""
+                                    SELECT category AS "{cat_col_name}", SUM(twd + rmb * ?) AS Calculated_Total_TWD
+                                    FROM portfolio WHERE {duck_where} AND category IS NOT NULL
+                                    GROUP BY category ORDER BY MIN(row_id)""", [rmb_rate] + duck_params)
+                            fig_pie = px.pie(df_category, values='Calculated_Total_TWD', names=cat_col_name, hole=0.4, title=f'各{cat_col_name}營收分佈 (含RMB)')
+                            fig_pie.update_traces(textposition='inside', textinfo='percent+label')
+                            fig_pie.update_layout(showlegend=True, legend=dict(orientation="h", y=-0.1))
+                            figure_cache.put(pie_key, fig_pie)
+                        st.plotly_chart(fig_pie, use_container_width=True)
+                        report_figures['📌 各產品類別營收分佈'] = fig_pie
+                    elif not cat_col_name:
+                        st.info("無 '產品類別' (或 '專案類別') 欄位，無法繪製圓餅圖")
+                    else:
+                        st.info("營收總和為 0")
+
+                with row2_col2:
+                    st.subheader("🌍 市場 x 應用場景")
+                    if total_revenue_twd > 0 and '市場' in df_chart_source.columns and '產業應用場景' in df_chart_source.columns:
+                        market_key = ('market', data_version, filter_signature, float(rmb_rate))
+                        fig_market = figure_cache.get(market_key)
+                        if fig_market is None:
+                            if revenue_rollup is not None:
+                                df_market = revenue_rollup['market']
+                            else:
+                                df_market = duckdb_query(duck_con, f"""
+                                    SELECT market AS 市場, scene AS 產業應用場景, SUM(twd + rmb * ?) AS Calculated_Total_TWD
+                                    FROM portfolio WHERE {duck_where} AND market IS NOT NULL AND scene IS NOT NULL
+                                    GROUP BY market, scene ORDER BY market, scene""", [rmb_rate] + duck_params)
+                            fig_market = px.bar(df_market, x='市場', y='Calculated_Total_TWD', color='產業應用場景', barmode='stack', text_auto=',.0f', title='各地區市場應用 (含RMB)')
+                            figure_cache.put(market_key, fig_market)
+                        st.plotly_chart(fig_market, use_container_width=True)
+                        report_figures['🌍 市場 x 應用場景'] = fig_market
+                    elif '市場' not in df_chart_source.columns or '產業應用場景' not in df_chart_source.columns:
+                        st.info("缺少 '市場' 或 '產業應用場景' 欄位，無法繪製市場圖")
+                    else:
+                        st.info("無營收數據")
 
-                    today_str = now.strftime('%Y-%m-%d')
-                    fig_time.add_vline(x=0, line_width=2, line_dash="dash", line_color="#E74C3C")
-                    fig_time.add_annotation(
-                        x=0, y=1.02, yref='paper', 
-                        text=f"📍 本日 ({today_str})", 
-                        showarrow=False, 
-                        font=dict(color="#E74C3C", size=12, weight="bold"), 
-                        bgcolor="rgba(255, 255, 255, 0.8)", 
-                        bordercolor="#E74C3C"
+    # =========================================================================
+    # [區塊 11] 預計訂單營收時程 (V66: PeriodIndex 季/月分桶 + 累計線)
+    # =========================================================================
+    st.divider()
+    timeline_expander = st.expander("📅 預計訂單營收時程 (Revenue Timeline) - 點擊展開", expanded=False, key="timeline_expander", on_change="rerun")
+    with timeline_expander:
+        if timeline_expander.open:
+            if order_col in df_chart_source.columns:
+                freq_label = st.radio("時間粒度", ["季 (Quarter)", "月 (Month)"], horizontal=True, key="timeline_freq")
+                freq = 'Q' if freq_label.startswith("季") else 'M'
+
+                order_table = build_order_revenue_table(df_full, data_version, order_col, col_twd, col_rmb)
+                order_table_view = order_table.reindex(df_chart_source.index).dropna(subset=['OrderDate'])
+                df_period = aggregate_revenue_by_period(order_table_view, data_version, filter_signature, freq)
+
+                if not df_period.empty:
+                    # [V78] 可改用季度匯率表 (各期以期初生效匯率換算 RMB)
+                    period_rate = rmb_rate
+                    if os.path.exists(RATE_TABLE_PATH) and st.checkbox("套用季度匯率表", key="timeline_rate_table"):
+                        period_rate = rates_for_dates(df_period.index.start_time, load_rate_table(), rmb_rate)
+                    period_total = df_period['TWD'] + df_period['RMB'] * period_rate
+                    period_labels = df_period.index.astype(str)
+
+                    fig_timeline = go.Figure()
+                    fig_timeline.add_trace(go.Bar(
+                        x=period_labels, y=period_total, name='當期營收 (含RMB)',
+                        marker_color='#27AE60', hovertemplate="%{x}<br>當期: %{y:,.0f}<extra></extra>"
+                    ))
+                    fig_timeline.add_trace(go.Scatter(
+                        x=period_labels, y=period_total.cumsum(), name='累計營收', mode='lines+markers',
+                        line=dict(color='#2E86C1', width=3), yaxis='y2',
+                        hovertemplate="%{x}<br>累計: %{y:,.0f}<extra></extra>"
+                    ))
+                    fig_timeline.update_layout(
+                        xaxis=dict(title="時間 (Quarter)" if freq == 'Q' else "時間 (Month)", type='category'),
+                        yaxis=dict(title="當期預估營收 (TWD)"),
+                        yaxis2=dict(title="累計預估營收 (TWD)", overlaying='y', side='right', showgrid=False),
+                        legend=dict(orientation="h", y=1.1), margin=dict(t=60)
                     )
+                    st.plotly_chart(fig_timeline, use_container_width=True)
+                else:
+                    st.info("目前篩選範圍內無有效的預計訂單日期資料。")
+            else:
+                st.warning(f"缺少 '{order_col}' 欄位")
 
-                    range_max = max_val * 1.35 if max_val > 0 else 10
-
-                    fig_time.update_layout(
-                        title='🚨 專案到期日戰情室',
-                        xaxis_title="距離預計訂單起始點 (天) - 依 時間急迫性 > 預估營收 排序",
-                        yaxis_title="專案 (負責人)",
-                        xaxis=dict(
-                            zeroline=True, 
-                            zerolinewidth=3, 
-                            zerolinecolor='#E74C3C',
-                            range=[0, range_max]
-                        ),
-                        height=max(400, 100 + (len(df_plot) * 40)),
-                        margin=dict(r=150, t=80)
-                    )
-                    
-                    st.plotly_chart(fig_time, use_container_width=True)
+    # =========================================================================
+    # [區塊 12] 客戶營收曝險 (V67: 目標客戶 bridge 聚合)
+    # =========================================================================
+    st.divider()
+    customer_expander = st.expander("🤝 客戶營收曝險 (Revenue Exposure by Customer) - 點擊展開", expanded=False, key="customer_expander", on_change="rerun")
+    with customer_expander:
+        if customer_expander.open:
+            if customer_bridge.empty:
+                st.info("無 '目標客戶1~5' 欄位，無法繪製客戶曝險圖")
+            else:
+                c_mode, c_top = st.columns([2, 1])
+                exposure_mode = c_mode.radio("營收計入方式", ["平均分攤 (Split)", "全額計入 (Count)"], horizontal=True, key="customer_exposure_mode",
+                                             help="平均分攤：營收依該列客戶數均分；全額計入：每位客戶皆計入該列全額營收")
+                top_n_customers = c_top.number_input("顯示前 N 名客戶", min_value=5, max_value=100, value=15, step=5)
+
+                bridge_view = customer_bridge[customer_bridge['row_id'].isin(df_chart_source.index)]
+                if not bridge_view.empty and total_revenue_twd > 0:
+                    row_rev = df_chart_source['Calculated_Total_TWD'].reindex(bridge_view['row_id']).to_numpy()
+                    if exposure_mode.startswith("平均"):
+                        row_rev = row_rev / bridge_view['n_customers'].to_numpy()
+                    df_exposure = pd.DataFrame({'客戶': bridge_view['客戶'].to_numpy(), '專案': bridge_view['專案'].to_numpy(), 'Exposure_TWD': row_rev})
+                    df_exposure = df_exposure.groupby('客戶', observed=True).agg(Exposure_TWD=('Exposure_TWD', 'sum'), 專案數=('專案', 'nunique')).reset_index()
+                    df_exposure = df_exposure.nlargest(int(top_n_customers), 'Exposure_TWD').sort_values('Exposure_TWD', ascending=True)
+                    fig_customer = px.bar(df_exposure, x='Exposure_TWD', y='客戶', orientation='h', text_auto=',.0f', color='Exposure_TWD',
+                                          color_continuous_scale='Purples', hover_data={'專案數': True})
+                    fig_customer.update_layout(xaxis_title="預估營收曝險 (含RMB換算)", yaxis_title="客戶", height=max(400, 100 + len(df_exposure) * 28))
+                    st.plotly_chart(fig_customer, use_container_width=True)
+                else:
+                    st.info("目前篩選範圍內無客戶營收資料")
+
+    # =========================================================================
+    # [區塊 13] 時程滑移分析 (V75: 歷史快照對齊 + 向量化 diff)
+    # =========================================================================
+    st.divider()
+    slippage_expander = st.expander("🐌 時程滑移分析 (Schedule Slippage) - 點擊展開", expanded=False, key="slippage_expander", on_change="rerun")
+    with slippage_expander:
+        if slippage_expander.open:
+            snapshot_manifest = load_snapshot_manifest()
+            if len(snapshot_manifest) < 2:
+                st.info(f"需至少 2 份歷史快照才能比較 (目前 {len(snapshot_manifest)} 份，每次上傳新檔案時自動儲存)")
             else:
-                st.info("目前篩選範圍內無有效的預計訂單日期資料。")
+                slip_history = build_slippage_history(tuple((item['file'], tuple(item['columns'])) for item in snapshot_manifest))
+                snapshot_labels = [f"{item['uploaded_at'][:10]} ({item['name']})" for item in snapshot_manifest]
+                c_stage, c_top = st.columns([2, 1])
+                slip_stages = c_stage.multiselect("納入里程碑", options=list(slip_history['stage'].unique()),
+                                                  default=list(slip_history['stage'].unique()), key="slip_stages")
+                top_n_slip = c_top.number_input("顯示前 N 名專案", min_value=5, max_value=100, value=15, step=5, key="slip_top_n")
+
+                slip_view = slip_history[slip_history['stage'].isin(slip_stages) & slip_history['專案'].isin(df_chart_source['專案'].astype(str))]
+                if slip_view.empty:
+                    st.info("目前篩選範圍內無可比較的里程碑資料")
+                else:
+                    st.caption(f"共 {len(snapshot_manifest)} 份快照：{snapshot_labels[0]} ~ {snapshot_labels[-1]}；滑移 = 最新日期 - 首次出現日期 (天)")
+                    latest = slip_view.drop_duplicates(subset=['專案', 'stage'], keep='last')
+                    df_rank = latest.pivot_table(index='專案', columns='stage', values='slip_days', aggfunc='first')
+                    df_rank['合計滑移 (天)'] = df_rank.sum(axis=1)
+                    df_rank['PM'] = latest.drop_duplicates(subset=['專案'], keep='last').set_index('專案')['PM']
+                    df_rank = df_rank.nlargest(int(top_n_slip), '合計滑移 (天)')
+                    st.markdown("**🏁 滑移最多的專案 (Most-Slipped Projects)**")
+                    st.dataframe(df_rank, use_container_width=True)
+
+                    pm_trend = slip_view.groupby(['snapshot', 'PM'])['slip_days'].mean().reset_index()
+                    pm_trend['快照'] = pm_trend['snapshot'].map(dict(enumerate(snapshot_labels)))
+                    fig_slip = px.line(pm_trend, x='快照', y='slip_days', color='PM', markers=True)
+                    fig_slip.update_layout(xaxis_title="快照 (上傳日期)", yaxis_title="平均累計滑移 (天)", xaxis=dict(type='category'),
+                                           legend=dict(orientation="h", y=-0.3))
+                    st.markdown("**📈 各 PM 平均滑移趨勢 (Slippage Trend by PM)**")
+                    st.plotly_chart(fig_slip, use_container_width=True)
+
+    # =========================================================================
+    # [區塊 14] 週變動報告 (V76: 兩版總表逐欄比對)
+    # =========================================================================
+    st.divider()
+    # 選擇基準的 widget 收合時仍保留 (上傳的檔案不會遺失)，讀檔與比對只在展開時執行
+    diff_expander = st.expander("🔁 週變動報告 (What Changed Since Last Week) - 點擊展開", expanded=False, key="diff_expander", on_change="rerun")
+    with diff_expander:
+        baseline_source = st.radio("比較基準", ["歷史快照", "上傳另一份檔案"], horizontal=True, key="diff_source")
+        df_baseline, baseline_version = None, None
+        if baseline_source == "歷史快照":
+            baseline_options = [item for item in load_snapshot_manifest() if item['hash'] != st.session_state.get('data_hash')]
+            if baseline_options:
+                baseline_item = st.selectbox("基準快照", options=baseline_options[::-1], key="diff_snapshot",
+                                             format_func=lambda item: f"{item['uploaded_at'].replace('T', ' ')} - {item['name']} ({item['rows']} 列)")
+                if diff_expander.open:
+                    df_baseline, baseline_version = load_snapshot_table(baseline_item['file']), baseline_item['hash']
+            else:
+                st.info("尚無其他歷史快照可比較")
         else:
-            st.warning("缺少必要欄位")
+            baseline_file = st.file_uploader("上傳比較基準檔 (例如上週版本)", type=["xlsx", "csv"], key="diff_file")
+            if baseline_file is not None and diff_expander.open:
+                baseline_version = hashlib.md5(baseline_file.getvalue()).hexdigest()[:12]
+                df_baseline = load_baseline_file(baseline_file, baseline_version)
+
+        if df_baseline is not None:
+            if '專案' not in df_baseline.columns:
+                st.error("比較基準檔缺少 '專案' 欄位")
+            else:
+                diff_result = diff_project_tables(df_baseline, df_full, baseline_version, data_version)
+                df_changes = diff_result['changes']
+
+                def table_revenue(df):
+                    twd = pd.to_numeric(df[col_twd], errors='coerce').sum() if col_twd in df.columns else 0
+                    rmb = pd.to_numeric(df[col_rmb], errors='coerce').sum() if col_rmb and col_rmb in df.columns else 0
+                    return twd + rmb * rmb_rate
+
+                d1, d2, d3, d4, d5 = st.columns(5)
+                d1.metric("➕ 新增專案列", len(diff_result['added']))
+                d2.metric("➖ 移除專案列", len(diff_result['removed']))
+                d3.metric("✏️ 有異動的專案", df_changes['專案'].nunique())
+                d4.metric("🧑‍💼 PM 異動", int((df_changes['類型'] == 'PM 異動').sum()))
+                revenue_delta = table_revenue(df_full) - table_revenue(df_baseline)
+                d5.metric("💰 營收變化 (TWD)", f"{table_revenue(df_full):,.0f}", delta=f"{revenue_delta:,.0f}")
+
+                tab_changes, tab_grid, tab_added, tab_removed = st.tabs(["異動明細", "異動標示表格", "新增", "移除"])
+                with tab_changes:
+                    change_types = st.multiselect("異動類型", options=['里程碑', '營收', 'PM 異動', '其他'],
+                                                  default=['里程碑', '營收', 'PM 異動', '其他'], key="diff_types")
+                    st.dataframe(df_changes[df_changes['類型'].isin(change_types)].astype({'舊值': str, '新值': str}),
+                                 use_container_width=True, hide_index=True)
+                with tab_grid:
+                    changed_rows = diff_result['changed_mask'].any(axis=1)
+                    grid_rows = diff_result['common_new'][changed_rows.to_numpy()]
+                    if grid_rows.empty:
+                        st.info("共同專案無任何欄位異動")
+                    else:
+                        grid_mask = diff_result['changed_mask'][changed_rows].reindex(columns=grid_rows.columns, fill_value=False)
+                        st.caption("🟨 黃底為相較基準版本有異動的儲存格")
+                        st.dataframe(grid_rows.style.apply(lambda _: np.where(grid_mask.to_numpy(), 'background-color: #FFF3CD', ''), axis=None),
+                                     use_container_width=True)
+                with tab_added:
+                    st.dataframe(diff_result['added'], use_container_width=True)
+                with tab_removed:
+                    st.dataframe(diff_result['removed'], use_container_width=True)
 
     # =========================================================================
-    # [區塊 4] & [區塊 5]
+    # [區塊 15] 營收風險模擬 (V77: Monte Carlo 滑移傳遞)
     # =========================================================================
-    if not df_chart_source.empty:
-        with st.expander("📊 圖表分析 (產品類別 & 市場應用) - 點擊展開", expanded=False):
-            row2_col1, row2_col2 = st.columns(2)
-
-            with row2_col1:
-                st.subheader("📌 各產品類別營收分佈")
-                if total_revenue_twd > 0 and cat_col_name:
-                    fig_pie = px.pie(df_chart_source, values='Calculated_Total_TWD', names=cat_col_name, hole=0.4, title=f'各{cat_col_name}營收分佈 (含RMB)')
-                    fig_pie.update_traces(textposition='inside', textinfo='percent+label')
-                    fig_pie.update_layout(showlegend=True, legend=dict(orientation="h", y=-0.1))
-                    st.plotly_chart(fig_pie, use_container_width=True)
-                elif not cat_col_name:
-                    st.info("無 '產品類別' (或 '專案類別') 欄位，無法繪製圓餅圖")
+    st.divider()
+    # 展開時才模擬 (on_change="rerun" 讓 expander 回報開合狀態，同 [V87] 圖表分析)
+    risk_expander = st.expander("🎲 營收風險模擬 (Monte Carlo Revenue-at-Risk) - 點擊展開", expanded=False, key="risk_expander", on_change="rerun")
+    with risk_expander:
+        if risk_expander.open:
+            if order_col not in df_chart_source.columns:
+                st.warning(f"缺少 '{order_col}' 欄位")
+            else:
+                sim_stages = list(column_schema['stages'])
+                sim_open_types = sorted(df_full[open_type_col].dropna().astype(str).unique()) if open_type_col in df_full.columns else ['全部']
+                c_src, c_trials, c_seed = st.columns([2, 1, 1])
+                param_source = c_src.radio("滑移參數來源", ["手動設定", "由快照歷史估計"], horizontal=True, key="sim_param_source")
+                n_trials = c_trials.number_input("模擬次數", min_value=1000, max_value=20000, value=5000, step=1000, key="sim_trials")
+                sim_seed = c_seed.number_input("亂數種子", min_value=0, value=42, step=1, key="sim_seed")
+
+                param_table = default_slip_param_table(sim_open_types, sim_stages)
+                if param_source == "由快照歷史估計":
+                    sim_manifest = load_snapshot_manifest()
+                    if len(sim_manifest) < 2:
+                        st.info("快照不足 2 份，暫以預設參數代替")
+                    else:
+                        sim_history = build_slippage_history(tuple((item['file'], tuple(item['columns'])) for item in sim_manifest))
+                        first_rows = df_full.drop_duplicates('專案')
+                        project_open_type = pd.Series(first_rows[open_type_col].astype(str).to_numpy() if open_type_col in df_full.columns else '全部',
+                                                      index=first_rows['專案'].astype(str))
+                        param_table = fit_slip_param_table(sim_history, project_open_type, sim_open_types, sim_stages)
+                sim_chain = stage_chain[:stage_chain.index('Order') + 1] if 'Order' in stage_chain else stage_chain
+                st.caption(f"各階段新增滑移天數 ~ max(0, 常態分佈)；已過的里程碑不再滑移，延遲沿 {'→'.join(sim_chain)} 累加至訂單日期")
+                param_table = st.data_editor(param_table, hide_index=True, use_container_width=True, disabled=['開案類別', '階段'],
+                                             key=f"sim_params_{param_source}")
+
+                sim_rows = pd.DataFrame({'專案': df_chart_source['專案'],
+                                         '開案類別': df_chart_source[open_type_col].astype(str) if open_type_col in df_chart_source.columns else '全部',
+                                         'Revenue': df_chart_source['Calculated_Total_TWD']}, index=df_chart_source.index)
+                slip_params = tuple((str(r[0]), str(r[1]), float(r[2]), float(r[3])) for r in param_table[SLIP_PARAM_COLUMNS].fillna(0).itertuples(index=False))
+                df_risk = simulate_revenue_at_risk(milestone_cal, sim_rows, data_version, filter_signature, float(rmb_rate), today,
+                                                   slip_params, int(n_trials), int(sim_seed))
+
+                if df_risk.empty:
+                    st.info("目前篩選範圍內無有效的預計訂單日期資料。")
                 else:
-                    st.info("營收總和為 0")
-
-            with row2_col2:
-                st.subheader("🌍 市場 x 應用場景")
-                if total_revenue_twd > 0 and '市場' in df_chart_source.columns and '產業應用場景' in df_chart_source.columns:
-                    df_market = df_chart_source.groupby(['市場', '產業應用場景'])['Calculated_Total_TWD'].sum().reset_index()
-                    fig_market = px.bar(df_market, x='市場', y='Calculated_Total_TWD', color='產業應用場景', barmode='stack', text_auto=',.0f', title='各地區市場應用 (含RMB)')
-                    st.plotly_chart(fig_market, use_container_width=True)
-                elif '市場' not in df_chart_source.columns or '產業應用場景' not in df_chart_source.columns:
-                    st.info("缺少 '市場' 或 '產業應用場景' 欄位，無法繪製市場圖")
+                    fig_risk = go.Figure()
+                    fig_risk.add_trace(go.Bar(x=df_risk.index, y=df_risk['基準'], name='基準 (時程全數達成)', marker_color='#D5D8DC'))
+                    fig_risk.add_trace(go.Scatter(x=df_risk.index, y=df_risk['P90'], mode='lines', line=dict(width=0), showlegend=False, hoverinfo='skip'))
+                    fig_risk.add_trace(go.Scatter(x=df_risk.index, y=df_risk['P10'], mode='lines', line=dict(width=0), fill='tonexty',
+                                                  fillcolor='rgba(231, 76, 60, 0.2)', name='P10 ~ P90'))
+                    fig_risk.add_trace(go.Scatter(x=df_risk.index, y=df_risk['P50'], mode='lines+markers', name='P50',
+                                                  line=dict(color='#E74C3C', width=3)))
+                    fig_risk.update_layout(xaxis=dict(title="預計訂單季度", type='category'), yaxis_title="預估營收 (TWD)",
+                                           legend=dict(orientation="h", y=1.1), margin=dict(t=60))
+                    st.plotly_chart(fig_risk, use_container_width=True)
+                    st.dataframe(df_risk.style.format('{:,.0f}'), use_container_width=True)
+
+    # =========================================================================
+    # [區塊 16] 匯率情境分析 (V78: 季度匯率表 + 匯率敏感度掃描)
+    # =========================================================================
+    st.divider()
+    fx_expander = st.expander("💱 匯率情境分析 (Exchange-Rate Scenarios) - 點擊展開", expanded=False, key="fx_expander", on_change="rerun")
+    with fx_expander:
+        if fx_expander.open:
+            if not col_rmb:
+                st.info("無 RMB 營收欄位，匯率不影響營收")
+            else:
+                fx_table = build_order_revenue_table(df_full, data_version, order_col, col_twd, col_rmb).reindex(df_chart_source.index)
+                fx_projects = fx_table.groupby(df_chart_source['專案'].astype(str))[['TWD', 'RMB']].sum()
+
+                st.markdown("**📅 季度匯率表** (每季起日起生效，表首之前或無訂單日期者使用側邊欄匯率)")
+                rate_table = st.data_editor(load_rate_table(), num_rows="dynamic", hide_index=True, key="rate_table_editor",
+                                            column_config={"quarter": st.column_config.TextColumn("季度 (YYYYQn)"),
+                                                           "rate": st.column_config.NumberColumn("RMB→TWD 匯率", format="%.3f")})
+                if st.button("💾 儲存匯率表", key="save_rate_table"):
+                    save_rate_table(rate_table)
+                    st.toast("✅ 匯率表已儲存", icon="💱")
+                rate_table = clean_rate_table(rate_table)
+                row_rates = rates_for_dates(fx_table['OrderDate'], rate_table, rmb_rate)
+                fx_total_table = (fx_table['TWD'] + fx_table['RMB'] * row_rates).sum()
+                fx_total_flat = (fx_table['TWD'] + fx_table['RMB'] * rmb_rate).sum()
+                f1, f2 = st.columns(2)
+                f1.metric(f"單一匯率 {rmb_rate} 總營收 (TWD)", f"{fx_total_flat:,.0f}")
+                f2.metric("季度匯率表 總營收 (TWD)", f"{fx_total_table:,.0f}", delta=f"{fx_total_table - fx_total_flat:,.0f}")
+
+                st.markdown("**📈 匯率敏感度掃描**")
+                c_lo, c_hi, c_step = st.columns(3)
+                sweep_lo = c_lo.number_input("最低匯率", value=round(max(rmb_rate - 0.5, 0.01), 2), step=0.05, format="%.2f", key="sweep_lo")
+                sweep_hi = c_hi.number_input("最高匯率", value=round(rmb_rate + 0.5, 2), step=0.05, format="%.2f", key="sweep_hi")
+                sweep_step = c_step.number_input("間距", min_value=0.01, value=0.05, step=0.01, format="%.2f", key="sweep_step")
+                sweep_rates = np.round(np.arange(sweep_lo, sweep_hi + sweep_step / 2, sweep_step), 4)
+                if len(sweep_rates) == 0 or fx_projects.empty:
+                    st.info("請確認匯率範圍 (最高需大於最低)")
+                else:
+                    sweep_totals, sweep_ranks = rate_sweep(fx_projects['TWD'], fx_projects['RMB'], sweep_rates)
+                    fig_sweep = go.Figure(go.Scatter(x=sweep_rates, y=sweep_totals, mode='lines+markers', name='預估總營收',
+                                                     line=dict(color='#2E86C1', width=3), hovertemplate="匯率 %{x}<br>總營收: %{y:,.0f}<extra></extra>"))
+                    fig_sweep.add_vline(x=rmb_rate, line_dash="dash", line_color="#E74C3C", annotation_text=f"目前 {rmb_rate}")
+                    fig_sweep.update_layout(xaxis_title="RMB→TWD 匯率", yaxis_title="預估總營收 (TWD)", height=350)
+                    st.plotly_chart(fig_sweep, use_container_width=True)
+
+                    top_projects = sweep_ranks.min(axis=1).nsmallest(5).index
+                    df_rank_sweep = sweep_ranks.loc[top_projects].T.rename_axis('匯率').reset_index().melt(id_vars='匯率', var_name='專案', value_name='排名')
+                    fig_rank = px.line(df_rank_sweep, x='匯率', y='排名', color='專案', markers=True)
+                    fig_rank.update_layout(yaxis=dict(autorange='reversed', dtick=1, title="營收排名 (1 = 營收貢獻王)"), height=350)
+                    st.plotly_chart(fig_rank, use_container_width=True)
+                    kings = sweep_ranks.idxmin(axis=0)
+                    king_changes = kings[kings.ne(kings.shift())]
+                    st.caption("👑 營收貢獻王：" + "、".join(f"{rate:g} 起 {name}" for rate, name in king_changes.items()))
+
+    # =========================================================================
+    # [區塊 17] 營收認列分期 (V79: 依產品類別 ramp profile 分攤至各季)
+    # =========================================================================
+    st.divider()
+    phasing_expander = st.expander("📊 營收認列分期 (Revenue Phasing) - 點擊展開", expanded=False, key="phasing_expander", on_change="rerun")
+    with phasing_expander:
+        if phasing_expander.open:
+            if order_col not in df_chart_source.columns:
+                st.warning(f"缺少 '{order_col}' 欄位")
+            else:
+                phase_categories = (df_full[cat_col_name].fillna('未分類').astype(str).unique().tolist() if cat_col_name else ['全部'])
+                st.caption("各模式比例：" + "｜".join(f"{name} {'/'.join(f'{w:.0%}' for w in weights)}" for name, weights in RAMP_PROFILES.items()))
+                phase_config = st.data_editor(
+                    pd.DataFrame({'類別': sorted(phase_categories), '認列模式': DEFAULT_RAMP_PROFILE}),
+                    hide_index=True, disabled=['類別'], key="phase_profile_editor",
+                    column_config={"認列模式": st.column_config.SelectboxColumn("認列模式", options=list(RAMP_PROFILES), required=True)}
+                )
+                phase_rows = pd.DataFrame({
+                    '專案': df_chart_source['專案'],
+                    '類別': df_chart_source[cat_col_name].fillna('未分類').astype(str) if cat_col_name else '全部',
+                    'OrderDate': build_order_revenue_table(df_full, data_version, order_col, col_twd, col_rmb)['OrderDate'].reindex(df_chart_source.index),
+                    'Revenue': df_chart_source['Calculated_Total_TWD']
+                }, index=df_chart_source.index)
+                profile_by_category = tuple(zip(phase_config['類別'], phase_config['認列模式'].fillna(DEFAULT_RAMP_PROFILE)))
+                df_phase_grid, df_phase_detail = phase_revenue(phase_rows, data_version, filter_signature, float(rmb_rate), profile_by_category)
+
+                if df_phase_grid.empty:
+                    st.info("目前篩選範圍內無有效的預計訂單日期資料。")
                 else:
-                    st.info("無營收數據")
+                    df_phase_long = df_phase_grid.reset_index().melt(id_vars='季度', var_name='類別', value_name='營收')
+                    fig_phase = px.bar(df_phase_long, x='季度', y='營收', color='類別', barmode='stack')
+                    fig_phase.update_layout(xaxis=dict(title="認列季度", type='category'), yaxis_title="預估認列營收 (TWD)",
+                                            legend=dict(orientation="h", y=1.1), margin=dict(t=60))
+                    st.plotly_chart(fig_phase, use_container_width=True)
+                    phase_csv = io.StringIO()
+                    df_phase_detail.to_csv(phase_csv, index=False)
+                    st.download_button(label="💾 匯出分期明細 (CSV)", data=phase_csv.getvalue().encode('utf-8-sig'),
+                                       file_name="revenue_phasing.csv", mime="text/csv", key="phase_download")
 
     # =========================================================================
     # [區塊 6] 營收 Top 10 專案
@@ -843,14 +1724,58 @@ if uploaded_file is not None:
     st.divider()
     with st.expander("🏆 營收 Top 10 專案 - 點擊展開", expanded=False):
         if total_revenue_twd > 0:
-            df_chart = df_chart_source.groupby('專案')['Calculated_Total_TWD'].sum().reset_index()
-            df_chart = df_chart.nlargest(10, 'Calculated_Total_TWD').sort_values('Calculated_Total_TWD', ascending=True)
-            fig_bar = px.bar(df_chart, x='Calculated_Total_TWD', y='專案', orientation='h', text_auto=',.0f', color='Calculated_Total_TWD', color_continuous_scale='Blues')
-            fig_bar.update_layout(xaxis_title="預估營收 (含RMB換算)", yaxis_title="專案")
+            top10_key = ('top10', data_version, filter_signature, float(rmb_rate))
+            fig_bar = figure_cache.get(top10_key)
+            if fig_bar is None:
+                if revenue_rollup is not None:
+                    df_chart = revenue_rollup['top10']
+                else:
+                    df_chart = duckdb_query(duck_con, f"""
+                        SELECT project AS 專案, SUM(twd + rmb * ?) AS Calculated_Total_TWD FROM portfolio WHERE {duck_where}
+                        GROUP BY project ORDER BY Calculated_Total_TWD DESC LIMIT 10""", [rmb_rate] + duck_params)
+                    df_chart = df_chart.sort_values('Calculated_Total_TWD', ascending=True)
+                fig_bar = px.bar(df_chart, x='Calculated_Total_TWD', y='專案', orientation='h', text_auto=',.0f', color='Calculated_Total_TWD', color_continuous_scale='Blues')
+                fig_bar.update_layout(xaxis_title="預估營收 (含RMB換算)", yaxis_title="專案")
+                figure_cache.put(top10_key, fig_bar)
             st.plotly_chart(fig_bar, use_container_width=True)
+            report_figures['🏆 營收 Top 10 專案'] = fig_bar
         else:
             st.info("無營收數據")
 
+    # =========================================================================
+    # [區塊 18] 主管報告匯出 (V82: 單一離線 HTML，plotly.js 與樣板只內嵌一次)
+    # =========================================================================
+    with st.expander("📥 主管報告匯出 (Executive Report) - 點擊展開", expanded=False):
+        st.caption("將 KPI、本週/本月提醒、路徑圖、訂單倒數、產品類別/市場圖與營收 Top 10 輸出為單一 HTML 檔，可離線開啟或直接以郵件寄送。")
+        # 倒數天數/提醒依「今天」與工作天設定 (weekmask, 假日 tuple) 而變，兩者也納入鍵
+        report_key = (data_version, filter_signature, float(rmb_rate), today, busday_config,
+                      roadmap_granularity, roadmap_lane_col, tuple(roadmap_expanded), roadmap_page, page_size)
+        if st.button("🛠️ 產生主管報告", key="exec_report_build"):
+            t_report = time.perf_counter()
+            filter_text = "；".join(f"{name}: {', '.join(values)}" for name, values in filter_signature if values) or "全部資料"
+            kpi_html = (f"<div class='kpis'><div><span>💰 預估總營收 (TWD) - 匯率 {rmb_rate}</span><b>{total_revenue_twd:,.0f}</b></div>"
+                        f"<div><span>👑 營收貢獻王 (含RMB換算)</span><b>{html.escape(str(top_contributor_text))} ({top_project_rev:,.0f})</b></div>"
+                        f"<div><span>📊 篩選後專案數 (Unique)</span><b>{project_count_unique}</b></div></div>"
+                        f"<p>篩選條件：{html.escape(filter_text)}</p>")
+            sections = [(None, kpi_html)]
+            if report_alerts[0] or report_alerts[1]:
+                sections.append(("🔔 本週/本月重點提醒 (Milestone Alerts)", alerts_html(*report_alerts)))
+            sections += list(report_figures.items())
+            report_html = html_report("Geckos 主管報告", f"報表基準日：{today.strftime('%Y-%m-%d')}", sections)
+            st.session_state['exec_report'] = {
+                'key': report_key, 'data': report_html.encode('utf-8'),
+                'seconds': time.perf_counter() - t_report, 'figures': len(report_figures),
+            }
+
+        exec_report = st.session_state.get('exec_report')
+        if exec_report and exec_report['key'] == report_key:
+            st.download_button("📥 下載主管報告 (HTML)", data=exec_report['data'],
+                               file_name=f"geckos_report_{today.strftime('%Y%m%d')}.html", mime="text/html")
+            st.caption(f"含 {exec_report['figures']} 張圖表，檔案大小 {len(exec_report['data']) / 1024 / 1024:.2f} MB，"
+                       f"產生耗時 {exec_report['seconds']:.2f} 秒")
+        elif exec_report:
+            st.info("篩選條件、資料或日期/工作天設定已變更，請重新產生報告。")
+
     # =========================================================================
     # [區塊 7] 詳細資料檢視 (V64.1: Moved to Bottom)
     # =========================================================================
@@ -863,12 +1788,12 @@ if uploaded_file is not None:
     if "🗑️ 刪除" in display_df.columns: display_df.drop(columns=["🗑️ 刪除"], inplace=True)
     if "📝 編輯" in display_df.columns: display_df.drop(columns=["📝 編輯"], inplace=True)
     
-    # 強制字串型別
+    # 強制字串型別 ([V89] 日期欄位 = 各里程碑階段的欄位與別名，只由階段設定定義)
+    stage_date_cols = [c for stage in MILESTONE_STAGES for c in stage['columns']]
     cols_to_stringify = [
         '專案負責人', '目標規格', '信賴性測試要求', '對標競爭產品', '預估市場規模', 
-        '目標客戶1', '目標客戶2', '目標客戶3', '目標客戶4', '目標客戶5', 
-        '預計訂單起始點', '專案開發完成時間', '開案時間', '設計驗證時間', '工程驗證時間'
-    ]
+        '目標客戶1', '目標客戶2', '目標客戶3', '目標客戶4', '目標客戶5'
+    ] + stage_date_cols
     for c in cols_to_stringify:
         if c in display_df.columns:
             display_df[c] = display_df[c].astype(str).replace('nan', '').replace('NaT', '')
@@ -907,7 +1832,7 @@ if uploaded_file is not None:
                            '目標客戶1', '目標客戶2', '目標客戶3', '目標客戶4', '目標客戶5', 
                            '專案', '產品類別', '產業應用場景', '開案類別', '市場']
             
-            date_fields = ['預計訂單起始點', '專案開發完成時間', '開案時間', '設計驗證時間', '工程驗證時間']
+            date_fields = stage_date_cols
             
             col_count = 3
             cols_layout = st.columns(col_count)
@@ -949,6 +1874,8 @@ if uploaded_file is not None:
                         st.session_state['full_df'].at[target_index, col] = new_val
                 
                 st.session_state['working_df'].at[target_index, "📝 編輯"] = False
+                update_search_index(st.session_state['search_index'], st.session_state['full_df'], [target_index])
+                bump_data_version()
                 st.toast(f"✅ 專案 {project_name} 資料已更新！", icon="💾")
                 st.rerun()
 
@@ -965,6 +1892,8 @@ if uploaded_file is not None:
                     st.session_state['full_df'] = pd.concat([st.session_state['full_df'], new_rows])
                 
                 if 'working_df' in st.session_state: del st.session_state['working_df']
+                update_search_index(st.session_state['search_index'], st.session_state['full_df'], data_to_update.index.tolist())
+                bump_data_version()
                 st.toast("✅ 表格數據已更新！", icon="🎉")
                 st.rerun()
         
@@ -974,6 +1903,8 @@ if uploaded_file is not None:
                 if len(rows_to_delete) > 0:
                     st.session_state['full_df'] = st.session_state['full_df'].drop(rows_to_delete)
                     if 'working_df' in st.session_state: del st.session_state['working_df']
+                    update_search_index(st.session_state['search_index'], st.session_state['full_df'], rows_to_delete.tolist())
+                    bump_data_version()
                     st.toast(f"✅ 已刪除 {len(rows_to_delete)} 筆資料！", icon="🗑️")
                     st.rerun()
                 else:
@@ -0,0 +1,1006 @@
+"""Geckos Dashboard 共用核心 (不依賴 Streamlit)
+
+[V81] 自 dashboard_geckos_Gantt_v65.4.py 抽出：資料讀取、里程碑解析/日曆、提醒卡片、PM 卡片、
+訂單倒數與路徑圖。儀表板 (加上 st.cache_data 快取) 與批次報表 geckos_report.py 共用同一份邏輯。
+[V82] 離線 HTML 報表：plotly.js 與圖表樣板只內嵌一次，圖表以精簡 JSON 輸出。
+[V86] 圖表 LRU 快取 (FigureCache)：條件未變的圖表直接沿用已建好的 Figure。
+[V89] 里程碑階段改由設定檔 milestone_stages.json 定義 (欄位/別名、順序、顏色、符號)，日曆、提醒、PM 卡片、路徑圖共用。
+[V90] 欄位對照：讀檔時依別名表將表頭統一為標準欄位名稱，resolve_schema 一次解析營收/類別/里程碑欄位並檢查型別。
+"""
+import html
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+from plotly.offline import get_plotlyjs
+
+DEFAULT_WEEKMASK = '1111100'
+HOT_DAYS = 7  # 🔥 標記門檻 (依目前天數單位)
+
+TYPE_STYLE_MAP = {
+    'NPDR': {'bg': '#EBF5FB', 'border': '#2E86C1'},
+    'MDR':  {'bg': '#E8F8F5', 'border': '#17A589'},
+    'TDR':  {'bg': '#FEF9E7', 'border': '#F1C40F'},
+    'default': {'bg': '#F2F3F4', 'border': '#95A5A6'}
+}
+
+# [V89] 里程碑階段設定：依列出順序；檔案不存在或格式錯誤時使用內建的 NPDR/DV/EV/Order
+MILESTONE_STAGES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'milestone_stages.json')
+DEFAULT_MILESTONE_STAGES = [
+    {'key': 'NPDR', 'columns': ['開案時間', '开案时间', 'NPDR開案時間', 'NPDR开案时间', 'NPDR'], 'name': 'NPDR 開案', 'label': 'NPDR開案',
+     'short': 'NPDR開案', 'icon': '🔵', 'color': '#2E86C1', 'symbol': 'circle', 'legend': '🟦 NPDR開案', 'slip': [7.0, 14.0]},
+    {'key': 'DV', 'columns': ['設計驗證時間', '设计验证时间'], 'name': '設計驗證 (DV)', 'label': '設計驗證(DV)', 'short': 'DV', 'icon': '🔶',
+     'color': '#F39C12', 'symbol': 'diamond', 'line_color': '#F39C12', 'legend': '🟧 標準設計 (往DV)', 'slip': [14.0, 21.0]},
+    {'key': 'EV', 'columns': ['工程驗證時間', '工程验证时间'], 'name': '工程驗證 (EV)', 'label': '工程驗證(EV)', 'short': 'EV', 'icon': '🟥',
+     'color': '#9B59B6', 'symbol': 'square', 'line_color': '#9B59B6', 'legend': '🟪 標準工程 (往EV)', 'slip': [14.0, 21.0]},
+    {'key': 'Order', 'columns': ['預計訂單起始點', '预计订单起始点'], 'name': '預計訂單 (Order)', 'label': '預計訂單(Order)', 'short': 'Order', 'icon': '🟢',
+     'color': '#27AE60', 'symbol': 'star', 'size': 14, 'line_color': '#2ECC71', 'legend': '🟩 標準導入 (往Order)', 'slip': [30.0, 30.0]},
+]
+STAGE_DEFAULTS = {'icon': '⚪', 'color': '#7F8C8D', 'symbol': 'circle', 'size': 10, 'line_color': None, 'legend': None, 'slip': None}
+OTHER_PATH_COLOR = '#7F8C8D'
+
+
+def _normalize_stages(raw_stages):
+    """[V89] 補齊階段設定的選填欄位；key 重複或缺 columns 的項目略過"""
+    stages, seen = [], set()
+    for raw in raw_stages:
+        if not isinstance(raw, dict) or not raw.get('key') or not raw.get('columns') or raw['key'] in seen:
+            continue
+        seen.add(raw['key'])
+        columns = [raw['columns']] if isinstance(raw['columns'], str) else list(raw['columns'])
+        name = raw.get('name', raw['key'])
+        stages.append({**STAGE_DEFAULTS, 'label': name, 'short': raw['key'], **raw, 'name': name, 'columns': columns})
+    return stages
+
+def load_milestone_stages(path=MILESTONE_STAGES_PATH):
+    """[V89] 讀取里程碑階段設定 (JSON：{"stages": [...]})；讀不到或沒有有效階段時回傳內建設定"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            stages = _normalize_stages(json.load(f)['stages'])
+    except (OSError, json.JSONDecodeError, KeyError, TypeError):
+        stages = []
+    return stages or _normalize_stages(DEFAULT_MILESTONE_STAGES)
+
+MILESTONE_STAGES = load_milestone_stages()
+STAGE_CONFIG = {stage['key']: stage for stage in MILESTONE_STAGES}
+
+# [V90] 標準欄位名稱 → 別名 (簡體/舊版表頭)；里程碑欄位的別名取自階段設定 (columns 第一個為標準名稱)
+FIELD_ALIASES = {
+    '專案': ['专案', '專案名稱', '专案名称'],
+    '專案負責人': ['专案负责人', '負責人', '负责人'],
+    '開案類別': ['开案类别'],
+    '產品類別': ['产品类别'],
+    '專案類別': ['专案类别'],
+    '產業應用場景': ['产业应用场景'],
+    '市場': ['市场'],
+    '目標規格': ['目标规格'],
+    '信賴性測試要求': ['信赖性测试要求'],
+    '對標競爭產品': ['对标竞争产品'],
+    '預估市場規模': ['预估市场规模'],
+    **{f'目標客戶{i}': [f'目标客户{i}'] for i in range(1, 6)},
+}
+# [V90] 角色欄位：依序取第一個存在的標準欄位
+CATEGORY_COLS = ['產品類別', '專案類別']
+
+
+# --- 資料讀取 ---
+def read_project_table(file):
+    """讀取專案總表 (Excel/CSV) 並做欄位前處理；主檔與比較基準檔共用 (V76 抽出)"""
+    if file.name.endswith('.csv'):
+        df_raw = pd.read_csv(file)
+    else:
+        df_raw = pd.read_excel(file)
+
+    df_raw.columns = df_raw.columns.str.strip()
+    # [V90] 別名表頭統一為標準欄位名稱 (每次讀檔只做一次，之後各區塊直接以標準名稱取用)
+    df_raw = df_raw.rename(columns=canonical_column_map(df_raw.columns))
+
+    # [V47] 欄位格式優化
+    if '專案負責人' in df_raw.columns:
+        df_raw['專案負責人'] = df_raw['專案負責人'].astype(str).replace('nan', '')
+
+    # 數值前處理
+    for col in df_raw.columns:
+        if '營收' in col:
+             if df_raw[col].dtype == 'object':
+                df_raw[col] = pd.to_numeric(df_raw[col].astype(str).str.replace(',', ''), errors='coerce').fillna(0)
+             else:
+                df_raw[col] = df_raw[col].fillna(0)
+    return df_raw
+
+def detect_revenue_columns(columns):
+    """營收欄位識別：回傳 (TWD 欄位, RMB 欄位)，找不到時為 None"""
+    col_twd = None
+    col_rmb = None
+
+    candidates_twd = [c for c in columns if '營收' in c and 'TWD' in c]
+    if candidates_twd: col_twd = candidates_twd[0]
+
+    candidates_rmb = [c for c in columns if '營收' in c and 'RMB' in c]
+    if candidates_rmb: col_rmb = candidates_rmb[0]
+
+    if not col_twd:
+        candidates_gen = [c for c in columns if '營收' in c and c != col_rmb]
+        if candidates_gen: col_twd = candidates_gen[0]
+    return col_twd, col_rmb
+
+def canonical_column_map(columns):
+    """[V90] 別名表頭 → 標準欄位名稱 (供 DataFrame.rename)。標準欄位已存在時不改名；同一標準欄位只取第一個出現的別名。
+    營收欄位的簡體寫法 (预估营收) 轉為繁體，幣別等其餘字樣保留。"""
+    present = set(columns)
+    aliases = {**FIELD_ALIASES, **{stage['columns'][0]: stage['columns'][1:] for stage in MILESTONE_STAGES}}
+    rename = {}
+    for canonical, names in aliases.items():
+        if canonical in present:
+            continue
+        alias = next((name for name in names if name in present and name not in rename), None)
+        if alias is not None:
+            rename[alias] = canonical
+    for col in present:
+        if '营收' in col and col not in rename:
+            canonical = col.replace('预估', '預估').replace('营收', '營收')
+            if canonical not in present and canonical not in rename.values():
+                rename[col] = canonical
+    return rename
+
+def resolve_schema(df):
+    """[V90] 欄位對照 (每次上傳解析一次，隨資料集保存)：df 為 read_project_table 的結果 (表頭已統一)。
+    回傳 dict：col_twd/col_rmb (營收)、category (產品類別或專案類別)、stages (階段 → 欄位)、issues (型別檢查訊息)。"""
+    col_twd, col_rmb = detect_revenue_columns(df.columns)
+    stages = milestone_columns(df.columns)
+    issues = []
+    if '專案' not in df.columns:
+        issues.append("缺少「專案」欄位")
+    for col in (col_twd, col_rmb):
+        if col and not pd.api.types.is_numeric_dtype(df[col]):
+            issues.append(f"「{col}」不是數值欄位")
+    for col in stages.values():
+        raw = df[col]
+        filled = raw.notna() & (raw.astype(str).str.strip() != '')
+        n_bad = int((filled & parse_milestone_series(raw).isna()).sum())
+        if n_bad:
+            issues.append(f"「{col}」有 {n_bad} 筆無法解析為日期或季別")
+    return {'col_twd': col_twd, 'col_rmb': col_rmb, 'category': next((c for c in CATEGORY_COLS if c in df.columns), None),
+            'stages': stages, 'issues': issues}
+
+
+# --- 日期解析 ---
+def parse_quarter_date_end(date_str):
+    """將 '2026Q2' 轉為該季的【最後一天】 (例如 2026-06-30)"""
+    if pd.isna(date_str): return None
+    date_str = str(date_str).strip().upper()
+    match = re.search(r'(\d{4}).*Q(\d)', date_str)
+    if match:
+        year = int(match.group(1))
+        quarter = int(match.group(2))
+        quarter_ends = {1: (3, 31), 2: (6, 30), 3: (9, 30), 4: (12, 31)}
+        if quarter in quarter_ends:
+            month, day = quarter_ends[quarter]
+            return pd.Timestamp(year=year, month=month, day=day)
+    return None
+
+def get_week_str(dt):
+    if pd.isnull(dt): return None
+    iso_cal = dt.isocalendar()
+    return f"{iso_cal.year}-W{iso_cal.week:02d}"
+
+def parse_milestone_series(series):
+    """[V66] parse_quarter_date_end + to_datetime 的向量化版本 (整欄一次解析，回傳 datetime64)"""
+    s = series.astype(str).str.strip().str.upper()
+    q = s.str.extract(r'(\d{4}).*Q(\d)')
+    year = pd.to_numeric(q[0], errors='coerce')
+    quarter = pd.to_numeric(q[1], errors='coerce')
+    is_quarter = quarter.between(1, 4)
+    q_end = pd.to_datetime(
+        pd.DataFrame({'year': year.where(is_quarter), 'month': (quarter * 3).where(is_quarter), 'day': 1}),
+        errors='coerce'
+    ) + pd.offsets.MonthEnd(0)
+    others = pd.to_datetime(series.where(~is_quarter), errors='coerce', format='mixed')
+    return q_end.where(is_quarter, others)
+
+def milestone_columns(columns):
+    """[V69] 各里程碑對應欄位 (僅回傳存在於表頭者)。
+    [V89] 階段與欄位別名取自 MILESTONE_STAGES，依設定順序，每階段取第一個存在的別名。"""
+    columns = set(columns)
+    col_map = {}
+    for stage in MILESTONE_STAGES:
+        col = next((c for c in stage['columns'] if c in columns), None)
+        if col is not None:
+            col_map[stage['key']] = col
+    return col_map
+
+
+# --- 里程碑日曆 ---
+def urgency_colors(days):
+    """緊急度色碼：≤30 天紅、31~90 天黃、>90 天綠 (向量化)"""
+    days = np.asarray(days)
+    return np.select([days <= 30, days <= 90], ['#E74C3C', '#F1C40F'], '#2ECC71')
+
+def business_days_from(today, dates, busday_config):
+    """[V74] 自 today 起到各日期的工作天數 (np.busday_count 向量化；過去日期為負值)"""
+    weekmask, holidays = busday_config
+    day_values = pd.to_datetime(pd.Series(dates)).to_numpy(dtype='datetime64[D]')
+    return np.busday_count(np.datetime64(today.date(), 'D'), day_values, weekmask=weekmask,
+                           holidays=np.array(holidays, dtype='datetime64[D]'))
+
+def order_revenue_table(df, order_col, col_twd, col_rmb):
+    """[V66] 每列的預計訂單日期與 TWD/RMB 營收"""
+    table = pd.DataFrame(index=df.index)
+    table['OrderDate'] = parse_milestone_series(df[order_col]) if order_col in df.columns else pd.NaT
+    table['TWD'] = pd.to_numeric(df[col_twd], errors='coerce').fillna(0)
+    table['RMB'] = pd.to_numeric(df[col_rmb], errors='coerce').fillna(0) if col_rmb else 0.0
+    return table
+
+def milestone_calendar(df, today, busday_config=None):
+    """[V73] 里程碑日曆：每列每階段的日期、DaysDiff、本週/本月旗標、緊急度色碼，以及每列的下一階段 (最近且未過期)。
+    [V74] busday_config=(weekmask, holidays) 時 days_diff 改為工作天，cal_days 仍為日曆天 (判斷今天/過期用)。"""
+    stage_cols = milestone_columns(df.columns)
+    frames = []
+    for stage_order, (stage, col) in enumerate(stage_cols.items()):
+        frames.append(pd.DataFrame({'row_id': df.index, 'row_pos': np.arange(len(df)), 'stage_order': stage_order,
+                                    'stage': stage, 'date': parse_milestone_series(df[col]).to_numpy()}))
+    if not frames:
+        empty = pd.DataFrame(columns=['row_id', 'stage', 'date', 'cal_days', 'days_diff', 'in_week', 'in_month', 'urgency_color'])
+        return empty, empty.set_index('row_id')
+    cal = pd.concat(frames, ignore_index=True).dropna(subset=['date'])
+    cal = cal.sort_values(['row_pos', 'stage_order']).sort_values('date', kind='stable')
+
+    start_week = today - pd.Timedelta(days=today.dayofweek)
+    end_week = start_week + pd.Timedelta(days=6)
+    cal['cal_days'] = (cal['date'] - today).dt.days
+    cal['days_diff'] = business_days_from(today, cal['date'], busday_config) if busday_config else cal['cal_days']
+    cal['in_week'] = (cal['date'] >= start_week) & (cal['date'] <= end_week)
+    cal['in_month'] = (cal['date'].dt.year == today.year) & (cal['date'].dt.month == today.month)
+    cal['urgency_color'] = urgency_colors(cal['days_diff'])
+
+    upcoming = cal[cal['cal_days'] >= 0].sort_values(['row_pos', 'cal_days', 'stage_order'])
+    next_stage = upcoming.drop_duplicates(subset=['row_pos']).set_index('row_id')[['stage', 'date', 'cal_days', 'days_diff', 'urgency_color']]
+    return cal.reset_index(drop=True), next_stage
+
+
+# --- [區塊 8] 本週/本月提醒卡片 ---
+def alert_cards(df_alerts, cal, day_unit="天"):
+    """本週/本月重點提醒卡片 HTML (依日期排序)，回傳 (本週清單, 本月清單)。
+    df_alerts 為已依專案去重的資料；日期與天數取自 milestone_calendar，只走訪有提醒的節點。"""
+    icon_map = {key: stage['icon'] for key, stage in STAGE_CONFIG.items()}
+    stage_name_display = {key: stage['label'] for key, stage in STAGE_CONFIG.items()}
+    urgent_style = {'bg': '#FDEDEC', 'border': '#E74C3C', 'text': '#C0392B'}
+
+    week_items = []
+    month_items = []
+
+    alert_cal = cal[cal['row_id'].isin(df_alerts.index) & (cal['in_week'] | cal['in_month'])]
+    for item in alert_cal.itertuples(index=False):
+        row = df_alerts.loc[item.row_id]
+        key, dt, days_diff, cal_days = item.stage, item.date, item.days_diff, item.cal_days
+        p_type = row.get('開案類別', 'default')
+        if pd.isna(p_type) or p_type not in TYPE_STYLE_MAP:
+            month_style = TYPE_STYLE_MAP['default']
+            p_type_display = p_type if pd.notnull(p_type) else "Unknown"
+        else:
+            month_style = TYPE_STYLE_MAP[p_type]
+            p_type_display = p_type
+        # 儲存格內容一律跳脫後再放入 HTML (卡片會內嵌於儀表板與寄出的報表)
+        p_type_display = html.escape(str(p_type_display))
+        project_name = html.escape(str(row['專案']))
+
+        pm_name = row.get('專案負責人', '')
+        pm_str = f"(👤 PM: {html.escape(str(pm_name))})" if pd.notnull(pm_name) and str(pm_name).strip() != '' else ""
+
+        icon = icon_map.get(key, '⚪')
+        display_name = stage_name_display.get(key, key)
+
+        if item.in_week:
+            if cal_days < 0:
+                count_down_str = "(已完成)"
+                content_style = "color: #999999;"
+            else:
+                count_down_str = "(今天)" if cal_days == 0 else f"(剩餘 {days_diff} {day_unit})"
+                content_style = f"color: {urgent_style['text']};"
+
+            card_html = f"""
+                <div style="background-color: {urgent_style['bg']}; border-left: 5px solid {urgent_style['border']}; padding: 10px; margin-bottom: 8px; border-radius: 4px; box-shadow: 1px 1px 3px rgba(0,0,0,0.1);">
+                    <div style="font-size: 0.85em; font-weight: bold; color: {urgent_style['text']}; margin-bottom: 4px;">{p_type_display} (Urgent)</div>
+                    <div style="{content_style}">{icon} <b>{project_name}</b> <span style="font-size:0.9em; opacity:0.8;">{pm_str}</span> - {display_name} | {dt.strftime('%Y-%m-%d')} {count_down_str}</div>
+                </div>
+                """
+            week_items.append({'dt': dt, 'html': card_html})
+
+        if item.in_month:
+            if cal_days < 0:
+                count_down_str = "(已完成)"
+                content_style = "color: #999999;"
+            else:
+                count_down_str = "(今天)" if cal_days == 0 else f"(剩餘 {days_diff} {day_unit})"
+                content_style = "color: #333333;"
+
+            card_html = f"""
+                <div style="background-color: {month_style['bg']}; border-left: 5px solid {month_style['border']}; padding: 10px; margin-bottom: 8px; border-radius: 4px; box-shadow: 1px 1px 3px rgba(0,0,0,0.1);">
+                    <div style="font-size: 0.85em; font-weight: bold; color: {month_style['border']}; margin-bottom: 4px;">{p_type_display}</div>
+                    <div style="{content_style}">{icon} <b>{project_name}</b> <span style="font-size:0.9em; opacity:0.8;">{pm_str}</span> - {display_name} | {dt.strftime('%Y-%m-%d')} {count_down_str}</div>
+                </div>
+                """
+            month_items.append({'dt': dt, 'html': card_html})
+
+    week_items.sort(key=lambda x: x['dt'])
+    month_items.sort(key=lambda x: x['dt'])
+    return [item['html'] for item in week_items], [item['html'] for item in month_items]
+
+
+def alerts_html(week_items, month_items):
+    """本週/本月提醒卡片的兩欄 HTML (報表用)"""
+    return ("<div class='cols'>"
+            f"<div><h3 style='color:#E74C3C;'>🔥 本週重點 (Urgent)</h3>{''.join(week_items) or '<p>✅ 本週無重點事項</p>'}</div>"
+            f"<div><h3 style='color:#2E86C1;'>🗓️ 本月重點 (Upcoming)</h3>{''.join(month_items) or '<p>ℹ️ 本月無重點事項</p>'}</div>"
+            "</div>")
+
+# --- [區塊 9] PM 專案卡片 ---
+def pm_cards(pm_projects, next_stages, day_unit="天"):
+    """PM 手上專案卡片 HTML (依下一階段剩餘天數排序)；next_stages 為 milestone_calendar 回傳的下一階段表"""
+    pm_stage_name = {key: stage['short'] for key, stage in STAGE_CONFIG.items()}
+    cards = []
+    for idx, row in pm_projects.iterrows():
+        p_type = row.get('開案類別', 'default')
+        if pd.isna(p_type) or p_type not in TYPE_STYLE_MAP:
+            style = TYPE_STYLE_MAP['default']
+            p_type_display = p_type if pd.notnull(p_type) else "?"
+        else:
+            style = TYPE_STYLE_MAP[p_type]
+            p_type_display = p_type
+        p_type_display = html.escape(str(p_type_display))
+
+        # [V73] 下一階段直接查表
+        next_stage = None
+        if idx in next_stages.index:
+            nxt = next_stages.loc[idx]
+            min_days = nxt['days_diff']
+            next_stage = {'name': pm_stage_name.get(nxt['stage'], nxt['stage']), 'date': nxt['date'].strftime('%Y-%m-%d'), 'days': nxt['days_diff']}
+
+        status_text = f"🔜 下一階段: {next_stage['name']}<br>📅 {next_stage['date']} (剩 {next_stage['days']} {day_unit})" if next_stage else "✅ 所有階段已完成 (或未設定)"
+        if next_stage and next_stage['days'] < HOT_DAYS: status_text = "🔥 " + status_text
+
+        border_color = '#E74C3C' if next_stage and next_stage['days'] < HOT_DAYS else style['border']
+        cards.append({'days': min_days if next_stage else 9999, 'html': f"<div style='background:{style['bg']};border-top:5px solid {border_color};padding:10px;margin:5px;box-shadow:0 2px 4px rgba(0,0,0,0.1);height:100%'><b>{p_type_display}</b><br><b>{html.escape(str(row['專案']))}</b><br><small>{status_text}</small></div>"})
+
+    cards.sort(key=lambda x: x['days'])
+    return [card['html'] for card in cards]
+
+
+# --- [區塊 10] 預計訂單倒數 ---
+def order_countdown_table(df, cal, col_twd, col_rmb, order_col=None):
+    """每專案最早的預計訂單日 + 營收加總 (訂單日期與天數取自 milestone_calendar)。
+    order_col 為里程碑設定中 Order 階段的欄位 (未指定時依表頭解析)。回傳 (df_final, TWD 加總欄名, RMB 加總欄名)。"""
+    order_col = order_col or milestone_columns(df.columns).get('Order')
+    cols_to_keep = ['專案', order_col, col_twd]
+    if col_rmb: cols_to_keep.append(col_rmb)
+    if '專案負責人' in df.columns: cols_to_keep.append('專案負責人')
+
+    df_time = df[cols_to_keep].copy()
+
+    order_cal = cal[cal['stage'] == 'Order'].set_index('row_id')
+    df_time['OrderDate'] = order_cal['date'].reindex(df_time.index)
+    df_time['DaysDiff'] = order_cal['days_diff'].reindex(df_time.index)
+    df_time['CalDays'] = order_cal['cal_days'].reindex(df_time.index)
+    df_time = df_time.dropna(subset=['OrderDate']).astype({'DaysDiff': int, 'CalDays': int})
+
+    # Group by Revenue first
+    grp_cols = ['專案']
+    df_rev_agg = df.groupby(grp_cols)[[col_twd, col_rmb] if col_rmb else [col_twd]].sum().reset_index()
+
+    # Deduplicate by earliest date
+    df_time_dedup = df_time.sort_values('OrderDate').drop_duplicates(subset=['專案'], keep='first')
+
+    # Merge
+    df_final = pd.merge(df_time_dedup, df_rev_agg, on='專案', how='left', suffixes=('', '_sum'))
+
+    twd_col_sum = f"{col_twd}_sum" if f"{col_twd}_sum" in df_final.columns else col_twd
+    rmb_col_sum = f"{col_rmb}_sum" if col_rmb and f"{col_rmb}_sum" in df_final.columns else col_rmb
+    return df_final, twd_col_sum, rmb_col_sum
+
+def countdown_figure(df_final, twd_col_sum, rmb_col_sum, rmb_rate, today, day_unit="天"):
+    """[V65.4] 預計訂單 Top 10 倒數圖 (時間急迫性 > 預估營收 雙鍵排序)；無未到期訂單時回傳 None"""
+    now = today
+    df_final = df_final.copy()
+
+    # [V65.4 Logic] Calulate Total Rev for Sorting
+    df_final['Total_Revenue_Sort'] = df_final[twd_col_sum].fillna(0) + (df_final[rmb_col_sum].fillna(0) * rmb_rate if rmb_col_sum else 0)
+
+    # [V65.2] Logic: Filter out past due
+    df_final = df_final[df_final['CalDays'] >= 0]
+    if df_final.empty:
+        return None
+
+    # [V65.4] Dual Sort: Days (Asc) -> Revenue (Desc)；同天數同營收時依專案名稱，pandas/DuckDB 兩種引擎取到相同的 Top 10
+    df_final = df_final.sort_values(by=['DaysDiff', 'Total_Revenue_Sort', '專案'], ascending=[True, False, True])
+
+    # Take Strict Top 10
+    df_plot = df_final.head(10).copy()
+
+    # Reverse for Plotly (Bottom-Up)
+    df_plot = df_plot.sort_values(by=['DaysDiff', 'Total_Revenue_Sort', '專案'], ascending=[False, True, False])
+
+    # [V65.3] Visual Buffer for 0 days
+    max_val = df_plot['DaysDiff'].max()
+    visual_buffer = max(1, max_val * 0.02) if max_val > 0 else 1
+    df_plot['Plot_Value'] = df_plot['DaysDiff'].replace(0, visual_buffer)
+
+    df_plot['Color'] = urgency_colors(df_plot['DaysDiff'])
+
+    def get_label(row):
+        pm = row.get('專案負責人', '')
+        pm_txt = f" ({pm})" if pd.notnull(pm) and str(pm) else ""
+        return f"{row['專案']}{pm_txt}"
+
+    df_plot['Y_Label'] = df_plot.apply(get_label, axis=1)
+
+    def get_bar_text(row):
+        if row['CalDays'] == 0:
+            return f"{row['OrderDate'].strftime('%Y-%m-%d')} (🔥 本日到期！)"
+        else:
+            return f"{row['OrderDate'].strftime('%Y-%m-%d')} (剩 {abs(row['DaysDiff'])} {day_unit})"
+
+    df_plot['Bar_Text'] = df_plot.apply(get_bar_text, axis=1)
+
+    def get_rev_text(row):
+        parts = []
+        twd = row.get(twd_col_sum, 0)
+        rmb = row.get(rmb_col_sum, 0) if rmb_col_sum else 0
+        if twd > 0: parts.append(f"TWD {twd:,.0f}")
+        if rmb > 0: parts.append(f"RMB {rmb:,.0f}")
+        return f"<b>💰 {' | '.join(parts)}</b>" if parts else ""
+
+    df_plot['Text_Rev'] = df_plot.apply(get_rev_text, axis=1)
+
+    # Hybrid Positioning
+    threshold = max_val * 0.15 if max_val > 0 else 0
+
+    final_bar_text = []
+    final_bar_pos = []
+    final_scatter_text = []
+
+    for idx, row in df_plot.iterrows():
+        if row['Plot_Value'] > threshold:
+            final_bar_text.append(row['Bar_Text'])
+            final_bar_pos.append('inside')
+            final_scatter_text.append(row['Text_Rev'])
+        else:
+            final_bar_text.append("")
+            final_bar_pos.append('none')
+            combined = f"{row['Bar_Text']}   {row['Text_Rev']}"
+            final_scatter_text.append(combined)
+
+    fig_time = go.Figure()
+
+    fig_time.add_trace(go.Bar(
+        x=df_plot['Plot_Value'],
+        y=df_plot['Y_Label'],
+        orientation='h',
+        marker_color=df_plot['Color'],
+        text=final_bar_text,
+        textposition=final_bar_pos,
+        name='Days',
+        hoverinfo='y+text'
+    ))
+
+    fig_time.add_trace(go.Scatter(
+        x=df_plot['Plot_Value'],
+        y=df_plot['Y_Label'],
+        mode='text',
+        text=final_scatter_text,
+        textposition='middle right',
+        textfont=dict(color='#333333', size=13),
+        showlegend=False,
+        cliponaxis=False
+    ))
+
+    today_str = now.strftime('%Y-%m-%d')
+    fig_time.add_vline(x=0, line_width=2, line_dash="dash", line_color="#E74C3C")
+    fig_time.add_annotation(
+        x=0, y=1.02, yref='paper',
+        text=f"📍 本日 ({today_str})",
+        showarrow=False,
+        font=dict(color="#E74C3C", size=12, weight="bold"),
+        bgcolor="rgba(255, 255, 255, 0.8)",
+        bordercolor="#E74C3C"
+    )
+
+    range_max = max_val * 1.35 if max_val > 0 else 10
+
+    fig_time.update_layout(
+        title='🚨 專案到期日戰情室',
+        xaxis_title=f"距離預計訂單起始點 ({day_unit}) - 依 時間急迫性 > 預估營收 排序",
+        yaxis_title="專案 (負責人)",
+        xaxis=dict(
+            zeroline=True,
+            zerolinewidth=3,
+            zerolinecolor='#E74C3C',
+            range=[0, range_max]
+        ),
+        height=max(400, 100 + (len(df_plot) * 40)),
+        margin=dict(r=150, t=80)
+    )
+    return fig_time
+
+
+# --- [區塊 14] 週變動報告：兩版總表逐欄比對 ---
+def _diff_keys(df):
+    """[V76] 比對鍵：(專案, 同名序號)，同一專案多列時依出現順序對齊"""
+    name = df['專案'].astype(str).str.strip()
+    return pd.MultiIndex.from_arrays([name, name.groupby(name).cumcount()], names=['專案', '序號'])
+
+def _diff_normalize(series):
+    """[V76] 非數值欄位統一轉為去空白字串 (缺值為空字串) 以便比較"""
+    return series.where(series.notna(), '').astype(str).str.strip().replace({'nan': '', 'NaT': ''})
+
+def diff_tables(df_old, df_new):
+    """[V76] 以 專案 為鍵逐欄向量化比對兩版總表。
+    回傳 dict：added/removed (新增/移除列)、changes (長表：專案/欄位/舊值/新值/類型/位移天數)、
+    changed_mask (對應新版共同列的逐格異動旗標，供表格標色)、common_new (新版共同列)。"""
+    old = df_old.set_axis(_diff_keys(df_old), axis=0)
+    new = df_new.set_axis(_diff_keys(df_new), axis=0)
+    added = df_new[~new.index.isin(old.index)]
+    removed = df_old[~old.index.isin(new.index)]
+
+    common = new.index[new.index.isin(old.index)]
+    cols = [c for c in new.columns if c in old.columns and c != '專案']
+    a, b = old.loc[common, cols], new.loc[common, cols]
+    stage_cols = set(milestone_columns(cols).values())
+
+    masks, shift_days = {}, {}
+    for col in cols:
+        # 先以原值快速比對，只對不相等 (含缺值) 的儲存格做日期解析/字串正規化
+        cand = np.flatnonzero(~(a[col].to_numpy() == b[col].to_numpy()))
+        mask = np.zeros(len(common), dtype=bool)
+        sa, sb = a[col].iloc[cand].reset_index(drop=True), b[col].iloc[cand].reset_index(drop=True)
+        if col in stage_cols:
+            da, db = parse_milestone_series(sa), parse_milestone_series(sb)
+            mask[cand] = ((da != db) & ~(da.isna() & db.isna())).to_numpy()
+            shift_days[col] = np.full(len(common), np.nan)
+            shift_days[col][cand] = (db - da).dt.days.to_numpy()
+        elif pd.api.types.is_numeric_dtype(sa) and pd.api.types.is_numeric_dtype(sb):
+            # 數值欄位精確比對 (營收金額大時相對容差會吃掉小幅異動)，兩邊皆缺值視為相同
+            fa, fb = sa.to_numpy(dtype=float), sb.to_numpy(dtype=float)
+            mask[cand] = (fa != fb) & ~(np.isnan(fa) & np.isnan(fb))
+        else:
+            mask[cand] = (_diff_normalize(sa) != _diff_normalize(sb)).to_numpy()
+        masks[col] = mask
+    changed_mask = pd.DataFrame(masks, index=common, columns=cols)
+
+    r, c = np.nonzero(changed_mask.to_numpy())
+    changed_cols = np.asarray(cols, dtype=object)[c]
+    shift = np.full(len(r), np.nan)
+    for col, days in shift_days.items():
+        hit = changed_cols == col
+        shift[hit] = days[r[hit]]
+    change_type = np.select([changed_cols == '專案負責人', np.char.find(changed_cols.astype(str), '營收') >= 0,
+                             np.isin(changed_cols, list(stage_cols))], ['PM 異動', '營收', '里程碑'], '其他')
+    changes = pd.DataFrame({'專案': common.get_level_values('專案')[r], '欄位': changed_cols,
+                            '舊值': a.to_numpy()[r, c], '新值': b.to_numpy()[r, c],
+                            '類型': change_type, '位移天數': shift})
+    common_new = df_new[new.index.isin(old.index)]
+    return {'added': added, 'removed': removed, 'changes': changes,
+            'changed_mask': changed_mask.set_axis(common_new.index, axis=0), 'common_new': common_new}
+
+
+# --- [區塊 3] 專案研發全週期路徑圖 ---
+SEGMENT_HOVERTEMPLATE = "%{meta}<extra></extra>"
+
+# [V84] 時間軸粒度：週 (ISO 週)、月、季；各粒度以整數分桶序號表示，類別軸標籤由序號換算
+ROADMAP_GRANULARITIES = {'week': '週', 'month': '月', 'quarter': '季'}
+ROADMAP_TRACE_BUDGET = 400    # 泳道模式：連線 trace 上限 (超過時其餘泳道維持收合)
+ROADMAP_POINT_BUDGET = 20000  # 泳道模式：連線資料點上限
+UNASSIGNED_LANE = "未分類"
+
+def bin_ordinals(dates, granularity='week'):
+    """[V84] 日期 → 分桶序號 (週: 自 1969-12-29 週一起算的週數；月: 年×12+月；季: 年×4+季)，無效日期為 NaN"""
+    dates = pd.DatetimeIndex(pd.to_datetime(pd.Series(dates).to_numpy()))
+    if granularity == 'month':
+        ordinals = dates.year * 12 + dates.month - 1
+    elif granularity == 'quarter':
+        ordinals = dates.year * 4 + (dates.month - 1) // 3
+    else:
+        ordinals = (dates.to_numpy(dtype='datetime64[D]').astype(np.int64) + 3) // 7
+    return np.where(dates.isna(), np.nan, np.asarray(ordinals, dtype=float))
+
+def bin_label(ordinal, granularity='week'):
+    """[V84] 分桶序號 → 類別軸標籤 (2026-W05 / 2026-02 / 2026Q1，字串排序與序號排序一致)"""
+    ordinal = int(ordinal)
+    if granularity == 'month':
+        return f"{ordinal // 12}-{ordinal % 12 + 1:02d}"
+    if granularity == 'quarter':
+        return f"{ordinal // 4}Q{ordinal % 4 + 1}"
+    return get_week_str(pd.Timestamp('1969-12-29') + pd.Timedelta(weeks=ordinal))
+
+def lane_labels(values):
+    """[V84] 泳道標籤：去除前後空白，空白/缺值歸為「未分類」"""
+    values = pd.Series(values)
+    labels = values.astype(str).str.strip()
+    return labels.where(values.notna() & (labels != ''), UNASSIGNED_LANE)
+
+def roadmap_dates(df_roadmap_unique, granularity='week'):
+    """[V84] 各節點日期與分桶序號整欄一次算好 (不再逐列 to_datetime / 逐點算週次)，回傳 (date_frame, bin_frame)，列順序同輸入。
+    [V89] 欄位依階段設定順序；所有階段與里程碑日曆相同以 parse_milestone_series 解析 (皆接受 2026Q2 季別寫法)。"""
+    date_frame = pd.DataFrame(index=range(len(df_roadmap_unique)))
+    for key, col in milestone_columns(df_roadmap_unique.columns).items():
+        date_frame[key] = parse_milestone_series(df_roadmap_unique[col].reset_index(drop=True))
+    bin_frame = pd.DataFrame({key: bin_ordinals(date_frame[key], granularity) for key in date_frame.columns}, index=date_frame.index)
+    return date_frame, bin_frame
+
+def roadmap_order(df_roadmap_unique, today, granularity='week'):
+    """[V85] 路徑圖的專案順序 (與 roadmap_figure 相同：依最早節點的分桶排序，無日期者視為本期，同分桶維持原順序)，回傳列位置陣列"""
+    _, bin_frame = roadmap_dates(df_roadmap_unique, granularity)
+    min_bin = bin_frame.min(axis=1).fillna(bin_ordinals([today], granularity)[0])
+    return np.argsort(min_bin.to_numpy(), kind='stable')
+
+def roadmap_figure(df_roadmap_unique, today, show_schedules=False, granularity='week', lane_col=None, expanded_lanes=()):
+    """[V60] 專案研發全週期路徑圖 (類別時間軸)；df_roadmap_unique 為已依專案去重的資料，無可繪資料時回傳 None。
+    [V88] show_schedules 只決定節點日期標籤的初始狀態，之後由圖上按鈕切換。
+    [V84] granularity 為 'week'/'month'/'quarter'；lane_col 指定時依該欄分泳道，收合的泳道只畫彙總區間與節點數，
+    expanded_lanes 中的泳道在 trace/資料點預算內展開至專案層級。"""
+    plot_data = []
+
+
+    current_date = today
+    current_bin = int(bin_ordinals([current_date], granularity)[0])
+    current_week_str = bin_label(current_bin, granularity)
+    active_bins = {current_bin}
+
+    date_frame, bin_frame = roadmap_dates(df_roadmap_unique, granularity)
+    for key in bin_frame.columns:
+        active_bins.update(bin_frame[key].dropna().astype(int).tolist())
+    # [V89] 有日期資料的階段 (依設定順序)：節點、泳道節點數與圖例只列這些階段
+    stage_keys = [key for key in date_frame.columns if date_frame[key].notna().any()]
+
+    if lane_col and lane_col in df_roadmap_unique.columns:
+        lane_values = lane_labels(df_roadmap_unique[lane_col]).tolist()
+    else:
+        lane_col, lane_values = None, [None] * len(df_roadmap_unique)
+
+    for pos, (project, lane, date_row, bin_row) in enumerate(zip(df_roadmap_unique['專案'], lane_values,
+                                                               date_frame.to_dict('records'), bin_frame.to_dict('records'))):
+        dates = {key: dt for key, dt in date_row.items() if pd.notnull(dt)}
+        bins = {key: int(bin_row[key]) for key in dates}
+        if dates:
+            sorted_points = sorted(dates.items(), key=lambda x: x[1])
+            plot_data.append({
+                'pos': pos,
+                '專案': project,
+                'lane': lane,
+                'dates': dates,
+                'bins': bins,
+                'sorted_points': sorted_points,
+                'min_bin': bins[sorted_points[0][0]],
+                'has_data': True
+            })
+        else:
+            plot_data.append({
+                'pos': pos,
+                '專案': project,
+                'lane': lane,
+                'dates': {},
+                'bins': {},
+                'sorted_points': [],
+                'min_bin': current_bin,
+                'has_data': False
+            })
+
+    if not plot_data:
+        return None
+
+    sorted_bins = sorted(active_bins)
+    sorted_weeks = [bin_label(b, granularity) for b in sorted_bins]
+    bin_pos = {b: i for i, b in enumerate(sorted_bins)}
+    plot_data.sort(key=lambda x: x['min_bin'])
+
+    def segment_cost(p):
+        """連線的 (trace 數, 資料點數)"""
+        points = p['sorted_points']
+        n_points = sum(2 + max(bin_pos[p['bins'][b]] - bin_pos[p['bins'][a]] - 1, 0)
+                       for (a, _), (b, _) in zip(points[:-1], points[1:]))
+        return max(len(points) - 1, 0), n_points
+
+    # [V84] 泳道：依序展開指定泳道直到超過預算，其餘維持收合 (只顯示彙總列)
+    lanes, lane_order, skipped_lanes, detail_data = {}, [], [], plot_data
+    if lane_col:
+        for p in plot_data:
+            lanes.setdefault(p['lane'], []).append(p)
+        lane_order = sorted(lanes)
+        n_traces, n_points = 0, 0
+        expanded = set()
+        for lane in expanded_lanes:
+            if lane not in lanes or lane in expanded: continue
+            lane_traces, lane_points = (sum(c) for c in zip(*(segment_cost(p) for p in lanes[lane])))
+            if n_traces + lane_traces > ROADMAP_TRACE_BUDGET or n_points + lane_points > ROADMAP_POINT_BUDGET:
+                skipped_lanes.append(lane)
+                continue
+            expanded.add(lane)
+            n_traces += lane_traces
+            n_points += lane_points
+        detail_data = [p for p in plot_data if p['lane'] in expanded]
+
+        def lane_row(lane):
+            return f"{'▾' if lane in expanded else '▸'} {lane} ({len(lanes[lane])})"
+
+    fig = go.Figure()
+
+    def get_line_color(start_node, end_node):
+        # [V89] 連線顏色依終點階段的 line_color，未設定者為「其他路徑」
+        return STAGE_CONFIG.get(end_node, STAGE_DEFAULTS)['line_color'] or OTHER_PATH_COLOR
+
+    def bin_span(start_bin, end_bin):
+        """起訖分桶之間 (含) 的類別軸標籤"""
+        start_idx, end_idx = bin_pos[start_bin], bin_pos[end_bin]
+        return [sorted_weeks[start_idx]] + sorted_weeks[start_idx+1 : end_idx] + [sorted_weeks[end_idx]]
+
+    # [V84] 0. 泳道彙總列：整個泳道最早~最晚節點的區間
+    segment_traces = []
+    for lane in lane_order:
+        members = [p for p in lanes[lane] if p['has_data']]
+        if not members: continue
+        all_dates = [dt for p in members for dt in p['dates'].values()]
+        first_date, last_date = min(all_dates), max(all_dates)
+        stage_counts = " / ".join(f"{key} {sum(key in p['dates'] for p in members)}" for key in stage_keys)
+        x_trace = bin_span(min(p['min_bin'] for p in members), max(max(p['bins'].values()) for p in members))
+        hover_txt = (f"<b>{lane_col}: {lane}</b><br>📁 {len(lanes[lane])} 個專案 ({stage_counts})<br>"
+                     f"<span style='font-size:12px; color:gray'>({first_date.strftime('%Y.%m.%d')} - {last_date.strftime('%Y.%m.%d')})</span>")
+        segment_traces.append(go.Scatter(
+            x=x_trace, y=[lane_row(lane)] * len(x_trace), mode='lines+markers',
+            marker=dict(opacity=0, size=10),
+            line=dict(color='#34495E', width=10),
+            opacity=0.35, meta=hover_txt, hovertemplate=SEGMENT_HOVERTEMPLATE, showlegend=False
+        ))
+
+    # [V60] 1. 繪製連線
+    for p in detail_data:
+        if not p['has_data']: continue
+
+        points = p['sorted_points']
+        if len(points) < 2: continue
+
+        for i in range(len(points) - 1):
+            start_node, start_date = points[i]
+            end_node, end_date = points[i+1]
+            days_remaining = (end_date - current_date).days
+            weeks_remaining = days_remaining / 7.0
+            days_elapsed = (current_date - start_date).days
+            weeks_elapsed = days_elapsed / 7.0
+
+            hover_lines = [f"<b>{p['專案']} ({start_node} ➔ {end_node})</b>"]
+            if days_remaining > 0:
+                hover_lines.append(f"⏳ 距 {end_node} 剩下: <b>{weeks_remaining:.1f} 週 ({days_remaining} 天)</b>")
+            else:
+                hover_lines.append(f"✅ {end_node} 已完成/過期 ({abs(weeks_remaining):.1f} 週前)")
+
+            if start_node == 'NPDR' and days_elapsed > 0:
+                hover_lines.append(f"🚩 距 NPDR 開案已過: <b>{weeks_elapsed:.1f} 週 ({days_elapsed} 天)</b>")
+
+            hover_lines.append(f"<span style='font-size:12px; color:gray'>({start_date.strftime('%Y.%m.%d')} - {end_date.strftime('%Y.%m.%d')})</span>")
+            hover_txt = "<br>".join(hover_lines)
+
+            x_trace = bin_span(p['bins'][start_node], p['bins'][end_node])
+            y_trace = [p['專案']] * len(x_trace)
+            line_color = get_line_color(start_node, end_node)
+
+            # [V83] 整段共用的 hover 內容只存一份於 trace meta，由 hovertemplate 引用 (不再每週複製一份 HTML)
+            segment_traces.append(go.Scatter(
+                x=x_trace, y=y_trace, mode='lines+markers',
+                marker=dict(opacity=0, size=10),
+                line=dict(color=line_color, width=6),
+                meta=hover_txt, hovertemplate=SEGMENT_HOVERTEMPLATE, showlegend=False
+            ))
+    fig.add_traces(segment_traces)
+
+    # [V60] 2. 繪製標準節點
+    # [V89] 階段與樣式取自 MILESTONE_STAGES；每個階段整欄向量化取出節點 (新增階段不增加逐列迴圈)，
+    # hover 由 hovertemplate 套用 customdata (前綴, 週數, 天數)
+    detail_pos = np.array([p['pos'] for p in detail_data], dtype=int)
+    lane_pos = np.array([p['pos'] for p in plot_data if p['lane'] is not None], dtype=int)
+    projects = df_roadmap_unique['專案'].to_numpy()
+    week_labels = np.asarray(sorted_weeks, dtype=object)
+    sorted_bin_arr = np.asarray(sorted_bins)
+
+    label_traces = []
+    for key in stage_keys:
+        config = STAGE_CONFIG[key]
+        stage_dates, stage_bins = date_frame[key].to_numpy(), bin_frame[key].to_numpy()
+        rows = detail_pos[~np.isnat(stage_dates[detail_pos])]
+        if len(rows):
+            dts = date_frame[key].iloc[rows]
+            diff_days = (dts - current_date).dt.days.to_numpy()
+            customdata = np.empty((len(rows), 3), dtype=object)
+            customdata[:, 0] = np.where(diff_days > 0, '再', '已過')
+            customdata[:, 1] = np.abs(diff_days) / 7.0
+            customdata[:, 2] = np.abs(diff_days)
+            # [V88] 日期標籤一律帶在節點 trace 上，顯示與否只切換 mode (由圖上按鈕在瀏覽器端 restyle)
+            mode_setting = 'markers+text' if show_schedules else 'markers'
+            label_traces.append(len(fig.data))
+            fig.add_trace(go.Scatter(
+                x=week_labels[np.searchsorted(sorted_bin_arr, stage_bins[rows])].tolist(), y=projects[rows].tolist(), mode=mode_setting,
+                marker=dict(color=config['color'], symbol=config['symbol'], size=config['size'], line=dict(width=2, color='white')),
+                name=config['name'], legendgroup=key, text=dts.dt.strftime("%Y.%m.%d").tolist(), customdata=customdata.tolist(),
+                hovertemplate=f"<b>%{{y}} - {config['name']}</b><br>日期: %{{text}} (%{{customdata[0]}} %{{customdata[1]:.1f}} 週 / %{{customdata[2]}} 天)<extra></extra>",
+                textposition="bottom center"
+            ))
+
+        # [V84] 泳道彙總列：同一分桶的節點合併為一點 (點大小依專案數)；[V89] 以 groupby 一次彙總
+        lane_rows = lane_pos[~np.isnat(stage_dates[lane_pos])]
+        if len(lane_rows):
+            lane_frame = pd.DataFrame({'lane': np.asarray(lane_values, dtype=object)[lane_rows], 'bin': stage_bins[lane_rows].astype(int),
+                                       '專案': projects[lane_rows].astype(str)})
+            grouped = lane_frame.groupby(['lane', 'bin'], sort=True)['專案']
+            counts = grouped.size()
+            names = lane_frame[grouped.cumcount() < 10].groupby(['lane', 'bin'], sort=True)['專案'].agg("、".join)
+            lane_x = week_labels[np.searchsorted(sorted_bin_arr, counts.index.get_level_values('bin'))].tolist()
+            lane_y = [lane_row(lane) for lane in counts.index.get_level_values('lane')]
+            lane_hover = [f"<b>{lane} - {config['name']}</b><br>{x}: {n} 個專案<br>{name}" + (f" 等 {n} 個" if n > 10 else "")
+                          for (lane, _), x, n, name in zip(counts.index, lane_x, counts.tolist(), names.tolist())]
+            fig.add_trace(go.Scatter(
+                x=lane_x, y=lane_y, mode='markers',
+                marker=dict(color=config['color'], symbol=config['symbol'], size=np.minimum(8 + 2 * counts.to_numpy(), 28).tolist(), line=dict(width=2, color='white')),
+                name=config['name'], legendgroup=key, showlegend=not len(rows), hovertext=lane_hover, hoverinfo="text"
+            ))
+
+    # [V60] 3. 繪製 "規劃中" 沙漏
+    planning_x, planning_y, planning_hover = [], [], []
+    for p in detail_data:
+        if 'NPDR' not in p['dates']:
+            planning_x.append(current_week_str)
+            planning_y.append(p['專案'])
+            planning_hover.append(f"<b>{p['專案']}</b><br>⏳ 時程規劃中 (待提供)<br><span style='color:gray; font-size:0.8em'>請 PM 盡快補齊時程</span>")
+
+    if planning_x:
+        fig.add_trace(go.Scatter(
+            x=planning_x,
+            y=planning_y,
+            mode='markers',
+            marker=dict(color='#95A5A6', symbol='hourglass', size=12, line=dict(width=1, color='#7F8C8D')),
+            name='⏳ 規劃中 (待提供)',
+            hovertext=planning_hover,
+            hoverinfo="text"
+        ))
+
+    # [V89] 連線圖例：有日期資料的階段 (依設定順序)，加上其他路徑與規劃中
+    legend_items = [(STAGE_CONFIG[key]['legend'], STAGE_CONFIG[key]['line_color'] or STAGE_CONFIG[key]['color'])
+                    for key in stage_keys if STAGE_CONFIG[key]['legend']]
+    legend_items += [("⬜ 其他路徑", OTHER_PATH_COLOR), ("⏳ 規劃中", '#95A5A6')]
+    for name, color in legend_items:
+         fig.add_trace(go.Scatter(x=[None], y=[None], mode='lines', line=dict(color=color, width=6), name=name))
+
+    unit = ROADMAP_GRANULARITIES.get(granularity, '週')
+    fig.add_vline(x=current_week_str, line_width=2, line_dash="dash", line_color="#E74C3C", opacity=0.8)
+    fig.add_annotation(x=current_week_str, y=1.02, yref='paper', text=f"📍 本{unit} ({current_week_str})", showarrow=False, font=dict(color="#E74C3C", size=12, weight="bold"), bgcolor="rgba(255, 255, 255, 0.8)", bordercolor="#E74C3C")
+
+    current_week_idx = bin_pos[current_bin]
+    start_idx_view = max(0, current_week_idx - 1)
+    end_idx_view = len(sorted_weeks) - 1
+
+    yaxis = dict(title="專案", autorange="reversed")
+    if lane_col:
+        # 泳道模式：彙總列在上、展開的專案緊接於所屬泳道之下
+        row_order = []
+        for lane in lane_order:
+            row_order.append(lane_row(lane))
+            if lane in expanded:
+                row_order.extend(p['專案'] for p in lanes[lane])
+        yaxis.update(title=lane_col, type='category', categoryorder='array', categoryarray=row_order)
+        n_rows = len(row_order)
+    else:
+        n_rows = len(plot_data)
+
+    chart_height = max(400, 150 + (n_rows * 45))
+    fig.update_layout(xaxis=dict(title=f"時間軸 ({unit}次)", type='category', categoryorder='array', categoryarray=sorted_weeks, tickangle=-45, range=[start_idx_view - 0.5, end_idx_view + 0.5]), yaxis=yaxis, legend=dict(orientation="h", yanchor="bottom", y=1.05, xanchor="center", x=0.5), margin=dict(l=0, r=0, t=80, b=20), height=chart_height, hoverlabel=dict(bgcolor="white", font_size=14, font_family="Arial"))
+    if label_traces:
+        # [V88] 「顯示所有節點時程」為圖上的切換按鈕：只 restyle 節點 trace，不需 rerun 或重建路徑圖
+        fig.update_layout(updatemenus=[dict(
+            type='buttons', direction='left', showactive=True, active=0 if show_schedules else -1,
+            x=1, xanchor='right', y=1.02, yanchor='bottom', pad=dict(r=4, t=0),
+            buttons=[dict(label="👁️ 顯示所有節點時程", method='restyle',
+                          args=[{'mode': 'markers+text'}, label_traces], args2=[{'mode': 'markers'}, label_traces])]
+        )])
+    if skipped_lanes:
+        fig.update_layout(title=dict(text=f"⚠️ 超過顯示上限 ({ROADMAP_TRACE_BUDGET} 段 / {ROADMAP_POINT_BUDGET:,} 點)，以下泳道維持收合：{'、'.join(skipped_lanes)}",
+                                     font=dict(size=12, color='#E67E22')))
+    return fig
+
+
+# --- [V86] 圖表快取 ---
+class FigureCache:
+    """[V86] 圖表 LRU 快取：鍵為 (圖表, 資料版本, 篩選簽章, 匯率, 日期, 檢視選項...)，值為建好的 Figure (共用物件，取用端不可修改)。
+    筆數超過 max_entries 時淘汰最久未使用者 (只以筆數為上限，放入時不需序列化圖表估算大小)。"""
+
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        with self._lock:
+            fig = self._items.get(key)
+            if fig is None:
+                return None
+            self._items.move_to_end(key)
+            return fig
+
+    def put(self, key, fig):
+        with self._lock:
+            self._items[key] = fig
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+        return fig
+
+
+# --- [V82] 離線 HTML 報表 ---
+REPORT_FLOAT_DIGITS = 3
+
+REPORT_STYLE = """
+body { font-family: Arial, "Microsoft JhengHei", sans-serif; margin: 24px; color: #333; }
+section { margin-top: 28px; }
+.kpis { display: flex; gap: 16px; flex-wrap: wrap; }
+.kpis div { border: 1px solid #ddd; border-radius: 6px; padding: 12px 18px; }
+.kpis span { display: block; font-size: 0.85em; color: #777; }
+.kpis b { font-size: 1.6em; }
+.cols { display: grid; grid-template-columns: 1fr 1fr; gap: 16px; }
+.cards { display: grid; grid-template-columns: repeat(3, 1fr); }
+"""
+
+COLLAPSIBLE_TEXT_KEYS = ('text', 'hovertext')
+
+def _compact_value(obj, digits, key=None):
+    """浮點數四捨五入；text/hovertext 內容全部相同時 (例如重複的 hover 文字) 收斂為單一字串，plotly 會套用至所有點"""
+    if isinstance(obj, float):
+        return round(obj, digits)
+    if isinstance(obj, dict):
+        return {k: _compact_value(v, digits, k) for k, v in obj.items()}
+    if isinstance(obj, list):
+        if key in COLLAPSIBLE_TEXT_KEYS and len(obj) > 1 and isinstance(obj[0], str) and all(v == obj[0] for v in obj):
+            return obj[0]
+        return [_compact_value(v, digits) for v in obj]
+    return obj
+
+def compact_figure_json(fig, digits=REPORT_FLOAT_DIGITS):
+    """圖表精簡序列化：回傳 (data+layout dict, 樣板 JSON 字串)。樣板另外輸出以便多張圖共用同一份。"""
+    fig_dict = json.loads(pio.to_json(fig, validate=False, remove_uids=True))
+    layout = fig_dict.get('layout', {})
+    template = layout.pop('template', None)
+    spec = _compact_value({'data': fig_dict.get('data', []), 'layout': layout}, digits)
+    return spec, (script_json(template) if template else None)
+
+def script_json(obj):
+    """內嵌於 <script> 的 JSON：跳脫 </ 與 <!-- (儲存格內容不能提前結束 script 區塊)"""
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).replace('</', '<\\/').replace('<!--', '<\\!--')
+
+def html_report(title, subtitle, sections, plotlyjs=None):
+    """組合離線 HTML 報表。sections 為 [(標題, 內容), ...]，內容可為 HTML 字串或 plotly Figure。
+    plotly.js 與圖表樣板各只內嵌一次；每張圖僅輸出精簡 JSON。"""
+    templates, figure_specs, body = [], [], []
+    for heading, content in sections:
+        if isinstance(content, go.Figure):
+            spec, template = compact_figure_json(content)
+            if template is not None and template not in templates:
+                templates.append(template)
+            fig_id = f"fig-{len(figure_specs)}"
+            figure_specs.append((fig_id, spec, templates.index(template) if template is not None else None))
+            content = f"<div id='{fig_id}'></div>"
+        body.append(f"<section>{f'<h2>{html.escape(heading)}</h2>' if heading else ''}{content}</section>")
+
+    scripts = [f"var T = [{','.join(templates)}];"]
+    for fig_id, spec, template_idx in figure_specs:
+        spec_json = script_json(spec)
+        template_js = f"f.layout.template = T[{template_idx}]; " if template_idx is not None else ""
+        scripts.append(f"(function() {{ var f = {spec_json}; {template_js}"
+                       f"Plotly.newPlot('{fig_id}', f.data, f.layout, {{displaylogo: false, responsive: true}}); }})();")
+    return (f"<!DOCTYPE html>\n<html lang=\"zh-Hant\"><head><meta charset=\"utf-8\"><title>{html.escape(title)}</title>\n"
+            f"<script type=\"text/javascript\">{plotlyjs if plotlyjs is not None else get_plotlyjs()}</script>\n"
+            f"<style>{REPORT_STYLE}</style></head>\n"
+            f"<body><h1>{html.escape(title)}</h1><p>{html.escape(subtitle)}</p>\n" + "\n".join(body) +
+            f"\n<script type=\"text/javascript\">\n" + "\n".join(scripts) + "\n</script>\n</body></html>\n")
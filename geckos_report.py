@@ -0,0 +1,172 @@
+"""Geckos 批次報表產生器 (Headless，不需啟動 Streamlit)
+
+[V81] 總表只讀取一次、里程碑日曆只建立一次，再以 process pool 平行輸出每位 PM / 每個 BU 的獨立 HTML 報表
+(本週/本月提醒、下一階段卡片、路徑圖、訂單倒數)，並產生 index.html 目錄。
+
+用法：
+    python geckos_report.py 專案總表.xlsx -o reports
+    python geckos_report.py 專案總表.csv -o reports --by pm --workers 8 --today 2026-10-19 --rate 4.4
+"""
+import argparse
+import hashlib
+import html
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from plotly.offline import get_plotlyjs
+
+from geckos_core import (
+    alert_cards, alerts_html, countdown_figure, html_report, milestone_calendar, order_countdown_table,
+    pm_cards, read_project_table, resolve_schema, roadmap_figure,
+)
+
+BU_COL_CANDIDATES = ['BU', '事業單位', '事業部', '產品類別', '專案類別']
+UNASSIGNED_PM = "未指派 (Unassigned)"
+
+# 每個 worker 於初始化時接收一次共用資料 (避免每個任務重複序列化總表)
+_WORKER_STATE = {}
+
+
+def _init_worker(df, cal, next_stages, config):
+    _WORKER_STATE.update(df=df, cal=cal, next_stages=next_stages, config=config)
+
+
+def resolve_today(value=None):
+    """報表基準日：--today 參數、環境變數 GECKOS_TODAY，否則為實際日期 (與儀表板 get_today 相同順序)"""
+    for candidate in (value, os.environ.get('GECKOS_TODAY')):
+        if candidate:
+            ts = pd.to_datetime(candidate, errors='coerce')
+            if pd.notnull(ts):
+                return ts.normalize()
+    return pd.Timestamp.now().normalize()
+
+
+def safe_file_name(name):
+    return re.sub(r'[\\/:*?"<>|\s]+', '_', str(name)).strip('_') or 'unnamed'
+
+
+def unique_file_name(prefix, name, used):
+    """報表檔名 (不分大小寫不重複)：不同名稱轉成相同檔名時 (例如 C/D 與 C_D)，後者加上名稱的短雜湊，仍重複時再加序號"""
+    base = f"{prefix}_{safe_file_name(name)}"
+    file_name = f"{base}.html"
+    if file_name.casefold() in used:
+        base = f"{base}_{hashlib.md5(str(name).encode('utf-8')).hexdigest()[:6]}"
+        file_name, n = f"{base}.html", 2
+        while file_name.casefold() in used:
+            file_name, n = f"{base}_{n}.html", n + 1
+    used.add(file_name.casefold())
+    return file_name
+
+def report_targets(df, group_by, bu_col):
+    """報表清單：[(類型, 名稱, 檔名, row_id 陣列), ...]，檔名不重複"""
+    targets, used = [], set()
+    if 'pm' in group_by and '專案負責人' in df.columns:
+        pm = df['專案負責人'].where(df['專案負責人'].astype(str).str.strip() != '', UNASSIGNED_PM).fillna(UNASSIGNED_PM)
+        for name, idx in pm.groupby(pm).groups.items():
+            targets.append(('PM', name, unique_file_name('PM', name, used), idx.to_numpy()))
+    if 'bu' in group_by and bu_col:
+        bu = df[bu_col].fillna('未分類').astype(str)
+        for name, idx in bu.groupby(bu).groups.items():
+            targets.append(('BU', name, unique_file_name('BU', name, used), idx.to_numpy()))
+    return targets
+
+
+def render_report(task):
+    """單一報表 (於 worker 中執行)：回傳 (類型, 名稱, 檔名, 專案數, 營收)"""
+    kind, name, file_name, row_ids = task
+    df, cal, next_stages, config = (_WORKER_STATE[k] for k in ('df', 'cal', 'next_stages', 'config'))
+    today, rmb_rate, col_twd, col_rmb = config['today'], config['rmb_rate'], config['col_twd'], config['col_rmb']
+    order_col = config['order_col']
+
+    df_sub = df.loc[row_ids]
+    df_unique = df_sub.drop_duplicates(subset=['專案'])
+    revenue = df_sub[col_twd].fillna(0).sum() + (df_sub[col_rmb].fillna(0).sum() * rmb_rate if col_rmb else 0)
+
+    kpi_html = (f"<div class='kpis'><div><span>📊 專案數</span><b>{len(df_unique)}</b></div>"
+                f"<div><span>💰 預估營收 (TWD，匯率 {rmb_rate})</span><b>{revenue:,.0f}</b></div></div>")
+    sections = [(None, kpi_html)]
+
+    week_items, month_items = alert_cards(df_unique, cal)
+    sections.append(("🔔 本週/本月重點提醒 (Milestone Alerts)", alerts_html(week_items, month_items)))
+
+    cards = pm_cards(df_unique, next_stages)
+    sections.append(("🔜 下一階段 (Next Stages)", f"<div class='cards'>{''.join(cards)}</div>"))
+
+    fig_roadmap = roadmap_figure(df_unique, today)
+    sections.append(("🚀 專案研發全週期路徑圖 (Roadmap)", fig_roadmap if fig_roadmap is not None else "<p>無有效時間資料</p>"))
+
+    fig_time = None
+    if order_col in df_sub.columns:
+        df_final, twd_col_sum, rmb_col_sum = order_countdown_table(df_sub, cal, col_twd, col_rmb, order_col)
+        if not df_final.empty:
+            fig_time = countdown_figure(df_final, twd_col_sum, rmb_col_sum, rmb_rate, today)
+    sections.append(("⏳ 預計訂單即將到期 Top 10 (Countdown to Order)", fig_time if fig_time is not None else "<p>🎉 目前沒有即將到期的訂單</p>"))
+
+    page = html_report(f"Geckos {kind} 報表 - {name}", f"報表基準日：{today.strftime('%Y-%m-%d')}", sections, config['plotlyjs'])
+    with open(os.path.join(config['out_dir'], file_name), 'w', encoding='utf-8') as f:
+        f.write(page)
+    return kind, name, file_name, len(df_unique), revenue
+
+
+def write_index(out_dir, results, today):
+    rows = "".join(f"<tr><td>{kind}</td><td><a href='{html.escape(file_name)}'>{html.escape(str(name))}</a></td>"
+                   f"<td>{n_projects}</td><td>{revenue:,.0f}</td></tr>"
+                   for kind, name, file_name, n_projects, revenue in results)
+    with open(os.path.join(out_dir, 'index.html'), 'w', encoding='utf-8') as f:
+        f.write(f"<!DOCTYPE html><html lang='zh-Hant'><head><meta charset='utf-8'><title>Geckos 報表目錄</title></head>"
+                f"<body><h1>Geckos 報表目錄 ({today.strftime('%Y-%m-%d')})</h1>"
+                f"<table border='1' cellpadding='6'><tr><th>類型</th><th>名稱</th><th>專案數</th><th>預估營收 (TWD)</th></tr>{rows}</table>"
+                f"</body></html>")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Geckos 批次報表：每位 PM / 每個 BU 一份獨立 HTML 報表")
+    parser.add_argument('source', help="專案總表 (Excel/CSV)")
+    parser.add_argument('-o', '--out-dir', default='reports', help="輸出資料夾 (預設 reports)")
+    parser.add_argument('--by', nargs='+', choices=['pm', 'bu'], default=['pm', 'bu'], help="報表分組 (預設 pm bu)")
+    parser.add_argument('--bu-col', default=None, help=f"BU 欄位 (預設依序偵測 {', '.join(BU_COL_CANDIDATES)})")
+    parser.add_argument('--today', default=None, help="報表基準日 YYYY-MM-DD (預設今天或 GECKOS_TODAY)")
+    parser.add_argument('--rate', type=float, default=4.4, help="RMB 換 TWD 匯率 (預設 4.4)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="平行處理數 (預設 CPU 核心數)")
+    args = parser.parse_args(argv)
+
+    t_start = time.perf_counter()
+    with open(args.source, 'rb') as f:
+        df = read_project_table(f)
+    schema = resolve_schema(df)
+    col_twd, col_rmb = schema['col_twd'], schema['col_rmb']
+    if not col_twd:
+        parser.error("找不到「預估營收(TWD)」相關欄位，請檢查 Excel 表頭。")
+    for issue in schema['issues']:
+        print(f"⚠️ {issue}")
+    bu_col = args.bu_col or next((c for c in BU_COL_CANDIDATES if c in df.columns), None)
+
+    today = resolve_today(args.today)
+    cal, next_stages = milestone_calendar(df, today)
+    os.makedirs(args.out_dir, exist_ok=True)
+    config = {'today': today, 'rmb_rate': args.rate, 'col_twd': col_twd, 'col_rmb': col_rmb, 'order_col': schema['stages'].get('Order'),
+              'out_dir': args.out_dir, 'plotlyjs': get_plotlyjs()}
+    targets = report_targets(df, args.by, bu_col)
+    if len({file_name.casefold() for _, _, file_name, _ in targets}) != len(targets):
+        parser.error("報表檔名重複，請檢查 PM/BU 名稱")
+    t_prepared = time.perf_counter()
+
+    init_args = (df, cal, next_stages, config)
+    if args.workers and args.workers > 1 and len(targets) > 1:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=init_args) as pool:
+            results = list(pool.map(render_report, targets))
+    else:
+        _init_worker(*init_args)
+        results = [render_report(task) for task in targets]
+    write_index(args.out_dir, results, today)
+
+    t_done = time.perf_counter()
+    print(f"✅ 已輸出 {len(results)} 份報表至 {args.out_dir} "
+          f"(讀檔/前處理 {t_prepared - t_start:.2f}s，產生報表 {t_done - t_prepared:.2f}s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+
+from geckos_core import diff_tables
+
+
+def _table(twd, rmb):
+    return pd.DataFrame({
+        '專案': ['P001', 'P002', 'P003'],
+        '專案負責人': ['王小明', '李大華', '陳美玲'],
+        '預估營收(TWD)': twd,
+        '預估營收(RMB)': rmb,
+    })
+
+
+def test_small_change_on_large_revenue_is_reported():
+    old = _table([260_000.0, 50_000_000.0, 1_000.0], [np.nan, 10.0, 5.0])
+    new = _table([260_001.0, 50_000_400.0, 1_000.0], [np.nan, 10.0, 5.0])
+
+    changes = diff_tables(old, new)['changes']
+
+    assert list(changes['專案']) == ['P001', 'P002']
+    assert set(changes['欄位']) == {'預估營收(TWD)'}
+    assert set(changes['類型']) == {'營收'}
+    assert list(changes['新值']) == [260_001.0, 50_000_400.0]
+
+
+def test_missing_on_both_sides_is_not_a_change():
+    old = _table([1.0, 2.0, 3.0], [np.nan, np.nan, 4.0])
+    new = _table([1.0, 2.0, 3.0], [np.nan, 7.0, 4.0])
+
+    result = diff_tables(old, new)
+
+    assert list(result['changes']['專案']) == ['P002']
+    assert result['changed_mask']['預估營收(RMB)'].tolist() == [False, True, False]
+    assert result['added'].empty and result['removed'].empty